@@ -0,0 +1,91 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from event_log import LOG_DIR, setup_logging, get_logger
+from job_queue import JobQueue
+
+load_dotenv()
+
+# ----------------------------
+# Воркеры анализа: отдельные процессы, забирающие задания из очереди
+# ----------------------------
+logger = get_logger("analysis_worker")
+WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+HEARTBEAT_INTERVAL = 30
+
+
+def _heartbeat(queue: JobQueue, job_id: str, worker: str, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        queue.heartbeat(job_id, worker)
+
+
+def worker_loop(worker: str, poll_interval: float = JOB_POLL_INTERVAL):
+    """Цикл одного воркера: забрать задание, выполнить анализ, сохранить результат"""
+    # у каждого процесса свой файл журнала: ротация одного файла из нескольких процессов небезопасна
+    setup_logging(os.path.join(LOG_DIR, f"events-{worker}.jsonl"))
+    # тяжелый импорт (crewai, агенты) — только в процессе воркера
+    from main import analyze_bank_reviews, shared_memory
+
+    queue = JobQueue()
+    logger.info("worker started", extra={"worker": worker})
+    while True:
+        queue.requeue_stale()
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info("job claimed", extra={"job_id": job["id"], "attempt": job["attempts"]})
+        # память процесса общая для всех заданий: инсайты одного чата не должны попасть в анализ другого
+        shared_memory.clear()
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(queue, job["id"], worker, stop), daemon=True).start()
+        try:
+            # run_id = id задания: повтор после сбоя воркера продолжит анализ с контрольной точки
+            report = analyze_bank_reviews(job["question"], per_branch=job["per_branch"], run_id=job["id"])
+            if queue.complete(job["id"], worker, report, shared_memory.get_context()):
+                logger.info("job done", extra={"job_id": job["id"]})
+            else:
+                logger.warning("job reclaimed by another worker, result discarded", extra={"job_id": job["id"]})
+        except Exception as e:
+            logger.exception("job failed", extra={"job_id": job["id"]})
+            if not queue.fail(job["id"], worker, str(e)):
+                logger.warning("job reclaimed by another worker, error discarded", extra={"job_id": job["id"]})
+        finally:
+            stop.set()
+
+
+def run_workers(count: int = WORKERS):
+    """Запускает count процессов-воркеров и перезапускает упавшие.
+
+    Для масштабирования достаточно увеличить count или запустить еще
+    экземпляры analysis_worker.py: все они работают с общей очередью state/jobs.db
+    """
+    setup_logging()
+    context = multiprocessing.get_context("spawn")
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes = {}
+    while True:
+        for i in range(count):
+            process = processes.get(i)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.warning("worker exited, restarting", extra={"worker": i, "exitcode": process.exitcode})
+                process = context.Process(target=worker_loop, args=(f"{prefix}-{i}",), daemon=True)
+                process.start()
+                processes[i] = process
+        time.sleep(5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пул процессов, выполняющих задания анализа из очереди")
+    parser.add_argument("-n", "--workers", type=int, default=WORKERS, help="Число процессов-воркеров")
+    args = parser.parse_args()
+    print(f"🛠 Воркеров: {args.workers}")
+    run_workers(args.workers)
@@ -0,0 +1,171 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import snowballstemmer
+
+from data_store import data_version, load_companies
+from geo_index import branches_for_question
+
+# ----------------------------
+# Кеш ответов на похожие вопросы
+# ----------------------------
+ANSWER_CACHE_PATH = os.path.join("state", "answer_cache.json")
+# Минимальная косинусная близость вопросов для выдачи ответа из кеша. Подобрана по парам
+# перефразировок и разных вопросов из tests/test_answer_cache.py: перефразировки дают
+# не меньше 0.85, разные вопросы — не больше 0.55
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.7"))
+# Не больше стольких ответов в кеше: при переполнении вытесняются давно не выдававшиеся
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "200"))
+# Ответы старше этого срока не выдаются, даже если данные не менялись
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+_STEMMER = snowballstemmer.stemmer("russian")
+# Слова, которые есть почти в любом вопросе аналитика: на близость не влияют
+GENERIC_WORDS = [
+    "найдите", "найти", "проанализируйте", "проанализировать", "покажите", "какие", "каких", "какое",
+    "отделение", "отделения", "отделениях", "отделениям", "клиентских", "клиентов", "комментариев",
+    "комментарии", "данные", "данных", "отзывы", "отзывов", "банка", "банк",
+]
+_GENERIC_STEMS = set(_STEMMER.stemWords(GENERIC_WORDS))
+# Слова, меняющие смысл вопроса на противоположный («отделения без инцидентов»);
+# короткие слова в _terms не попадают, поэтому сравниваются отдельно
+NEGATION_WORDS = {"не", "нет", "без", "кроме", "ни", "исключая", "отсутствуют", "отсутствует"}
+
+
+def _terms(text: str) -> Counter:
+    """Основы слов вопроса (стемминг Snowball): порядок слов и окончания не влияют на близость"""
+    words = [word for word in re.findall(r"\w+", text.lower().replace("ё", "е")) if len(word) > 2]
+    return Counter(stem for stem in _STEMMER.stemWords(words) if stem not in _GENERIC_STEMS)
+
+
+def question_scope(question: str) -> Dict:
+    """Что ограничивает ответ помимо слов вопроса: район, названные отделения и отрицания.
+
+    Вопросы с разной областью не считаются похожими, даже если почти совпадают по словам
+    """
+    text = question.lower().replace("ё", "е")
+    region = branches_for_question(question)
+    named = [
+        org_id for org_id, company in load_companies().items()
+        if re.search(rf"(?<!\w){re.escape(company['name'].lower())}(?!\w)", text)
+        or re.search(rf"(?<!\w){org_id}(?!\w)", text)
+    ]
+    return {
+        "region": region[0] if region is not None else None,
+        "branches": sorted(named, key=str),
+        "negations": sorted(NEGATION_WORDS & set(re.findall(r"\w+", text))),
+    }
+
+
+def _tfidf(counts: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+    vector = {term: (1 + math.log(tf)) * idf.get(term, 1.0) for term, tf in counts.items()}
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {term: v / norm for term, v in vector.items()}
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(term, 0.0) for term, v in a.items())
+
+
+class AnswerCache:
+    """Вопрос -> итоговый отчет; записи другой версии данных и старше TTL не выдаются.
+
+    Порядок записей — порядок использования (LRU): выданный ответ переносится в конец,
+    при переполнении удаляются первые. Файл переписывается только при сохранении ответа
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, threshold: float = SIMILARITY_THRESHOLD,
+                 size: int = ANSWER_CACHE_SIZE, ttl: int = ANSWER_CACHE_TTL):
+        self.path = path
+        self.threshold = threshold
+        self.size = size
+        self.ttl = ttl
+        self.entries: List[Dict] = []
+        # основы слов сохраненных вопросов считаются один раз
+        self._terms: Dict[str, Counter] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self, version: str) -> bool:
+        """Убирает из памяти ответы на устаревших данных и старше TTL; True, если что-то удалено"""
+        oldest = (datetime.now() - timedelta(seconds=self.ttl)).isoformat(timespec="seconds")
+        actual = [entry for entry in self.entries if entry["data_version"] == version and entry["created"] >= oldest]
+        if len(actual) == len(self.entries):
+            return False
+        self.entries = actual
+        self._forget_removed()
+        return True
+
+    def _forget_removed(self):
+        questions = {entry["question"] for entry in self.entries}
+        self._terms = {question: terms for question, terms in self._terms.items() if question in questions}
+
+    def _question_terms(self, question: str) -> Counter:
+        if question not in self._terms:
+            self._terms[question] = _terms(question)
+        return self._terms[question]
+
+    @staticmethod
+    def _scope(entry: Dict) -> Dict:
+        # записи, сохраненные до появления области, получают ее по тексту вопроса
+        if "scope" not in entry:
+            entry["scope"] = question_scope(entry["question"])
+        return entry["scope"]
+
+    def lookup(self, question: str) -> Optional[Dict]:
+        """Самый похожий вопрос из кеша (с полем similarity) или None"""
+        self._expire(data_version())
+        if not self.entries:
+            return None
+
+        # IDF по вопросам в кеше: общие для всех вопросов слова почти не влияют на близость
+        documents = [self._question_terms(entry["question"]) for entry in self.entries]
+        df = Counter(term for doc in documents for term in doc)
+        idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in df.items()}
+
+        query = _tfidf(_terms(question), idf)
+        scope = question_scope(question)
+        # записи с другой областью вопроса не рассматриваются
+        scores = [
+            _cosine(query, _tfidf(doc, idf)) if self._scope(entry) == scope else 0.0
+            for entry, doc in zip(self.entries, documents)
+        ]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        if scores[best] < self.threshold:
+            return None
+        entry = self.entries.pop(best)
+        self.entries.append(entry)
+        return {**entry, "similarity": scores[best]}
+
+    def store(self, question: str, report: str):
+        version = data_version()
+        self._expire(version)
+        # повторный вопрос заменяет старый ответ
+        self.entries = [entry for entry in self.entries if entry["question"] != question]
+        self.entries.append({
+            "question": question,
+            "report": report,
+            "scope": question_scope(question),
+            "data_version": version,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        })
+        del self.entries[:-self.size]
+        self._forget_removed()
+        self._save()
+
+
+answer_cache = AnswerCache()
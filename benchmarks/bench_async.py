@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import analyze_bank_reviews, analyze_bank_reviews_async
+
+# ----------------------------
+# Одновременные анализы в одном процессе: async-пайплайн и синхронный в потоках
+# ----------------------------
+# Это не замер ускорения от async: kickoff_async выполняет kickoff crew в потоке, поэтому
+# основная работа (crew) в обоих режимах идет в потоках. Без потоков выполняются только
+# прямые вызовы LLM (план), и разница в результатах ожидаемо невелика. Замер показывает,
+# что async-вариант (ANALYSIS_BACKEND=inline) не хуже синхронного при той же нагрузке
+QUESTIONS = [
+    "Проанализируйте данные из клиентских комментариев и найдите инциденты операционного риска в отделениях",
+    "Найдите случаи навязывания услуг и подключения подписок без ведома клиента",
+    "Какие отделения получают больше всего жалоб на скрытые комиссии",
+    "Сравните отделения по качеству обслуживания и рискам поведения",
+]
+
+
+async def run_threaded(questions):
+    # синхронный пайплайн, обернутый в потоки, как его вызывал бот
+    return await asyncio.gather(*(asyncio.to_thread(analyze_bank_reviews, q) for q in questions))
+
+
+async def run_async(questions):
+    return await asyncio.gather(*(analyze_bank_reviews_async(q) for q in questions))
+
+
+def measure(name, runner, questions):
+    started = time.perf_counter()
+    results = asyncio.run(runner(questions))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if not r)
+    return {
+        "mode": name,
+        "analyses": len(questions),
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "analyses_per_minute": round(len(questions) * 60 / elapsed, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Одновременные анализы в процессе: async-пайплайн и синхронный в потоках")
+    parser.add_argument("-n", "--analyses", type=int, default=4, help="Число одновременных анализов")
+    args = parser.parse_args()
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.analyses)]
+    for name, runner in (("threaded_sync", run_threaded), ("async", run_async)):
+        print(json.dumps(measure(name, runner, questions), ensure_ascii=False))
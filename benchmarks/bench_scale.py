@@ -0,0 +1,218 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from data_store import (
+    load_reviews, load_companies, group_reviews_by_branch, scoped_reviews,
+    set_review_scope, reset_review_scope, review_snippet, clear_cache,
+)
+from geo_index import GeoIndex, REGIONS
+from context_budget import ContextBudget, fit_items, PROMPT_BUDGET_TOKENS
+from complaint_themes import ThemeIndex
+from review_trends import ReviewSeries, compute_trends
+from risk_classifier import RiskClassifier
+from synthetic_data import write_dataset
+
+# ----------------------------
+# Замеры локальных этапов пайплайна на синтетических данных
+# ----------------------------
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "bench_scale.jsonl")
+DEFAULT_SCALES = [1000, 10000, 100000]
+SEARCH_QUERY = "подключ"
+
+
+class Dataset:
+    def __init__(self, paths: Dict[str, str]):
+        self.reviews_path = paths["reviews"]
+        self.companies_path = paths["companies"]
+        self.labels_path = paths["labels"]
+        self.reviews: List[Dict] = []
+        self.companies: Dict[int, Dict] = {}
+        self.groups: Dict[int, List[Dict]] = {}
+
+
+def stage_ingestion(ds: Dataset):
+    # холодная загрузка: разбор JSON и присвоение id отзывам
+    clear_cache()
+    ds.reviews = load_reviews(ds.reviews_path)
+    ds.companies = load_companies(ds.companies_path)
+
+
+def stage_aggregation(ds: Dataset):
+    ds.groups = group_reviews_by_branch(ds.reviews)
+    stats = {}
+    for org_id, reviews in ds.groups.items():
+        tones = Counter(review.get("tone") for review in reviews)
+        stats[org_id] = {
+            "count": len(reviews),
+            "mean_rate": sum(review.get("rate", 0) for review in reviews) / len(reviews),
+            "negative": tones.get("Негативный", 0),
+        }
+    return stats
+
+
+def stage_filtering(ds: Dataset):
+    # отбор по району (геоиндекс + ограничение отзывов) и текстовый поиск как в search_reviews
+    _, (_, lat, lon, radius_km) = REGIONS[0]
+    branch_ids = [branch["id"] for branch in GeoIndex(ds.companies).within_radius(lat, lon, radius_km)]
+    token = set_review_scope(branch_ids)
+    try:
+        scoped = scoped_reviews(ds.reviews_path)
+    finally:
+        reset_review_scope(token)
+    found = [review_snippet(review, SEARCH_QUERY) for review in ds.reviews if SEARCH_QUERY in review["comment"].lower()]
+    return scoped, found
+
+
+def stage_clustering(ds: Dataset):
+    # полная кластеризация жалоб в темы (без сохранения на диск)
+    themes = ThemeIndex(path=os.path.join(DATA_DIR, "themes.json"))
+    themes.rebuild(ds.reviews)
+    return themes.themes()
+
+
+def stage_trends(ds: Dataset):
+    # недельные ряды по всем отделениям и поиск аномалий
+    return compute_trends(ReviewSeries(ds.reviews), "week")
+
+
+def stage_classification(ds: Dataset):
+    # обучение на 20% истинных меток (как на разметке LLM) и классификация остальных отзывов
+    with open(ds.labels_path, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    train = len(ds.reviews) // 5
+    classifier = RiskClassifier()
+    classifier.train(
+        {review["id"]: label for review, label in zip(ds.reviews[:train], labels)},
+        {review["id"]: review["comment"] for review in ds.reviews[:train]},
+    )
+    return classifier.split(ds.reviews[train:])
+
+
+def stage_prompt_assembly(ds: Dataset):
+    # ответ access_comments и описание задачи по самому крупному отделению
+    fit_items(ds.reviews)
+    org_id = max(ds.groups, key=lambda k: len(ds.groups[k]))
+    reviews_json = json.dumps(fit_items(ds.groups[org_id], PROMPT_BUDGET_TOKENS // 2), ensure_ascii=False)
+    return ContextBudget("bench").add("description", "Проанализируйте отзывы отделения", required=True).add(
+        "reviews", reviews_json, priority=1
+    ).assemble()
+
+
+# Этапы выполняются по порядку: следующие используют результаты предыдущих
+STAGES: List[tuple] = [
+    ("ingestion", stage_ingestion),
+    ("aggregation", stage_aggregation),
+    ("filtering", stage_filtering),
+    ("clustering", stage_clustering),
+    ("trends", stage_trends),
+    ("classification", stage_classification),
+    ("prompt_assembly", stage_prompt_assembly),
+]
+
+
+def measure(fn: Callable, ds: Dataset, trace_memory: bool) -> Dict:
+    """Время (без трассировки памяти) и, при trace_memory, пик выделенной памяти во втором прогоне"""
+    gc.collect()
+    started_wall, started_cpu = time.perf_counter(), time.process_time()
+    fn(ds)
+    result = {
+        "seconds": round(time.perf_counter() - started_wall, 4),
+        "cpu_seconds": round(time.process_time() - started_cpu, 4),
+    }
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(ds)
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    return result
+
+
+def dataset_for(scale: int, seed: int) -> Dataset:
+    out_dir = os.path.join(DATA_DIR, f"{scale}_{seed}")
+    paths = {name: os.path.join(out_dir, f"{name}.json") for name in ("reviews", "companies", "labels")}
+    if not all(os.path.exists(path) for path in paths.values()):
+        print(f"генерация {scale} отзывов -> {out_dir}")
+        paths = write_dataset(out_dir, scale, seed=seed)
+    return Dataset(paths)
+
+
+def git_commit() -> str:
+    """Коммит, код которого измеряется; с суффиксом -dirty, если код изменен после коммита.
+
+    Сам файл результатов не учитывается: замеры дописываются в него перед коммитом
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+        root = os.path.dirname(BENCH_DIR)
+        changed = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no", "--", ".", f":!{os.path.relpath(RESULTS_PATH, root)}"],
+            cwd=root, text=True,
+        ).strip()
+        return commit + "-dirty" if changed else commit
+    except Exception:
+        return ""
+
+
+def previous_results(path: str = RESULTS_PATH) -> Dict[tuple, Dict]:
+    """Последний сохраненный результат по (масштаб, этап) — для сравнения с текущим"""
+    latest = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    latest[(row["scale"], row["stage"])] = row
+    return latest
+
+
+def run(scales: List[int], seed: int = 42, trace_memory: bool = True, save: bool = True) -> List[Dict]:
+    previous = previous_results()
+    meta = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+    }
+    rows = []
+    for scale in scales:
+        ds = dataset_for(scale, seed)
+        for stage, fn in STAGES:
+            row = {**meta, "scale": scale, "stage": stage, **measure(fn, ds, trace_memory)}
+            before = previous.get((scale, stage))
+            change = ""
+            if before and before["seconds"]:
+                change = f" ({(row['seconds'] / before['seconds'] - 1) * 100:+.0f}% к {before['commit'] or before['timestamp']})"
+            memory = f", {row['peak_mb']} МБ" if "peak_mb" in row else ""
+            print(f"{scale:>9} {stage:<16} {row['seconds']:>9.3f} c{memory}{change}")
+            rows.append(row)
+    if save:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры этапов пайплайна на 1k–1M синтетических отзывов")
+    parser.add_argument("-s", "--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Число отзывов, например: 1000 10000 100000 1000000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="Не измерять пик памяти (быстрее)")
+    parser.add_argument("--no-save", action="store_true", help=f"Не дописывать результаты в {RESULTS_PATH}")
+    args = parser.parse_args()
+    run(args.scales, args.seed, trace_memory=not args.no_memory, save=not args.no_save)
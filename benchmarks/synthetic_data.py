@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ----------------------------
+# Генератор синтетических отзывов и отделений
+# ----------------------------
+# Схема совпадает с data/reviews3.json и data/companies3.json.
+# Негативные отзывы строятся вокруг категорий риска поведения из data/wrongPractices.txt
+CATEGORIES = [
+    "Недобросовестное информирование",
+    "Подмена продукта",
+    "Продажа неподходящих продуктов",
+    "Навязывание и связанная продажа",
+    "Подключение продукта без ведома клиента",
+]
+NO_CATEGORY = "Нет нарушения"
+
+PRODUCTS = ["дебетовую карту", "кредитную карту", "вклад", "накопительный счет", "кредит", "ипотеку", "страховку"]
+SERVICES = ["СберПрайм", "Сберзвук", "ОККО", "СберМаркет", "страхование жизни", "платное СМС-информирование"]
+FEES = ["комиссию за обслуживание", "плату за перевод", "комиссию за снятие наличных", "ежемесячную плату"]
+
+CATEGORY_TEMPLATES: Dict[str, List[str]] = {
+    CATEGORIES[0]: [
+        "Сотрудник уверял, что {product} без комиссий, а потом с меня списали {fee}.",
+        "Консультант не рассказал про {fee}, о ней я узнал только из выписки.",
+        "В отделении дали неверную информацию об условиях расторжения договора на {product}.",
+        "Менеджер сказал, что ставка фиксированная, но в договоре оказалось другое.",
+    ],
+    CATEGORIES[1]: [
+        "Пришел открыть {product}, а мне оформили инвестиционное страхование под видом вклада.",
+        "Хотела {product}, сотрудник открыл вклад, сказав что это то же самое.",
+        "Вместо {product} оформили совсем другой продукт, заметил только дома.",
+    ],
+    CATEGORIES[2]: [
+        "Пенсионеру оформили {product} с высоким риском, хотя ему это совершенно не подходит.",
+        "Мне предложили {service}, хотя сервис не работает в моем городе.",
+        "Уговорили оформить {product}, который мне не нужен и невыгоден.",
+    ],
+    CATEGORIES[3]: [
+        "Сказали, что {product} выдадут только при подключении {service}.",
+        "Без оформления страховки кредит не одобряли, пришлось согласиться на {service}.",
+        "Навязали {service} при получении карты, отказаться не дали.",
+    ],
+    CATEGORIES[4]: [
+        "Обнаружил списания за {service}, которую я не подключал.",
+        "Без моего ведома подключили {service} и списывают деньги каждый месяц.",
+        "Мне выпустили {product}, о которой я не просил и ничего не подписывал.",
+    ],
+}
+NEUTRAL_COMPLAINTS = [
+    "Очередь больше часа, работает одно окно.",
+    "Банкомат в отделении постоянно не работает.",
+    "Сотрудники не отвечали на звонки, дозвониться невозможно.",
+    "В обед отделение закрыто, хотя по графику должно работать.",
+    "Долго ждал ответа на заявление, сроки не соблюдают.",
+]
+PRAISE = [
+    "Спасибо менеджеру за быструю и вежливую консультацию!",
+    "Удобное отделение, очередей почти нет, все сделали быстро.",
+    "Специалисты грамотные, все объяснили и ничего не навязывали.",
+    "Обслуживание устроило, оформили {product} за 15 минут.",
+    "Отличный офис, приветливые сотрудники, рекомендую.",
+]
+OPENINGS = ["", "Отделение на {street}. ", "Была в этом офисе вчера. ", "Обращаюсь уже не первый раз. "]
+CLOSINGS = ["", " Прошу разобраться.", " Больше сюда не приду.", " Верните деньги.", " Очень разочарован."]
+
+STREETS = [
+    "ул. Тверская", "пр. Мира", "ул. Новый Арбат", "Лубянский пр.", "ул. Покровка", "Ленинский пр.",
+    "ул. Профсоюзная", "Кутузовский пр.", "ул. Маросейка", "Варшавское ш.", "ул. Бутырская", "Садовая-Кудринская ул.",
+]
+# Центр и разброс координат отделений (Москва и ближнее Подмосковье)
+CENTER = (55.7539, 37.6208)
+SPREAD_DEGREES = 0.25
+
+TONES = {1: "Негативный", 2: "Негативный", 3: "Нейтральный", 4: "Смешанный", 5: "Позитивный"}
+DATE_FROM = date(2023, 1, 1)
+DATE_DAYS = 900
+
+
+def generate_companies(count: int, rng: random.Random) -> List[Dict]:
+    companies = []
+    used_ids = set()
+    for i in range(count):
+        org_id = rng.randint(10000, 99999 + count * 10)
+        while org_id in used_ids:
+            org_id += 1
+        used_ids.add(org_id)
+        companies.append({
+            "id": org_id,
+            "number": org_id,
+            "name": f"ВСП_{i + 1}",
+            "address": f"{rng.choice(STREETS)}, {rng.randint(1, 120)}",
+            "geo_position": {
+                "latitude": round(CENTER[0] + rng.gauss(0, SPREAD_DEGREES / 2), 6),
+                "longitude": round(CENTER[1] + rng.gauss(0, SPREAD_DEGREES), 6),
+            },
+        })
+    return companies
+
+
+def _fill(template: str, rng: random.Random, street: str) -> str:
+    return template.format(
+        product=rng.choice(PRODUCTS), service=rng.choice(SERVICES), fee=rng.choice(FEES), street=street
+    )
+
+
+def generate_review(company: Dict, rng: random.Random, violation_share: float) -> Tuple[Dict, str]:
+    """Отзыв и его истинная категория (для проверки классификаторов)"""
+    street = company["address"].split(",")[0]
+    if rng.random() < violation_share:
+        category = rng.choice(CATEGORIES)
+        rate = rng.choice((1, 1, 2))
+        parts = [rng.choice(CATEGORY_TEMPLATES[category])]
+        if rng.random() < 0.4:
+            parts.append(rng.choice(NEUTRAL_COMPLAINTS))
+    else:
+        category = NO_CATEGORY
+        rate = rng.choice((2, 3, 3, 4, 5, 5, 5))
+        parts = [rng.choice(PRAISE if rate >= 4 else NEUTRAL_COMPLAINTS)]
+        if rate == 4 and rng.random() < 0.5:
+            parts.append(rng.choice(NEUTRAL_COMPLAINTS))
+    comment = _fill(rng.choice(OPENINGS) + " ".join(parts) + (rng.choice(CLOSINGS) if rate <= 2 else ""), rng, street)
+    review_date = DATE_FROM + timedelta(days=rng.randrange(DATE_DAYS))
+    return {
+        "date": f"{review_date.month}/{review_date.day}/{review_date.year}",
+        "rate": rate,
+        "comment": comment,
+        "expertise": rng.randint(1, 30),
+        "tone": TONES[rate],
+        "orgId": company["id"],
+    }, category
+
+
+def generate_reviews(companies: List[Dict], count: int, rng: random.Random,
+                     violation_share: float = 0.3) -> Iterator[Tuple[Dict, str]]:
+    # популярность отделений неравномерна: несколько отделений собирают большую часть отзывов
+    weights = [1 / (rank + 1) for rank in range(len(companies))]
+    for company in rng.choices(companies, weights=weights, k=count):
+        yield generate_review(company, rng, violation_share)
+
+
+def _write_json_array(path: str, items: Iterator[Dict]):
+    """Потоковая запись JSON-массива: 1M отзывов не держатся в памяти целиком"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[\n")
+        for i, item in enumerate(items):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+        f.write("\n]\n")
+
+
+def write_dataset(out_dir: str, reviews: int, companies: Optional[int] = None, seed: int = 42,
+                  violation_share: float = 0.3) -> Dict[str, str]:
+    """Создает reviews.json, companies.json и labels.json (истинные категории) в out_dir"""
+    rng = random.Random(seed)
+    companies = companies or max(3, reviews // 200)
+    os.makedirs(out_dir, exist_ok=True)
+    company_list = generate_companies(companies, rng)
+    paths = {name: os.path.join(out_dir, f"{name}.json") for name in ("reviews", "companies", "labels")}
+    _write_json_array(paths["companies"], iter(company_list))
+
+    labels = []
+
+    def reviews_with_labels():
+        for review, category in generate_reviews(company_list, reviews, rng, violation_share):
+            labels.append(category)
+            yield review
+
+    _write_json_array(paths["reviews"], reviews_with_labels())
+    with open(paths["labels"], 'w', encoding='utf-8') as f:
+        json.dump(labels, f, ensure_ascii=False)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетических отзывов и отделений")
+    parser.add_argument("-n", "--reviews", type=int, default=1000, help="Число отзывов")
+    parser.add_argument("-c", "--companies", type=int, default=None, help="Число отделений (по умолчанию n/200)")
+    parser.add_argument("-o", "--out", default=None, help="Каталог (по умолчанию benchmarks/data/<n>)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--violations", type=float, default=0.3, help="Доля отзывов с нарушениями")
+    args = parser.parse_args()
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", str(args.reviews))
+    print(json.dumps(write_dataset(out, args.reviews, args.companies, args.seed, args.violations), ensure_ascii=False))
@@ -0,0 +1,248 @@
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from crewai import Crew, Process, Task
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from llm_client import kickoff_with_retries
+from model_router import invoke_with_escalation
+from context_budget import ContextBudget, fit_items, PROMPT_BUDGET_TOKENS
+from data_store import load_reviews, load_companies, group_reviews_by_branch, branch_title
+from branch_profiles import branch_signature, get_branch_profiles
+from risk_classifier import risk_summary, load_labels, labels_version
+from report_sections import SectionCache, section_key, render_summary, render_risk_table, compose_report
+from event_log import get_logger, VERBOSE
+from pipeline_config import load_pipeline_config
+from main import create_config_agent, create_task
+
+# ----------------------------
+# Пофилиальный анализ (fan-out по orgId)
+# ----------------------------
+logger = get_logger("branch_fanout")
+# тот же объект, что и main.PIPELINE: конфигурация разбирается один раз на процесс
+PIPELINE = load_pipeline_config()
+BRANCH_WORKERS = int(os.getenv("BRANCH_WORKERS", "4"))
+
+# Готовые секции последних запусков: вопрос -> {orgId: markdown}.
+# Позволяют перезапустить одно отделение (rerun_branch) и пересобрать отчет без остальных.
+# Общие для потоков бота и планировщика, поэтому доступ — только под _SECTIONS_LOCK
+BRANCH_SECTIONS: Dict[str, Dict[int, str]] = {}
+BRANCH_SECTIONS_QUESTIONS = 16
+_SECTIONS_LOCK = threading.Lock()
+# Заголовки разделов секции отделения по задачам конвейера branch;
+# задачи без заголовка выводятся под своим именем
+BRANCH_HEADINGS = {"branch_risk": "Риски поведения", "branch_insights": "Ключевые выводы"}
+
+
+@dataclass
+class BranchRun:
+    """Результат одного пофилиального запуска"""
+    report: str
+    # все готовые секции по вопросу после запуска, включая секции прежних запусков
+    sections: Dict[int, str] = field(default_factory=dict)
+    # отделения этого запуска, анализ которых завершился ошибкой
+    failed: Set[int] = field(default_factory=set)
+
+
+def stored_sections(question: str) -> Dict[int, str]:
+    """Копия готовых секций по вопросу"""
+    with _SECTIONS_LOCK:
+        return dict(BRANCH_SECTIONS.get(question, {}))
+
+
+def remember_sections(question: str, sections: Dict[int, str], failed: Set[int] = frozenset(),
+                      present: Optional[Set[int]] = None) -> Dict[int, str]:
+    """Дополняет секции вопроса в BRANCH_SECTIONS и возвращает их копию.
+
+    Секции отделений с ошибкой удаляются, как и секции отделений, которых больше нет
+    в данных (если передан present)
+    """
+    with _SECTIONS_LOCK:
+        stored = BRANCH_SECTIONS.pop(question, {})
+        stored.update(sections)
+        for org_id in failed:
+            stored.pop(org_id, None)
+        if present is not None:
+            stored = {org_id: section for org_id, section in stored.items() if org_id in present}
+        # вопрос становится последним; самые давние вопросы вытесняются
+        BRANCH_SECTIONS[question] = stored
+        while len(BRANCH_SECTIONS) > BRANCH_SECTIONS_QUESTIONS:
+            BRANCH_SECTIONS.pop(next(iter(BRANCH_SECTIONS)))
+        return dict(stored)
+
+
+def create_branch_tasks(question: str, org_id: int, reviews: List[Dict], title: str) -> List[Task]:
+    """Задачи конвейера branch из конфигурации, ограниченные отзывами одного отделения"""
+    names = PIPELINE.pipelines["branch"]
+    # агенты создаются на каждое отделение, чтобы параллельные crew не делили состояние
+    agents = {name: create_config_agent(name) for name in PIPELINE.pipeline_agents("branch")}
+    # отзывы отделения занимают не больше половины бюджета промпта
+    reviews_json = json.dumps(fit_items(reviews, PROMPT_BUDGET_TOKENS // 2), ensure_ascii=False)
+    tasks: Dict[str, Task] = {}
+    for name in names:
+        tasks[name] = create_task(name, agents, tasks, question=question, org_id=org_id, title=title, reviews=reviews_json)
+    return list(tasks.values())
+
+
+def analyze_branch(question: str, org_id: int, reviews: List[Dict], title: str) -> str:
+    """Запускает crew по одному отделению и возвращает markdown-секцию"""
+    tasks = create_branch_tasks(question, org_id, reviews, title)
+    crew = Crew(
+        agents=[task.agent for task in tasks],
+        tasks=tasks,
+        process=Process.sequential,
+        verbose=VERBOSE
+    )
+    result = kickoff_with_retries(crew)
+    names = PIPELINE.pipelines["branch"]
+    outputs = list(getattr(result, 'tasks_output', None) or [])
+    if len(outputs) != len(names):
+        # crew вернул не по результату на задачу — сопоставить разделы по позиции нельзя
+        raise RuntimeError(f"Отделение {org_id}: ожидалось {len(names)} результатов задач, получено {len(outputs)}")
+    parts = [f"## {title}\n\nОтзывов: {len(reviews)}"]
+    for name, output in zip(names, outputs):
+        parts.append(f"### {BRANCH_HEADINGS.get(name, name)}\n{output or 'Нет данных'}")
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_recommendations(question: str, branch_sections: Dict[int, str]) -> str:
+    """Общие рекомендации руководству по готовым секциям отделений (один короткий вызов LLM)"""
+    budget = ContextBudget("section:recommendations").add(
+        "instructions",
+        f"Вопрос: {question}\nНа основе разделов отчета по отделениям сформулируйте 3–7 приоритетных "
+        "рекомендаций для руководства банка. Ответ — только маркированный список в Markdown.",
+        required=True,
+    )
+    for org_id in sorted(branch_sections, key=str):
+        budget.add(f"branch:{org_id}", branch_sections[org_id], priority=1)
+    messages = [
+        SystemMessage(content="Вы готовите итоговые рекомендации аналитического отчета по отделениям банка."),
+        HumanMessage(content=budget.assemble()),
+    ]
+
+    def validate(response) -> str:
+        if not response.content.strip():
+            raise ValueError("пустой ответ")
+        return response.content.strip()
+
+    return "## Рекомендации\n\n" + invoke_with_escalation("report", messages, validate)
+
+
+def build_report(question: str, groups: Dict[int, List[Dict]], companies: Dict[int, Dict],
+                 branch_sections: Dict[int, str], cache: SectionCache) -> str:
+    """Сводка, таблица рисков и рекомендации пересчитываются, только если изменились их входы"""
+    signatures = {org_id: branch_signature(companies.get(org_id), reviews) for org_id, reviews in groups.items()}
+    reviews = [review for branch_reviews in groups.values() for review in branch_reviews]
+    sections = {
+        "summary": cache.section(
+            "summary", sorted(signatures.items(), key=str),
+            lambda: render_summary(get_branch_profiles().profiles(list(groups))),
+        ),
+        # таблица рисков зависит и от разметки: новые метки LLM меняют классификацию
+        "risks": cache.section(
+            "risks", {"branches": sorted(signatures.items(), key=str), "labels": labels_version(load_labels())},
+            lambda: render_risk_table(risk_summary(reviews, use_llm=False), companies),
+        ),
+    }
+    try:
+        sections["recommendations"] = cache.section(
+            "recommendations", {"question": question, "branches": sorted(branch_sections.items(), key=str)},
+            lambda: generate_recommendations(question, branch_sections),
+        )
+    except Exception:
+        # отчет собирается и без рекомендаций; при следующем запуске они будут сгенерированы заново
+        logger.exception("recommendations failed")
+    logger.info("report assembled", extra={"section_hits": cache.hits, "section_misses": cache.misses})
+    return compose_report(question, sections, branch_sections)
+
+
+def analyze_branches(
+    question: str,
+    branch_ids: Optional[List[int]] = None,
+    max_workers: int = BRANCH_WORKERS,
+    reuse_sections: bool = False,
+    include_failed: bool = True
+) -> BranchRun:
+    """Анализирует отделения параллельно и собирает отчет из их секций.
+
+    Секция отделения кешируется по хешу вопроса и данных отделения (отзывы и
+    карточка), поэтому отделения без изменений не анализируются повторно;
+    сводка, таблица рисков и рекомендации тоже берутся из кеша, если их входы
+    не изменились, а итоговый Markdown собирается локально.
+
+    Args:
+        question: Вопрос пользователя
+        branch_ids: Отделения запуска; по умолчанию все. В отчет входят только они
+        max_workers: Максимальное число одновременно работающих crew
+        reuse_sections: Дополнить отчет секциями других отделений, готовыми
+            для этого же вопроса (BRANCH_SECTIONS) — для перезапуска отдельных отделений
+        include_failed: Включать в отчет отделения с ошибкой анализа (с пометкой);
+            иначе для них берется прежняя секция по этому вопросу, если она есть
+
+    Returns:
+        Итоговый отчет в формате Markdown, секции по вопросу и отделения с ошибкой
+    """
+    companies = load_companies()
+    groups = group_reviews_by_branch(load_reviews())
+    # отделения без отзывов не анализируются
+    targets = [org_id for org_id in (branch_ids if branch_ids is not None else groups) if org_id in groups]
+    cache = SectionCache()
+    keys = {
+        org_id: {"question": question, "org_id": org_id, "data": branch_signature(companies.get(org_id), groups[org_id])}
+        for org_id in targets
+    }
+    sections: Dict[int, str] = {}
+    for org_id in targets:
+        cached = cache.get(f"branch_{org_id}", section_key(f"branch_{org_id}", keys[org_id]))
+        if cached is not None:
+            sections[org_id] = cached
+    to_analyze = [org_id for org_id in targets if org_id not in sections]
+    logger.info("branch sections", extra={"cached": len(sections), "to_analyze": len(to_analyze)})
+
+    failed: Dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            # контекст копируется, чтобы события из потоков сохраняли run_id запуска
+            org_id: executor.submit(
+                contextvars.copy_context().run, analyze_branch, question, org_id, groups[org_id], branch_title(org_id, companies)
+            )
+            for org_id in to_analyze
+        }
+        for org_id, future in futures.items():
+            try:
+                sections[org_id] = future.result()
+                cache.put(f"branch_{org_id}", section_key(f"branch_{org_id}", keys[org_id]), sections[org_id])
+            except Exception as e:
+                logger.exception("branch analysis failed", extra={"org_id": org_id})
+                failed[org_id] = f"## {branch_title(org_id, companies)}\n\n⚠️ Анализ не выполнен: {e}\n"
+
+    previous = stored_sections(question)
+    # секции отделений, пропавших из данных, больше не попадают в отчеты
+    stored = remember_sections(question, sections, set(failed), present=set(groups))
+    report_sections = {}
+    if reuse_sections:
+        report_sections.update(stored)
+    report_sections.update(sections)
+    if include_failed:
+        report_sections.update(failed)
+    else:
+        report_sections.update({org_id: previous[org_id] for org_id in failed if org_id in previous})
+    report = build_report(question, {org_id: groups[org_id] for org_id in report_sections}, companies, report_sections, cache)
+    return BranchRun(report=report, sections=stored, failed=set(failed))
+
+
+def analyze_by_branch(question: str, branch_ids: Optional[List[int]] = None, max_workers: int = BRANCH_WORKERS,
+                      reuse_sections: bool = False, include_failed: bool = True) -> str:
+    """Пофилиальный отчет в формате Markdown (см. analyze_branches)"""
+    return analyze_branches(question, branch_ids, max_workers, reuse_sections, include_failed).report
+
+
+def rerun_branch(question: str, org_id: int) -> str:
+    """Перезапускает анализ одного отделения и пересобирает отчет с прежними секциями по этому вопросу"""
+    return analyze_by_branch(question, branch_ids=[org_id], max_workers=1, reuse_sections=True)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from data_store import (
+    REVIEWS_PATH, COMPANIES_PATH, load_reviews, load_companies, group_reviews_by_branch, review_snippet
+)
+from complaint_themes import get_theme_index
+from review_trends import compute_trends, get_review_series
+from event_log import get_logger
+
+# ----------------------------
+# Профили отделений: сводка по каждому отделению, пересчитываемая только при изменении его данных
+# ----------------------------
+logger = get_logger("branch_profiles")
+PROFILES_PATH = os.path.join("state", "branch_profiles.json")
+PROFILE_THEMES = 5
+PROFILE_INCIDENTS = 5
+# Отзывы с такой оценкой и негативным тоном попадают в инциденты профиля
+INCIDENT_MAX_RATE = 2
+NEGATIVE_TONE = "Негативный"
+
+
+def _day(review: Dict) -> str:
+    # даты в данных в формате m/d/yyyy; в профиле — ISO для сортировки и чтения
+    try:
+        return datetime.strptime(review.get("date"), "%m/%d/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return ""
+
+
+def branch_signature(company: Optional[Dict], reviews: List[Dict]) -> str:
+    """Отпечаток входных данных профиля: меняется при новых/удаленных отзывах или правке отделения"""
+    digest = hashlib.sha1(json.dumps(company, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    for review_id in sorted(review["id"] for review in reviews):
+        digest.update(review_id.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_profile(org_id: int, company: Optional[Dict], reviews: List[Dict],
+                  themes: List[Dict], anomalies: List[Dict]) -> Dict:
+    rates = [review["rate"] for review in reviews if review.get("rate") is not None]
+    days = sorted(day for day in map(_day, reviews) if day)
+    incidents = sorted(
+        (r for r in reviews if r.get("rate") is not None and r["rate"] <= INCIDENT_MAX_RATE
+         and r.get("tone") == NEGATIVE_TONE),
+        key=_day, reverse=True
+    )
+    return {
+        "orgId": org_id,
+        "name": (company or {}).get("name", f"Отделение {org_id}"),
+        "address": (company or {}).get("address"),
+        "reviews": len(reviews),
+        "first_review": days[0] if days else None,
+        "last_review": days[-1] if days else None,
+        "rating": {
+            "mean": round(sum(rates) / len(rates), 2) if rates else None,
+            "distribution": {str(rate): count for rate, count in sorted(Counter(rates).items())},
+        },
+        "tones": dict(Counter(review.get("tone", "не указан") for review in reviews).most_common()),
+        "themes": [
+            {"label": theme["label"], "count": theme["count"]}
+            for theme in themes if theme["theme_id"] is not None
+        ][:PROFILE_THEMES],
+        "anomalies": anomalies,
+        "incidents": [review_snippet(review) for review in incidents[:PROFILE_INCIDENTS]],
+        "incidents_total": len(incidents),
+        "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+class BranchProfiles:
+    """Профили всех отделений на диске (state/branch_profiles.json).
+
+    Для каждого отделения хранится отпечаток его отзывов и карточки; при
+    обновлении данных пересчитываются только отделения с изменившимся отпечатком
+    """
+
+    def __init__(self, path: str = PROFILES_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}   # orgId -> {"signature", "profile"}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)["branches"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"branches": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, reviews: List[Dict], companies: Dict[int, Dict]) -> List[int]:
+        """Пересчитывает профили отделений с изменившимися данными; возвращает orgId измененных и удаленных"""
+        groups = group_reviews_by_branch(reviews)
+        branch_ids = set(groups) | set(companies)
+        changed = []
+        signatures = {}
+        for org_id in branch_ids:
+            signature = branch_signature(companies.get(org_id), groups.get(org_id, []))
+            entry = self.entries.get(str(org_id))
+            if entry is None or entry["signature"] != signature:
+                changed.append(org_id)
+                signatures[org_id] = signature
+        removed = [
+            self.entries.pop(key)["profile"]["orgId"]
+            for key in set(self.entries) - {str(org_id) for org_id in branch_ids}
+        ]
+        if not changed:
+            return removed
+
+        # темы и аномалии считаются сразу для всех отделений, используются только для измененных
+        theme_index = get_theme_index()
+        anomalies = compute_trends(get_review_series(), "month")["anomalies"]
+        for org_id in changed:
+            self.entries[str(org_id)] = {
+                "signature": signatures[org_id],
+                "profile": build_profile(
+                    org_id, companies.get(org_id), groups.get(org_id, []),
+                    theme_index.themes([org_id], PROFILE_THEMES),
+                    [a for a in anomalies if a["orgId"] == org_id],
+                ),
+            }
+        logger.info("branch profiles updated", extra={"branch_ids": sorted(changed, key=str), "removed": removed})
+        return changed + removed
+
+    def get(self, org_id: int) -> Optional[Dict]:
+        entry = self.entries.get(str(org_id))
+        return entry["profile"] if entry else None
+
+    def profiles(self, branch_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+        if branch_ids is None:
+            return [entry["profile"] for entry in self.entries.values()]
+        return [profile for profile in map(self.get, branch_ids) if profile is not None]
+
+
+_PROFILES_CACHE: Dict[str, tuple] = {}
+
+
+def get_branch_profiles(reviews_path: str = REVIEWS_PATH, companies_path: str = COMPANIES_PATH) -> BranchProfiles:
+    """Профили, актуальные для текущих файлов данных; пересчет только при их изменении"""
+    mtimes = (os.path.getmtime(reviews_path), os.path.getmtime(companies_path))
+    cached = _PROFILES_CACHE.get(reviews_path)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+    profiles = cached[1] if cached is not None else BranchProfiles()
+    if profiles.refresh(load_reviews(reviews_path), load_companies(companies_path)) or not os.path.exists(profiles.path):
+        profiles.save()
+    _PROFILES_CACHE[reviews_path] = (mtimes, profiles)
+    return profiles
+
+
+def branch_profiles_for(branch_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    return get_branch_profiles().profiles(branch_ids)
@@ -0,0 +1,96 @@
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# ----------------------------
+# Контрольные точки запусков анализа
+# ----------------------------
+RUNS_DIR = os.getenv("RUNS_DIR", "runs")
+
+
+def _write_atomic(path: str, text: str):
+    # запись через временный файл: при падении процесса не остается обрезанных файлов
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def new_run_id() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+class RunCheckpoint:
+    """Каталог запуска runs/<run_id>/ с планом, результатами задач и вердиктами по ревизиям"""
+
+    def __init__(self, run_id: Optional[str] = None, question: Optional[str] = None):
+        self.run_id = run_id or new_run_id()
+        self.path = os.path.join(RUNS_DIR, self.run_id)
+        os.makedirs(self.path, exist_ok=True)
+        if question is not None and not os.path.exists(self._file("meta.json")):
+            self._save_json("meta.json", {"question": question, "created": datetime.now().isoformat(), "status": "running"})
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _save_json(self, name: str, data: Dict):
+        _write_atomic(self._file(name), json.dumps(data, ensure_ascii=False, indent=2))
+
+    def _load_json(self, name: str) -> Optional[Dict]:
+        if not os.path.exists(self._file(name)):
+            return None
+        with open(self._file(name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @property
+    def meta(self) -> Dict:
+        return self._load_json("meta.json") or {}
+
+    def set_status(self, status: str):
+        self._save_json("meta.json", {**self.meta, "status": status, "updated": datetime.now().isoformat()})
+
+    # план ревизии
+    def save_plan(self, revision: int, plan: List[str]):
+        self._save_json(f"rev{revision}_plan.json", {"plan": plan})
+
+    def load_plan(self, revision: int) -> Optional[List[str]]:
+        data = self._load_json(f"rev{revision}_plan.json")
+        return data["plan"] if data else None
+
+    # результаты задач
+    def save_task_output(self, revision: int, task_name: str, output):
+        _write_atomic(self._file(f"rev{revision}_{task_name}.md"), str(output))
+
+    def load_task_output(self, revision: int, task_name: str) -> Optional[str]:
+        path = self._file(f"rev{revision}_{task_name}.md")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    # вердикт критика
+    def save_verdict(self, revision: int, verdict: Dict):
+        self._save_json(f"rev{revision}_critique.json", verdict)
+
+    def load_verdict(self, revision: int) -> Optional[Dict]:
+        return self._load_json(f"rev{revision}_critique.json")
+
+    # сводка вызовов инструментов (tool_memo)
+    def save_tool_usage(self, usage: Dict):
+        self._save_json("tool_calls.json", usage)
+
+    def save_final(self, report: str):
+        _write_atomic(self._file("report.md"), report)
+        self.set_status("done")
+
+
+def list_unfinished_runs() -> List[str]:
+    """Запуски, которые можно продолжить через resume_analysis"""
+    if not os.path.isdir(RUNS_DIR):
+        return []
+    return sorted(
+        run_id for run_id in os.listdir(RUNS_DIR)
+        if RunCheckpoint(run_id).meta.get("status") == "running"
+    )
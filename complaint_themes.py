@@ -0,0 +1,245 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from data_store import REVIEWS_PATH, load_reviews, review_index, review_snippet
+from event_log import get_logger
+
+# ----------------------------
+# Темы жалоб: инкрементальная кластеризация отзывов (TF-IDF, только CPU)
+# ----------------------------
+logger = get_logger("complaint_themes")
+THEMES_PATH = os.path.join("state", "themes.json")
+# Минимальная косинусная близость отзыва к центроиду темы; ниже — отзыв открывает новую тему
+THEME_SIMILARITY = float(os.getenv("THEME_SIMILARITY", "0.25"))
+# Темы меньшего размера не выводятся отдельно, а считаются в «прочих»
+THEME_MIN_SIZE = int(os.getenv("THEME_MIN_SIZE", "2"))
+STEM_LENGTH = 5
+# Центроид темы для сравнения — наиболее весомые термины; остальные не влияют на близость заметно
+CENTROID_TOP_TERMS = 30
+CENTROID_MAX_TERMS = 300
+EXAMPLES_PER_THEME = 5
+COMPLAINT_TONES = {"Негативный", "Смешанный"}
+
+STOPWORDS = set("""
+и в во на не что я с со по а к ко мне меня мой моя мою это как за все всё у о об из так но же бы то было был была были
+мы они она он вы их его ее её им при для от до уже очень только еще ещё или когда если нет да даже там тут этот этом эта
+эти того чтобы потом после без сказал сказала говорит просто вообще теперь тоже тогда ни них нам вам вас себя свой
+банк банка банке банком сбер сбербанк сбербанка отделение отделения отделении офис офиса офисе клиент клиента клиентов
+сотрудник сотрудника сотрудники сотрудников раз время день
+""".split())
+
+
+def complaint(review: Dict) -> bool:
+    """В темы попадают отзывы с низкой оценкой или негативным/смешанным тоном.
+
+    Отзыв без оценки (rate отсутствует или None) оценивается только по тону
+    """
+    rate = review.get("rate")
+    return (rate is not None and rate <= 3) or review.get("tone") in COMPLAINT_TONES
+
+
+def tokenize(text: str) -> List[tuple]:
+    """(основа, слово) для значимых слов отзыва"""
+    words = re.findall(r"[а-яa-z]+", text.lower().replace("ё", "е"))
+    return [(word[:STEM_LENGTH], word) for word in words if len(word) > 2 and word not in STOPWORDS]
+
+
+class ThemeIndex:
+    """Темы жалоб с числом отзывов по отделениям и примерами.
+
+    Новые отзывы присваиваются ближайшей теме за один проход (inverted index
+    по терминам центроидов), поэтому обновление пропорционально числу новых
+    отзывов, а не всей базы. IDF пересчитывается по мере поступления данных;
+    центроиды старых тем при этом не перестраиваются — для полной перестройки
+    есть rebuild()
+    """
+
+    def __init__(self, path: str = THEMES_PATH, threshold: float = THEME_SIMILARITY):
+        self.path = path
+        self.threshold = threshold
+        self.n_docs = 0
+        self.df: Counter = Counter()
+        self.surface: Dict[str, Counter] = defaultdict(Counter)   # основа -> формы слова
+        self.assigned: Dict[str, int] = {}                        # id отзыва -> id темы
+        self.clusters: Dict[int, Dict] = {}
+        self.next_id = 1
+        self._index: Dict[str, Dict[int, float]] = defaultdict(dict)
+        if os.path.exists(path):
+            self._load()
+
+    # ---- хранение
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.n_docs = data["n_docs"]
+        self.df = Counter(data["df"])
+        self.surface = defaultdict(Counter, {stem: Counter(forms) for stem, forms in data["surface"].items()})
+        self.assigned = data["assigned"]
+        self.clusters = {int(cid): cluster for cid, cluster in data["clusters"].items()}
+        self.next_id = data["next_id"]
+        for cid in self.clusters:
+            self._index_cluster(cid)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            "n_docs": self.n_docs,
+            "df": self.df,
+            "surface": self.surface,
+            "assigned": self.assigned,
+            "clusters": self.clusters,
+            "next_id": self.next_id,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # ---- векторы и центроиды
+    def _vector(self, stems: Iterable[str]) -> Dict[str, float]:
+        counts = Counter(stems)
+        vector = {
+            stem: (1 + math.log(tf)) * (math.log((1 + self.n_docs) / (1 + self.df[stem])) + 1)
+            for stem, tf in counts.items()
+        }
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {stem: v / norm for stem, v in vector.items()}
+
+    def _centroid(self, cluster: Dict) -> Dict[str, float]:
+        top = heapq.nlargest(CENTROID_TOP_TERMS, cluster["sum"].items(), key=lambda item: item[1])
+        norm = math.sqrt(sum(v * v for _, v in top)) or 1.0
+        return {stem: v / norm for stem, v in top}
+
+    def _index_cluster(self, cid: int):
+        cluster = self.clusters[cid]
+        for stem in cluster.get("top", []):
+            self._index[stem].pop(cid, None)
+        centroid = self._centroid(cluster)
+        cluster["top"] = list(centroid)
+        for stem, weight in centroid.items():
+            self._index[stem][cid] = weight
+
+    def _nearest(self, vector: Dict[str, float]) -> tuple:
+        scores: Dict[int, float] = defaultdict(float)
+        for stem, weight in vector.items():
+            for cid, centroid_weight in self._index.get(stem, {}).items():
+                scores[cid] += weight * centroid_weight
+        if not scores:
+            return None, 0.0
+        cid = max(scores, key=scores.__getitem__)
+        return cid, scores[cid]
+
+    def _assign(self, review: Dict, vector: Dict[str, float]):
+        cid, similarity = self._nearest(vector)
+        if cid is None or similarity < self.threshold:
+            cid, similarity = self.next_id, 1.0
+            self.next_id += 1
+            self.clusters[cid] = {"count": 0, "sum": {}, "branches": {}, "examples": []}
+        cluster = self.clusters[cid]
+        cluster["count"] += 1
+        branch = str(review.get("orgId"))
+        cluster["branches"][branch] = cluster["branches"].get(branch, 0) + 1
+        for stem, weight in vector.items():
+            cluster["sum"][stem] = cluster["sum"].get(stem, 0.0) + weight
+        if len(cluster["sum"]) > 2 * CENTROID_MAX_TERMS:
+            cluster["sum"] = dict(heapq.nlargest(CENTROID_MAX_TERMS, cluster["sum"].items(), key=lambda item: item[1]))
+        # примеры — наиболее типичные для темы отзывы
+        cluster["examples"].append([round(similarity, 4), review["id"], review.get("orgId")])
+        cluster["examples"] = sorted(cluster["examples"], reverse=True)[:EXAMPLES_PER_THEME * 2]
+        self.assigned[review["id"]] = cid
+        # у крупной темы центроид почти не меняется от одного отзыва — индекс обновляется реже
+        if cluster["count"] <= 20 or cluster["count"] % 10 == 0:
+            self._index_cluster(cid)
+
+    # ---- обновление
+    def update(self, reviews: List[Dict]) -> int:
+        """Добавляет в темы еще не обработанные жалобы; возвращает их число"""
+        known = {review["id"] for review in reviews}
+        if any(review_id not in known for review_id in self.assigned):
+            # отзывы удалены или файл заменен — инкрементальное обновление невозможно
+            logger.info("reviews removed, rebuilding themes")
+            return self.rebuild(reviews)
+        new = [review for review in reviews if review["id"] not in self.assigned and complaint(review)]
+        if not new:
+            return 0
+        tokens = {review["id"]: tokenize(review.get("comment", "")) for review in new}
+        # сначала обновляется статистика документов, чтобы IDF учитывал всю новую порцию
+        self.n_docs += len(new)
+        for review_tokens in tokens.values():
+            self.df.update({stem for stem, _ in review_tokens})
+            for stem, word in review_tokens:
+                self.surface[stem][word] += 1
+        for review in new:
+            self._assign(review, self._vector(stem for stem, _ in tokens[review["id"]]))
+        logger.info("themes updated", extra={"new_reviews": len(new), "themes": len(self.clusters)})
+        return len(new)
+
+    def rebuild(self, reviews: List[Dict]) -> int:
+        self.n_docs, self.df, self.surface = 0, Counter(), defaultdict(Counter)
+        self.assigned, self.clusters, self.next_id = {}, {}, 1
+        self._index = defaultdict(dict)
+        return self.update(reviews)
+
+    # ---- чтение
+    def label(self, cluster: Dict, words: int = 4) -> str:
+        top = heapq.nlargest(words, cluster["sum"].items(), key=lambda item: item[1])
+        return ", ".join(self.surface[stem].most_common(1)[0][0] if self.surface.get(stem) else stem for stem, _ in top)
+
+    def themes(self, branch_ids: Optional[Iterable[int]] = None, limit: int = 30,
+               index: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """Темы по убыванию числа жалоб (с учетом отделений branch_ids) и примеры отзывов"""
+        scope = {str(b) for b in branch_ids} if branch_ids is not None else None
+        index = index if index is not None else {}
+        result, other = [], 0
+        for cid, cluster in self.clusters.items():
+            branches = {b: n for b, n in cluster["branches"].items() if scope is None or b in scope}
+            count = sum(branches.values())
+            if not count:
+                continue
+            if count < THEME_MIN_SIZE:
+                other += count
+                continue
+            examples = [
+                review_snippet(index[review_id]) if review_id in index else {"id": review_id, "orgId": org_id}
+                for _, review_id, org_id in cluster["examples"]
+                if scope is None or str(org_id) in scope
+            ][:EXAMPLES_PER_THEME]
+            result.append({
+                "theme_id": cid,
+                "label": self.label(cluster),
+                "count": count,
+                "branches": dict(sorted(branches.items(), key=lambda item: -item[1])),
+                "examples": examples,
+            })
+        result.sort(key=lambda theme: -theme["count"])
+        if len(result) > limit:
+            other += sum(theme["count"] for theme in result[limit:])
+            result = result[:limit]
+        if other:
+            result.append({"theme_id": None, "label": "прочие единичные жалобы", "count": other})
+        return result
+
+
+_THEMES_CACHE: Dict[str, tuple] = {}
+
+
+def get_theme_index(file_path: str = REVIEWS_PATH) -> ThemeIndex:
+    """Темы, дополненные новыми отзывами; пересчет только при изменении файла отзывов"""
+    mtime = os.path.getmtime(file_path)
+    cached = _THEMES_CACHE.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    themes = cached[1] if cached is not None else ThemeIndex()
+    if themes.update(load_reviews(file_path)):
+        themes.save()
+    _THEMES_CACHE[file_path] = (mtime, themes)
+    return themes
+
+
+def complaint_themes_for(branch_ids: Optional[Iterable[int]] = None, limit: int = 30) -> List[Dict]:
+    return get_theme_index().themes(branch_ids, limit, review_index())
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from profiling import profiled
+
+# ----------------------------
+# Бюджет контекста для промптов задач
+# ----------------------------
+logger = logging.getLogger("context_budget")
+
+# Окно модели и его распределение: промпт задачи, ответы инструментов, ответ модели
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "32768"))
+PROMPT_BUDGET_TOKENS = int(os.getenv("PROMPT_BUDGET_TOKENS", str(MODEL_CONTEXT_TOKENS // 2)))
+TOOL_OUTPUT_BUDGET_TOKENS = int(os.getenv("TOOL_OUTPUT_BUDGET_TOKENS", str(MODEL_CONTEXT_TOKENS // 4)))
+# Системный промпт агента (предыстория + память) — часть бюджета промпта
+SYSTEM_PROMPT_BUDGET_TOKENS = PROMPT_BUDGET_TOKENS // 4
+# Усеченная часть короче этого порога не несет смысла и удаляется целиком
+MIN_COMPONENT_TOKENS = 50
+TRUNCATION_MARK = "\n…[сокращено: {dropped} ток.]…\n"
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Приближение BPE без словаря: слово дробится на куски по 4 символа, знаки препинания — отдельные токены
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов: tiktoken, если установлен, иначе быстрая локальная оценка"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Сокращает текст до max_tokens, сохраняя начало (2/3) и конец (1/3)"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    mark = TRUNCATION_MARK.format(dropped=tokens - max_tokens)
+    keep_chars = int(len(text) * max(max_tokens - count_tokens(mark), 0) / tokens)
+    while True:
+        head, tail = keep_chars * 2 // 3, keep_chars // 3
+        result = text[:head] + mark + (text[-tail:] if tail else "")
+        if count_tokens(result) <= max_tokens or keep_chars == 0:
+            return result
+        keep_chars = int(keep_chars * 0.9)
+
+
+@dataclass
+class Component:
+    name: str
+    text: str
+    priority: int = 0        # чем выше, тем позже сокращается
+    required: bool = False   # сокращается только если без этого не уложиться
+    tokens: int = 0
+
+
+class ContextBudget:
+    """Собирает промпт из частей так, чтобы он гарантированно уложился в лимит токенов"""
+
+    def __init__(self, label: str, limit: int = PROMPT_BUDGET_TOKENS):
+        self.label = label
+        self.limit = limit
+        self.components: List[Component] = []
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False) -> "ContextBudget":
+        if text:
+            self.components.append(Component(name, text, priority, required, count_tokens(text)))
+        return self
+
+    @profiled("prompt_assembly")
+    def assemble(self, separator: str = "\n\n") -> str:
+        original = {c.name: c.tokens for c in self.components}
+        overhead = count_tokens(separator) * max(len(self.components) - 1, 0)
+        excess = sum(c.tokens for c in self.components) + overhead - self.limit
+
+        # сначала необязательные части с наименьшим приоритетом, затем обязательные
+        order = sorted(self.components, key=lambda c: (c.required, c.priority))
+        for component in order:
+            if excess <= 0:
+                break
+            keep = component.tokens - excess
+            if keep < MIN_COMPONENT_TOKENS and not component.required:
+                excess -= component.tokens
+                component.text, component.tokens = "", 0
+            else:
+                component.text = truncate_to_tokens(component.text, max(keep, 0))
+                new_tokens = count_tokens(component.text)
+                excess -= component.tokens - new_tokens
+                component.tokens = new_tokens
+
+        self._log(original)
+        return separator.join(c.text for c in self.components if c.text)
+
+    def _log(self, original: dict):
+        parts = {c.name: c.tokens for c in self.components}
+        # сокращенные и удаленные части: имя -> сколько токенов было до сокращения
+        trimmed = {c.name: original[c.name] for c in self.components if c.tokens != original[c.name]}
+        logger.info("context budget assembled", extra={
+            "label": self.label, "tokens": sum(parts.values()), "limit": self.limit, "parts": parts, "trimmed": trimmed,
+        })
+
+
+def fit_items(items: list, limit: int = TOOL_OUTPUT_BUDGET_TOKENS,
+              render: Callable[[object], str] = lambda item: json.dumps(item, ensure_ascii=False),
+              hint: Optional[str] = None) -> list:
+    """Ответ инструмента: столько элементов, сколько помещается в лимит, с пометкой об остальных"""
+    result, used = [], 0
+    for item in items:
+        tokens = count_tokens(render(item))
+        if used + tokens > limit:
+            note = f"Показано {len(result)} из {len(items)} записей (лимит контекста)."
+            result.append({"note": f"{note} {hint}" if hint else note})
+            logger.info("tool output truncated", extra={
+                "items": len(result) - 1, "total": len(items), "tokens": used, "limit": limit,
+            })
+            break
+        result.append(item)
+        used += tokens
+    return result
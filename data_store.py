@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional
+
+from profiling import stage
+
+# ----------------------------
+# Доступ к данным отзывов и отделений
+# ----------------------------
+REVIEWS_PATH = "data/reviews3.json"
+COMPANIES_PATH = "data/companies3.json"
+
+# Кеш загруженных файлов: путь -> (mtime, данные)
+_JSON_CACHE: Dict[str, Any] = {}
+# Отделения, которыми ограничен текущий анализ (None — все отделения).
+# ContextVar: одновременные асинхронные анализы не видят ограничения друг друга
+_REVIEW_SCOPE: ContextVar[Optional[frozenset]] = ContextVar("review_scope", default=None)
+# Отзывы с присвоенными id и индекс id -> отзыв: путь -> (mtime, отзывы, индекс)
+_REVIEWS_CACHE: Dict[str, Any] = {}
+# Длина id отзыва в шестнадцатеричных знаках хеша
+REVIEW_ID_HEX = 16
+
+
+def load_json(file_path: str) -> Any:
+    """Читает JSON-файл, повторно используя данные, пока файл не изменился"""
+    mtime = os.path.getmtime(file_path)
+    cached = _JSON_CACHE.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with stage("load_json"), open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    _JSON_CACHE[file_path] = (mtime, data)
+    return data
+
+
+def clear_cache():
+    """Сбрасывает кеши загруженных файлов (для замеров холодной загрузки)"""
+    _JSON_CACHE.clear()
+    _REVIEWS_CACHE.clear()
+
+
+def make_review_id(review: Dict) -> str:
+    """Стабильный id отзыва: не зависит от порядка отзывов в файле.
+
+    64 бита хеша: при миллионе отзывов вероятность совпадения id разных отзывов ~1e-8.
+    Полные дубликаты (то же отделение, дата и текст) получают один id — ссылка на любой из них верна
+    """
+    return "R-" + review_key(review)[:REVIEW_ID_HEX]
+
+
+def _load_reviews_with_ids(file_path: str):
+    mtime = os.path.getmtime(file_path)
+    cached = _REVIEWS_CACHE.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached
+    reviews, index = [], {}
+    for review in load_json(file_path):
+        review_id = review.get("id") or make_review_id(review)
+        review = {"id": review_id, **{k: v for k, v in review.items() if k != "id"}}
+        reviews.append(review)
+        index.setdefault(review_id, review)
+    _REVIEWS_CACHE[file_path] = (mtime, reviews, index)
+    return _REVIEWS_CACHE[file_path]
+
+
+def load_reviews(file_path: str = REVIEWS_PATH) -> List[Dict]:
+    """Возвращает список отзывов; каждому отзыву при загрузке присваивается id"""
+    return _load_reviews_with_ids(file_path)[1]
+
+
+def set_review_scope(branch_ids: Optional[List[int]]):
+    """Ограничивает отзывы, которые видят инструменты, заданными отделениями; возвращает токен для сброса"""
+    return _REVIEW_SCOPE.set(frozenset(branch_ids) if branch_ids is not None else None)
+
+
+def reset_review_scope(token):
+    _REVIEW_SCOPE.reset(token)
+
+
+def review_scope() -> Optional[frozenset]:
+    """Отделения текущего анализа или None, если анализ не ограничен"""
+    return _REVIEW_SCOPE.get()
+
+
+def scoped_reviews(file_path: str = REVIEWS_PATH) -> List[Dict]:
+    """Отзывы с учетом ограничения по отделениям текущего анализа"""
+    scope = review_scope()
+    reviews = load_reviews(file_path)
+    if scope is None:
+        return reviews
+    return [review for review in reviews if review.get("orgId") in scope]
+
+
+def review_index(file_path: str = REVIEWS_PATH) -> Dict[str, Dict]:
+    """Предрассчитанный индекс id -> отзыв для проверки ссылок за O(1)"""
+    return _load_reviews_with_ids(file_path)[2]
+
+
+def review_snippet(review: Dict, query: str = "", length: int = 200) -> Dict:
+    """Краткая карточка отзыва для инструментов: id, отделение и фрагмент текста"""
+    comment = review.get("comment", "")
+    start = max(comment.lower().find(query.lower()) - length // 4, 0) if query else 0
+    snippet = comment[start:start + length]
+    return {
+        "id": review["id"],
+        "orgId": review.get("orgId"),
+        "date": review.get("date"),
+        "rate": review.get("rate"),
+        "snippet": ("…" if start else "") + snippet + ("…" if start + length < len(comment) else ""),
+    }
+
+
+def load_companies(file_path: str = COMPANIES_PATH) -> Dict[int, Dict]:
+    """Возвращает отделения, проиндексированные по id (он же orgId в отзывах)"""
+    return {company["id"]: company for company in load_json(file_path)}
+
+
+def group_reviews_by_branch(reviews: List[Dict]) -> Dict[int, List[Dict]]:
+    """Разбивает отзывы по отделениям (orgId), сохраняя исходный порядок"""
+    groups: Dict[int, List[Dict]] = defaultdict(list)
+    for review in reviews:
+        groups[review.get("orgId")].append(review)
+    return dict(groups)
+
+
+def branch_title(org_id: int, companies: Optional[Dict[int, Dict]] = None) -> str:
+    """Человекочитаемое название отделения: 'ВСП_1 (ул. Тверская, 12)'"""
+    company = (companies or {}).get(org_id)
+    if not company:
+        return f"Отделение {org_id}"
+    return f"{company['name']} ({company['address']})"
+
+
+def review_key(review: Dict) -> str:
+    """Ключ отзыва для сравнения версий данных (в исходных данных нет id)"""
+    raw = f"{review.get('orgId')}|{review.get('date')}|{review.get('comment')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(file_path: str) -> str:
+    """Хеш содержимого файла; меняется только при реальном изменении данных"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def data_version(paths: Optional[List[str]] = None) -> str:
+    """Версия исходных данных по времени изменения и размеру файлов (как кеш load_json).
+
+    Содержимое не читается: проверка вызывается на каждый вопрос в боте, а файл
+    отзывов может весить сотни мегабайт
+    """
+    digest = hashlib.sha256()
+    for path in paths or (REVIEWS_PATH, COMPANIES_PATH):
+        stat = os.stat(path)
+        digest.update(f"{path}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+async def load_reviews_async(file_path: str = REVIEWS_PATH) -> List[Dict]:
+    """load_reviews без блокировки цикла событий (чтение и разбор JSON в потоке)"""
+    return await asyncio.to_thread(load_reviews, file_path)
+
+
+async def load_companies_async(file_path: str = COMPANIES_PATH) -> Dict[int, Dict]:
+    return await asyncio.to_thread(load_companies, file_path)
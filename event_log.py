@@ -0,0 +1,158 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# ----------------------------
+# Структурированный журнал событий
+# ----------------------------
+LOG_DIR = "log"
+# У каждого процесса (бот, демон, воркеры, CLI, бенчмарки) свой файл: RotatingFileHandler
+# не согласует ротацию между процессами. {process} — имя запущенного скрипта, {pid} — id процесса
+LOG_PATH = os.getenv("LOG_PATH", os.path.join(LOG_DIR, "events-{process}.jsonl"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Уровни по компонентам: "main=DEBUG,LiteLLM=WARNING"
+DEFAULT_COMPONENT_LEVELS = {
+    "LiteLLM": "WARNING",
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "openai": "WARNING",
+    "telegram": "WARNING",
+}
+# В консоль выводятся только предупреждения и ошибки
+CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "WARNING")
+# Подробный вывод CrewAI (verbose) — только по явному запросу
+VERBOSE = os.getenv("LOG_VERBOSE", "false").lower() in ("1", "true", "yes")
+
+_RUN_ID: ContextVar[Optional[str]] = ContextVar("run_id", default=None)
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+# Стандартные атрибуты LogRecord, которые не попадают в поля события
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "run_id"}
+
+
+def component_levels() -> Dict[str, str]:
+    levels = dict(DEFAULT_COMPONENT_LEVELS)
+    for item in os.getenv("LOG_LEVELS", "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def set_run_id(run_id: Optional[str]):
+    """Привязывает события текущего контекста (потока, задачи asyncio) к запуску; возвращает токен"""
+    return _RUN_ID.set(run_id)
+
+
+def reset_run_id(token):
+    _RUN_ID.reset(token)
+
+
+def current_run_id() -> Optional[str]:
+    return _RUN_ID.get()
+
+
+class RunIdFilter(logging.Filter):
+    """Запоминает run_id в записи до передачи в очередь: запись пишется уже в другом потоке"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "run_id"):
+            record.run_id = _RUN_ID.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Передает в очередь сообщение и трассировку по отдельности, чтобы они остались отдельными полями"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на событие: время, уровень, компонент, run_id, сообщение и доп. поля"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "component": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                event[key] = value
+        if record.exc_text:
+            event["exc"] = record.exc_text
+        elif record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def process_name() -> str:
+    """Имя процесса для файла журнала: имя скрипта точки входа (telegram_bot, report_daemon, ...)"""
+    script = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv else ""))[0]
+    return script if script and not script.startswith("-") else "python"
+
+
+def setup_logging(path: str = LOG_PATH):
+    """Настраивает журнал один раз на процесс.
+
+    Потоки приложения только кладут запись в очередь; форматирование и запись
+    в файл с ротацией выполняет отдельный поток QueueListener
+    """
+    global _LISTENER
+    if _LISTENER is not None:
+        return
+    path = path.format(process=process_name(), pid=os.getpid())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(CONSOLE_LEVEL)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RunIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in component_levels().items():
+        logging.getLogger(name).setLevel(level)
+
+    _LISTENER = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _LISTENER.start()
+    # при выходе оставшиеся в очереди события дописываются в файл
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+def get_logger(component: str) -> logging.Logger:
+    return logging.getLogger(component)
@@ -0,0 +1,64 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# ----------------------------
+# Проверка ссылок на отзывы в отчетах
+# ----------------------------
+CITATION_PATTERN = re.compile(r"\bR-[0-9a-f]{16}\b")
+CITATION_FORMAT = "[R-xxxxxxxxxxxxxxxx]"
+
+
+@dataclass
+class EvidenceCheck:
+    cited: int = 0
+    valid: List[str] = field(default_factory=list)
+    unknown: List[str] = field(default_factory=list)       # id нет в данных
+    mismatched: List[str] = field(default_factory=list)    # отзыв относится к другому отделению
+
+    @property
+    def invalid(self) -> List[str]:
+        return self.unknown + self.mismatched
+
+    def remarks(self) -> List[str]:
+        remarks = []
+        if self.unknown:
+            remarks.append(f"Ссылки на несуществующие отзывы: {', '.join(self.unknown[:10])}")
+        if self.mismatched:
+            remarks.append(f"Отзывы относятся к другому отделению: {', '.join(self.mismatched[:10])}")
+        return remarks
+
+
+def _branch_aliases(companies: Dict[int, Dict]) -> Dict[str, int]:
+    """Имена и номера отделений, по которым определяется заявленное в строке отделение"""
+    aliases = {}
+    for org_id, company in companies.items():
+        aliases[str(org_id)] = org_id
+        aliases[company["name"]] = org_id
+    return aliases
+
+
+def verify_citations(report: str, index: Dict[str, Dict], companies: Dict[int, Dict]) -> EvidenceCheck:
+    """Проверяет, что каждый процитированный id существует и относится к отделению из той же строки.
+
+    Сложность O(число ссылок): используется предрассчитанный индекс id -> отзыв
+    """
+    aliases = _branch_aliases(companies)
+    alternatives = "|".join(sorted(map(re.escape, aliases), key=len, reverse=True))
+    alias_pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)") if aliases else None
+    check = EvidenceCheck()
+    for line in report.splitlines():
+        citations = CITATION_PATTERN.findall(line)
+        if not citations:
+            continue
+        claimed = {aliases[m] for m in alias_pattern.findall(line)} if alias_pattern else set()
+        for review_id in citations:
+            check.cited += 1
+            review = index.get(review_id)
+            if review is None:
+                check.unknown.append(review_id)
+            elif claimed and review.get("orgId") not in claimed:
+                check.mismatched.append(review_id)
+            else:
+                check.valid.append(review_id)
+    return check
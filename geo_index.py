@@ -0,0 +1,184 @@
+import math
+import os
+import re
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from data_store import COMPANIES_PATH, load_companies
+
+# ----------------------------
+# Пространственный индекс отделений
+# ----------------------------
+EARTH_RADIUS_KM = 6371.0
+# Размер ячейки сетки: для городских запросов (радиус 1–5 км) просматривается несколько ячеек
+CELL_SIZE_KM = 1.0
+KM_PER_DEGREE_LAT = 111.32
+
+# Районы, которые распознаются в вопросе: шаблон -> (название, широта, долгота, радиус, км).
+# Шаблоны требуют указания места («в центре Москвы», «отделения в Москве»):
+# «в центре внимания» или «Москву» в сравнении не должны сужать анализ
+REGIONS: List[Tuple[str, Tuple[str, float, float, float]]] = [
+    (r"центр\w*\s+(?:москв\w*|города|столиц\w*)|москв\w*\s+центр|центральн\w+\s+(?:район\w*|округ\w*)\s+москв\w*",
+     ("центр Москвы", 55.7539, 37.6208, 3.0)),
+    (r"в\s+пределах\s+садового|садово\w*\s+кольц", ("внутри Садового кольца", 55.7539, 37.6208, 2.5)),
+    (r"\b(?:в|по)\s+москв\w*|отделени\w*\s+москв\w*|московск\w+\s+отделени", ("Москва", 55.7539, 37.6208, 30.0)),
+]
+# Вопросы, сравнивающие районы между собой, не ограничиваются одним из них
+COMPARISON_PATTERN = r"\bсравн\w*|\bрегион\w*|\bпо\s+сравнению|\bв\s+отличие|\bпротив\b|\bvs\b"
+
+# Регрессионные примеры распознавания района (python geo_index.py)
+REGION_EXAMPLES: List[Tuple[str, Optional[str]]] = [
+    ("Какие риски в отделениях в центре Москвы?", "центр Москвы"),
+    ("Отделения в центре города с жалобами на комиссии", "центр Москвы"),
+    ("Жалобы на отделения внутри Садового кольца", "внутри Садового кольца"),
+    ("Найдите инциденты в отделениях в Москве", "Москва"),
+    ("Какие отделения Москвы хуже всего по отзывам?", "Москва"),
+    ("Какие практики в центре внимания клиентов?", None),
+    ("Что находится в центре жалоб клиентов?", None),
+    ("Сравните Москву и регионы по числу жалоб", None),
+    ("Сравните отделения в центре Москвы с остальными", None),
+    ("Проанализируйте данные из клиентских комментариев и найдите инциденты операционного риска в отделениях", None),
+]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли между двумя точками, км"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GeoIndex:
+    """Равномерная сетка по широте/долготе; запросы просматривают только соседние ячейки"""
+
+    def __init__(self, companies: Dict[int, Dict], cell_size_km: float = CELL_SIZE_KM):
+        self.companies = companies
+        self.cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        positions = [c["geo_position"] for c in companies.values() if c.get("geo_position")]
+        mean_lat = sum(p["latitude"] for p in positions) / len(positions) if positions else 55.75
+        # шаг сетки в градусах; по долготе он растет к полюсам
+        self.dlat = cell_size_km / KM_PER_DEGREE_LAT
+        self.dlon = cell_size_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(mean_lat)), 0.01))
+        for org_id, company in companies.items():
+            position = company.get("geo_position")
+            if position:
+                self.cells[self._cell(position["latitude"], position["longitude"])].append(org_id)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.dlat), math.floor(lon / self.dlon)
+
+    def _cell_km(self, lat: float) -> float:
+        """Наименьшая сторона ячейки в км на широте lat"""
+        return min(self.dlat, self.dlon * math.cos(math.radians(lat))) * KM_PER_DEGREE_LAT
+
+    def _position(self, org_id: int) -> Tuple[float, float]:
+        position = self.companies[org_id]["geo_position"]
+        return position["latitude"], position["longitude"]
+
+    def _result(self, org_id: int, distance: Optional[float] = None) -> Dict:
+        company = self.companies[org_id]
+        result = {"id": org_id, "name": company["name"], "address": company["address"]}
+        if distance is not None:
+            result["distance_km"] = round(distance, 3)
+        return result
+
+    def _cells_in_ring(self, center: Tuple[int, int], ring: int):
+        ci, cj = center
+        for i in range(ci - ring, ci + ring + 1):
+            for j in range(cj - ring, cj + ring + 1):
+                if max(abs(i - ci), abs(j - cj)) == ring and (i, j) in self.cells:
+                    yield self.cells[(i, j)]
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[Dict]:
+        """Отделения в радиусе radius_km от точки, по возрастанию расстояния"""
+        rings = math.ceil(radius_km / self._cell_km(lat)) + 1
+        center = self._cell(lat, lon)
+        found = []
+        for ring in range(rings + 1):
+            for org_ids in self._cells_in_ring(center, ring):
+                for org_id in org_ids:
+                    distance = haversine_km(lat, lon, *self._position(org_id))
+                    if distance <= radius_km:
+                        found.append((distance, org_id))
+        return [self._result(org_id, distance) for distance, org_id in sorted(found)]
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Dict]:
+        """k ближайших отделений: кольца ячеек расширяются, пока ответ не станет точным"""
+        total = sum(len(ids) for ids in self.cells.values())
+        k = min(k, total)
+        if k <= 0:
+            return []
+        center = self._cell(lat, lon)
+        cell_km = self._cell_km(lat)
+        found: List[Tuple[float, int]] = []
+        seen = 0
+        ring = 0
+        while seen < total:
+            for org_ids in self._cells_in_ring(center, ring):
+                for org_id in org_ids:
+                    found.append((haversine_km(lat, lon, *self._position(org_id)), org_id))
+                    seen += 1
+            found.sort()
+            # все точки вне просмотренных колец дальше ring * cell_km
+            if len(found) >= k and found[k - 1][0] <= ring * cell_km:
+                break
+            ring += 1
+        return [self._result(org_id, distance) for distance, org_id in found[:k]]
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Dict]:
+        """Отделения внутри прямоугольника широта/долгота"""
+        (i0, j0), (i1, j1) = self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+        found = []
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for org_id in self.cells.get((i, j), []):
+                    lat, lon = self._position(org_id)
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                        found.append(org_id)
+        return [self._result(org_id) for org_id in sorted(found)]
+
+
+_GEO_CACHE: Dict[str, Tuple[float, GeoIndex]] = {}
+
+
+def get_geo_index(file_path: str = COMPANIES_PATH) -> GeoIndex:
+    """Индекс перестраивается только при изменении файла отделений"""
+    mtime = os.path.getmtime(file_path)
+    cached = _GEO_CACHE.get(file_path)
+    if cached is None or cached[0] != mtime:
+        _GEO_CACHE[file_path] = (mtime, GeoIndex(load_companies(file_path)))
+    return _GEO_CACHE[file_path][1]
+
+
+def detect_region(question: str) -> Optional[Tuple[str, float, float, float]]:
+    """Район, упомянутый в вопросе: (название, широта, долгота, радиус) или None"""
+    text = question.lower().replace("ё", "е")
+    if re.search(COMPARISON_PATTERN, text):
+        return None
+    for pattern, region in REGIONS:
+        if re.search(pattern, text):
+            return region
+    return None
+
+
+def branches_for_question(question: str) -> Optional[Tuple[str, List[int]]]:
+    """Предварительный отбор отделений по району из вопроса — до любого вызова LLM"""
+    region = detect_region(question)
+    if region is None:
+        return None
+    name, lat, lon, radius_km = region
+    return name, [branch["id"] for branch in get_geo_index().within_radius(lat, lon, radius_km)]
+
+
+if __name__ == "__main__":
+    failed = [
+        (question, expected, detect_region(question))
+        for question, expected in REGION_EXAMPLES
+        if (detect_region(question) or (None,))[0] != expected
+    ]
+    for question, expected, actual in failed:
+        print(f"✗ {question!r}: ожидалось {expected}, получено {actual[0] if actual else None}")
+    print(f"примеров: {len(REGION_EXAMPLES)}, ошибок: {len(failed)}")
+    sys.exit(1 if failed else 0)
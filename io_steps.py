@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from typing import Any, Awaitable, Callable, Generator, Optional
+
+# ----------------------------
+# Общая логика синхронного и асинхронного пайплайна
+# ----------------------------
+# Логика (повторы, эскалация, цикл ревизий) пишется один раз — генератором, который
+# отдает наружу шаги ввода-вывода (Step) и получает обратно их результат или исключение.
+# run_sync выполняет шаг обычным вызовом, run_async — корутиной, поэтому синхронный
+# и асинхронный варианты различаются только самими вызовами LLM, crew и пауз
+
+
+class Step:
+    """Один шаг ввода-вывода: синхронный вызов и его асинхронный вариант (оба без аргументов)"""
+
+    __slots__ = ("call", "acall")
+
+    def __init__(self, call: Optional[Callable[[], Any]], acall: Optional[Callable[[], Awaitable[Any]]]):
+        self.call = call
+        self.acall = acall
+
+
+Steps = Generator[Step, Any, Any]
+
+
+class StepsCancelled(Exception):
+    """Фоновые шаги отменены до завершения"""
+
+
+def sleep_step(seconds: float) -> Step:
+    return Step(partial(time.sleep, seconds), partial(asyncio.sleep, seconds))
+
+
+def thread_step(fn: Callable, *args) -> Step:
+    """Блокирующий вызов (файлы, SQLite): в асинхронном варианте выполняется в потоке"""
+    return Step(partial(fn, *args), partial(asyncio.to_thread, fn, *args))
+
+
+def _check(cancelled: Optional[threading.Event]):
+    if cancelled is not None and cancelled.is_set():
+        raise StepsCancelled()
+
+
+def run_sync(steps: Steps, cancelled: Optional[threading.Event] = None) -> Any:
+    """Выполняет шаги синхронно; флаг cancelled проверяется между шагами"""
+    try:
+        step = next(steps)
+        while True:
+            try:
+                _check(cancelled)
+                result = step.call()
+            except BaseException as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(steps: Steps, cancelled: Optional[threading.Event] = None) -> Any:
+    """Выполняет шаги в цикле событий; отмена задачи передается в генератор как CancelledError"""
+    try:
+        step = next(steps)
+        while True:
+            try:
+                _check(cancelled)
+                result = await step.acall()
+            except BaseException as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+class Background:
+    """Шаги, выполняемые в фоне: в потоке (sync) или задаче asyncio (async).
+
+    cancel() не прерывает уже начатый шаг: запущенный crew дорабатывает в своем
+    потоке (kickoff_async тоже выполняет kickoff в потоке). Следующие шаги после
+    отмены не выполняются, а результат фоновой работы не используется
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.handle = None   # Future или asyncio.Task
+
+    def cancel(self):
+        """Отменяет фоновую работу. Ожидание результата после отмены не нужно:
+        шаг, выполняемый в потоке, завершится сам, но следующие шаги не начнутся"""
+        self.cancelled.set()
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+def spawn_step(make_steps: Callable[[], Steps]) -> Step:
+    """Запускает шаги make_steps() в фоне; результат шага — Background для wait_step и cancel()"""
+    def call() -> Background:
+        background = Background()
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+        # context копируется: фоновая работа пишет в журнал и профиль текущего запуска
+        background.handle = pool.submit(copy_context().run, run_sync, make_steps(), background.cancelled)
+        pool.shutdown(wait=False)
+        return background
+
+    async def acall() -> Background:
+        background = Background()
+        background.handle = asyncio.create_task(run_async(make_steps(), background.cancelled))
+        return background
+
+    return Step(call, acall)
+
+
+def wait_step(background: Background) -> Step:
+    """Ожидание результата фоновых шагов"""
+    async def acall():
+        return await background.handle
+    return Step(lambda: background.handle.result(), acall)
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from checkpoint import new_run_id
+
+# ----------------------------
+# Очередь заданий на анализ (SQLite)
+# ----------------------------
+STATE_DIR = "state"
+JOBS_DB_PATH = os.path.join(STATE_DIR, "jobs.db")
+# Задание без отметки воркера дольше этого срока считается брошенным и возвращается в очередь
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    """Задания хранятся в SQLite, поэтому бот и воркеры работают в разных процессах.
+
+    Воркер забирает задание атомарно (BEGIN IMMEDIATE), пока выполняет — обновляет
+    heartbeat; задания упавших воркеров возвращаются в очередь и продолжаются
+    с контрольной точки, так как id задания совпадает с run_id анализа
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    chat_id INTEGER,
+                    user_id INTEGER,
+                    result TEXT,
+                    context TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    delivered INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # отдельное соединение на поток: воркер обновляет heartbeat из фонового потока
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def submit(self, question: str, chat_id: Optional[int] = None, user_id: Optional[int] = None,
+               per_branch: bool = False) -> str:
+        job_id = new_run_id()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, payload, chat_id, user_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps({"question": question, "per_branch": per_branch}, ensure_ascii=False),
+             chat_id, user_id, time.time())
+        )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Забирает самое старое задание из очереди или возвращает None"""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            now = time.time()
+            db.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? "
+                "WHERE id = ?", (RUNNING, worker, now, now, row["id"])
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker: str):
+        self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+            (time.time(), job_id, worker, RUNNING)
+        )
+
+    # Результат записывается, только если задание все еще у этого воркера: после возврата
+    # в очередь (requeue_stale) его мог забрать другой воркер, и прежний не должен затирать его результат
+    def complete(self, job_id: str, worker: str, result: str, context: Optional[str] = None) -> bool:
+        """Сохраняет результат; False — задание уже не принадлежит воркеру"""
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, context = ?, finished_at = ? "
+            "WHERE id = ? AND worker = ? AND status = ?",
+            (DONE, result, context, time.time(), job_id, worker, RUNNING)
+        ).rowcount == 1
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = ?",
+            (FAILED, error, time.time(), job_id, worker, RUNNING)
+        ).rowcount == 1
+
+    def requeue_stale(self, stale_seconds: int = JOB_STALE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """Возвращает в очередь задания воркеров, переставших отмечаться; после max_attempts — ошибка"""
+        db = self._connect()
+        deadline = time.time() - stale_seconds
+        db.execute(
+            "UPDATE jobs SET status = ?, error = 'воркер не отвечает', finished_at = ? "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+            (FAILED, time.time(), RUNNING, deadline, max_attempts)
+        )
+        return db.execute(
+            "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, deadline)
+        ).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def position(self, job_id: str) -> int:
+        """Сколько заданий в очереди перед данным (0 — следующее)"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < "
+            "(SELECT created_at FROM jobs WHERE id = ?)", (QUEUED, job_id)
+        ).fetchone()[0]
+
+    def user_jobs(self, user_id: int, limit: int = 5) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def undelivered(self) -> List[Dict]:
+        """Завершенные задания, результат которых бот еще не отправил"""
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?) AND delivered = 0 ORDER BY finished_at", (DONE, FAILED)
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def mark_delivered(self, job_id: str):
+        self._connect().execute("UPDATE jobs SET delivered = 1 WHERE id = ?", (job_id,))
+
+    def _job(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job.update(json.loads(job.pop("payload")))
+        return job
@@ -0,0 +1,334 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+from event_log import get_logger
+from io_steps import Step, Steps, run_sync, run_async, sleep_step
+from tool_memo import tool_round
+
+load_dotenv()
+
+# ----------------------------
+# Устойчивый клиент LLM
+# ----------------------------
+logger = get_logger("llm_client")
+OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Одновременных запросов к одному провайдеру
+PROVIDER_LIMITS: Dict[str, int] = {
+    "openrouter": int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    # одновременно работающих crew (каждый делает последовательные запросы к LLM)
+    "crew": int(os.getenv("CREW_MAX_CONCURRENCY", "4")),
+}
+# Резервные модели, на которые переключается запрос, если основная недоступна
+FALLBACK_MODELS: List[str] = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("LLM_CIRCUIT_RESET", "60"))
+
+# Общий пул соединений: параллельные анализы переиспользуют TCP/TLS-сессии
+_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+HTTP_CLIENT = httpx.Client(limits=_HTTP_LIMITS, timeout=LLM_TIMEOUT)
+
+
+class LoopAsyncClient(httpx.AsyncClient):
+    """AsyncClient, отправляющий запросы через отдельный пул соединений каждого цикла событий.
+
+    Соединения httpx.AsyncClient привязаны к циклу, в котором открыты, а клиенты моделей
+    кешируются на процесс и работают и в цикле бота, и в asyncio.run других потоков.
+    Пул цикла создается при первом запросе и освобождается вместе с циклом
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._kwargs = kwargs
+        self._clients = weakref.WeakKeyDictionary()   # цикл событий -> httpx.AsyncClient
+        self._lock = threading.Lock()
+
+    def _loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = httpx.AsyncClient(**self._kwargs)
+            return client
+
+    async def send(self, request, **kwargs):
+        return await self._loop_client().send(request, **kwargs)
+
+
+HTTP_ASYNC_CLIENT = LoopAsyncClient(limits=_HTTP_LIMITS, timeout=LLM_TIMEOUT)
+
+
+class CircuitOpenError(RuntimeError):
+    """Модель временно отключена после серии ошибок"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Закрыт — пропускает запросы; открыт — отклоняет, пока не истечет reset_timeout.
+
+        После паузы (полуоткрытое состояние) пропускается один пробный запрос, остальные
+        отклоняются (и уходят на резервные модели), пока проба не завершится. Проба без
+        результата дольше reset_timeout (отмененный запрос) считается потерянной
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Проба завершилась ошибкой, не говорящей о доступности модели: следующий запрос — новая проба"""
+        with self._lock:
+            self.probe_started = None
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_SEMAPHORES: Dict[str, threading.BoundedSemaphore] = {}
+_ASYNC_SEMAPHORES: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _REGISTRY_LOCK:
+        return _BREAKERS.setdefault(model, CircuitBreaker())
+
+
+def get_semaphore(provider: str) -> threading.BoundedSemaphore:
+    with _REGISTRY_LOCK:
+        if provider not in _SEMAPHORES:
+            _SEMAPHORES[provider] = threading.BoundedSemaphore(PROVIDER_LIMITS.get(provider, 4))
+        return _SEMAPHORES[provider]
+
+
+def get_async_semaphore(provider: str) -> asyncio.Semaphore:
+    # семафор привязан к циклу событий, поэтому для каждого цикла создается свой
+    key = (id(asyncio.get_running_loop()), provider)
+    with _REGISTRY_LOCK:
+        if key not in _ASYNC_SEMAPHORES:
+            _ASYNC_SEMAPHORES[key] = asyncio.Semaphore(PROVIDER_LIMITS.get(provider, 4))
+        return _ASYNC_SEMAPHORES[key]
+
+
+def is_transient(error: Exception) -> bool:
+    """Ошибки, после которых имеет смысл повторить запрос"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                          openai.InternalServerError, httpx.TransportError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in (408, 409, 429, 500, 502, 503, 504)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Пауза из заголовков Retry-After / retry-after-ms ответа провайдера, в секундах"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Экспоненциальная пауза с джиттером; Retry-After провайдера имеет приоритет"""
+    delay = retry_after(error)
+    if delay is None:
+        delay = LLM_BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random())
+    return min(delay, LLM_BACKOFF_MAX)
+
+
+def limited_step(step: Step, provider: str) -> Step:
+    """Шаг, выполняемый не более чем в PROVIDER_LIMITS[provider] экземплярах одновременно"""
+    def call():
+        with get_semaphore(provider):
+            return step.call()
+
+    async def acall():
+        async with get_async_semaphore(provider):
+            return await step.acall()
+
+    return Step(call, acall)
+
+
+def retry_steps(step: Step, key: str, provider: str = "openrouter", max_attempts: int = LLM_MAX_RETRIES) -> Steps:
+    """Выполняет шаг с ограничением параллелизма, повторами и предохранителем.
+
+    Общая логика call_with_retries и acall_with_retries (см. io_steps)
+
+    Args:
+        step: Запрос к LLM или запуск crew
+        key: Ключ предохранителя — обычно имя модели
+        provider: Провайдер, для которого действует лимит одновременных запросов
+        max_attempts: Максимальное число попыток для временных ошибок
+    """
+    breaker = get_breaker(key)
+    step = limited_step(step, provider)
+    for attempt in range(max_attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Предохранитель для '{key}' открыт")
+        try:
+            result = yield step
+        except Exception as e:
+            if not is_transient(e):
+                breaker.release_probe()
+                raise
+            breaker.record_failure()
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt, e)
+            logger.warning("transient error, retrying", extra={"key": key, "error": type(e).__name__, "delay": round(delay, 1)})
+        else:
+            breaker.record_success()
+            return result
+        yield sleep_step(delay)
+
+
+def call_with_retries(fn: Callable[[], Any], key: str, provider: str = "openrouter",
+                      max_attempts: int = LLM_MAX_RETRIES) -> Any:
+    """Синхронный вызов fn через retry_steps"""
+    return run_sync(retry_steps(Step(fn, None), key, provider, max_attempts))
+
+
+async def acall_with_retries(fn: Callable[[], Awaitable[Any]], key: str, provider: str = "openrouter",
+                             max_attempts: int = LLM_MAX_RETRIES) -> Any:
+    """Асинхронный вариант call_with_retries: пауза не блокирует цикл событий"""
+    return await run_async(retry_steps(Step(None, fn), key, provider, max_attempts))
+
+
+def build_chat_model(model: str, temperature: float = 0.3, max_retries: int = LLM_MAX_RETRIES) -> ChatOpenAI:
+    """ChatOpenAI на общем пуле соединений.
+
+    Повторы внутри SDK (в т.ч. с учетом Retry-After) защищают вызовы агентов crewai,
+    которые идут в обход ResilientLLM
+    """
+    return ChatOpenAI(
+        model=model,
+        openai_api_base=OPENROUTER_API_BASE,
+        openai_api_key=os.getenv(os.getenv("API_KEY")),
+        temperature=temperature,
+        max_retries=max_retries,
+        http_client=HTTP_CLIENT,
+        http_async_client=HTTP_ASYNC_CLIENT
+    )
+
+
+class ResilientLLM:
+    """Прямые вызовы LLM с повторами, предохранителем и переключением на резервные модели"""
+
+    def __init__(self, models: List[str], provider: str = "openrouter"):
+        # без дублей, порядок = приоритет
+        self.models = list(dict.fromkeys(m for m in models if m))
+        self.provider = provider
+        self._clients: Dict[str, ChatOpenAI] = {}
+
+    def _client(self, model: str) -> ChatOpenAI:
+        if model not in self._clients:
+            # повторы выполняет call_with_retries, поэтому внутри SDK они отключены
+            self._clients[model] = build_chat_model(model, max_retries=0)
+        return self._clients[model]
+
+    def invoke_steps(self, messages: list) -> Steps:
+        """Запрос к моделям по порядку приоритета: следующая — если предыдущая недоступна"""
+        last_error: Optional[Exception] = None
+        for model in self.models:
+            client = self._client(model)
+            step = Step(partial(client.invoke, messages), partial(client.ainvoke, messages))
+            try:
+                return (yield from retry_steps(step, key=model, provider=self.provider))
+            except Exception as e:
+                if not (isinstance(e, CircuitOpenError) or is_transient(e)):
+                    raise
+                logger.warning("model unavailable, switching to fallback", extra={"model": model, "error": str(e)})
+                last_error = e
+        raise last_error
+
+    def invoke(self, messages: list) -> Any:
+        return run_sync(self.invoke_steps(messages))
+
+    async def ainvoke(self, messages: list) -> Any:
+        return await run_async(self.invoke_steps(messages))
+
+
+def crew_breaker_key(crew) -> str:
+    """Ключ предохранителя crew по моделям его агентов: сбои одной модели не отключают crew на других"""
+    models = set()
+    for agent in getattr(crew, 'agents', None) or []:
+        llm = getattr(agent, 'llm', None)
+        model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+        models.add(model if isinstance(model, str) else "default")
+    return "crew:" + "+".join(sorted(models or {"default"}))
+
+
+def _kickoff(crew) -> Any:
+    # у каждого запуска crew свой раунд учета вызовов инструментов (tool_memo)
+    with tool_round():
+        return crew.kickoff()
+
+
+async def _akickoff(crew) -> Any:
+    # kickoff_async выполняет crew в потоке с копией контекста — вместе с раундом
+    with tool_round():
+        return await crew.kickoff_async()
+
+
+def kickoff_steps(crew) -> Steps:
+    """Один запуск crew с лимитом CREW_MAX_CONCURRENCY и предохранителем.
+
+    Повторять запросы к LLM — задача SDK (build_chat_model) и ResilientLLM. Crew целиком
+    здесь не перезапускается: он заново выполнил бы уже завершенные задачи. Повтор с
+    контрольной точки выполняет вызывающий код (main.draft_steps)
+    """
+    step = Step(partial(_kickoff, crew), partial(_akickoff, crew))
+    return retry_steps(step, key=crew_breaker_key(crew), provider="crew", max_attempts=1)
+
+
+def kickoff_with_retries(crew) -> Any:
+    return run_sync(kickoff_steps(crew))
+
+
+async def akickoff_with_retries(crew) -> Any:
+    """Асинхронный запуск crew (kickoff_async выполняет kickoff в потоке, не блокируя цикл событий)"""
+    return await run_async(kickoff_steps(crew))
@@ -1,21 +1,45 @@
 from crewai import Agent, Task, Crew, Process
-from langchain_openai import ChatOpenAI
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import json
 from crewai.tools import tool
 from striprtf.striprtf import rtf_to_text
 import chardet
 from langchain.memory import ConversationBufferMemory
 import os
+import sys
+from contextlib import contextmanager
+from functools import partial
 from dotenv import load_dotenv
-import logging
 
 # Добавьте необходимые импорты в начале файла
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from data_store import (
+    load_companies, load_companies_async, review_index, review_snippet,
+    scoped_reviews, set_review_scope, reset_review_scope, review_scope,
+)
+from complaint_themes import complaint_themes_for
+from review_trends import branch_trends, PERIODS
+from branch_profiles import branch_profiles_for
+from risk_classifier import risk_summary
+from geo_index import get_geo_index, branches_for_question
+from context_budget import (
+    ContextBudget, fit_items, truncate_to_tokens, SYSTEM_PROMPT_BUDGET_TOKENS, TOOL_OUTPUT_BUDGET_TOKENS,
+)
+from quality_check import CriticVerdict, parse_verdict, try_parse_verdict, local_quality_check
+from model_router import get_llm, escalation_chain, escalation_steps
+from llm_client import backoff_delay, is_transient, kickoff_steps
+from io_steps import Step, Steps, run_sync, run_async, sleep_step, thread_step, spawn_step, wait_step
+from checkpoint import RunCheckpoint, new_run_id
+from event_log import setup_logging, get_logger, set_run_id, reset_run_id, VERBOSE
+from tool_memo import memoize_tools, start_tool_log, reset_tool_log, current_tool_log
+from profiling import start_profile, finish_profile, stage
+from pipeline_config import load_pipeline_config
+
 # Настройка окружения и логирования
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
+setup_logging()
+logger = get_logger("main")
 
 
 
@@ -37,6 +61,12 @@ class SharedMemory:
     def add_insight(self, key: str, insight: str):
         self.insights[key] = insight
     
+    def clear(self):
+        """Забывает историю и инсайты (перед анализом, не связанным с предыдущими)"""
+        self.memory.clear()
+        self.historical_data.clear()
+        self.insights.clear()
+
     def get_context(self) -> str:
         history = self.memory.load_memory_variables({})['history']
         insights = "\n".join([f"{k}: {v}" for k, v in self.insights.items()])
@@ -53,12 +83,8 @@ shared_memory = SharedMemory()
 # ----------------------------
 #  Инициализация LLM
 # ----------------------------
-llm = ChatOpenAI(
-    model=os.getenv("MODEL_NAME"),
-    openai_api_base="https://openrouter.ai/api/v1",
-    openai_api_key=os.getenv(os.getenv("API_KEY")),
-    temperature=0.3
-)
+# Модели выбираются по маршрутам из model_router (MODEL_ROUTES)
+llm = get_llm()
 
 
 # ----------------------------
@@ -66,7 +92,7 @@ llm = ChatOpenAI(
 # ----------------------------
 def readJson(file_path: str) -> Dict:
     # проверка наличия данных в локальном кеше
-    print(f"reading: {file_path}")
+    logger.debug("read file", extra={"path": file_path})
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
         shared_memory.add_historical_data("latest_comments", data)
@@ -74,16 +100,96 @@ def readJson(file_path: str) -> Dict:
 
 @tool
 def access_comments() -> List[Dict]:
-    """Возвращает клиентские комментарии о отделениях"""
-    print(f"access_comments")
-    return readJson("data/reviews3.json")
+    """Возвращает клиентские комментарии о отделениях. У каждого отзыва есть id для ссылок в отчете"""
+    logger.info("tool call", extra={"tool": "access_comments"})
+    reviews = scoped_reviews()
+    shared_memory.add_historical_data("latest_comments", reviews)
+    return fit_items(reviews, hint="Используйте search_reviews для поиска по тексту и отделению")
+
+@tool
+def search_reviews(query: str, org_id: int = 0) -> List[Dict]:
+    """Ищет отзывы по фрагменту текста (и, если указан, по orgId отделения).
+    Возвращает id, orgId, дату, оценку и фрагмент отзыва для ссылок вида [R-xxxxxxxxxxxxxxxx]"""
+    logger.info("tool call", extra={"tool": "search_reviews", "query": query, "org_id": org_id or None})
+    needle = query.lower()
+    return fit_items([
+        review_snippet(review, query)
+        for review in scoped_reviews()
+        if needle in review.get("comment", "").lower() and (not org_id or review.get("orgId") == org_id)
+    ], hint="Уточните запрос или укажите org_id")
+
+@tool
+def complaint_themes(org_id: int = 0) -> List[Dict]:
+    """Темы жалоб клиентов: повторяющиеся проблемы с числом отзывов по отделениям и примерами (id отзывов).
+    Если указан org_id, учитываются только жалобы этого отделения"""
+    logger.info("tool call", extra={"tool": "complaint_themes", "org_id": org_id or None})
+    scope = review_scope()
+    branch_ids = [org_id] if org_id else scope
+    if org_id and scope is not None and org_id not in scope:
+        branch_ids = []
+    return fit_items(complaint_themes_for(branch_ids), hint="Используйте search_reviews для отзывов конкретной темы")
+
+@tool
+def risk_categories(org_id: int = 0) -> Dict:
+    """Предварительная классификация жалоб по пяти категориям риска поведения (wrongPractices):
+    число отзывов по категориям и отделениям и id примеров. source у примера: llm — размечен LLM,
+    rules/model/hybrid — уверенное локальное решение, uncertain — требует проверки по тексту отзыва.
+    Если указан org_id, только по этому отделению"""
+    logger.info("tool call", extra={"tool": "risk_categories", "org_id": org_id or None})
+    reviews = [review for review in scoped_reviews() if not org_id or review.get("orgId") == org_id]
+    # без LLM: разметка неуверенных отзывов — офлайн-шаг python risk_classifier.py --label
+    return risk_summary(reviews, use_llm=False)
+
+@tool
+def review_trends(org_id: int = 0, period: str = "month") -> Dict:
+    """Динамика отзывов по отделениям: число отзывов, средняя оценка и доля негатива по периодам
+    (period: "week" или "month") со скользящими средними, а также статистически значимые
+    всплески негатива и падения оценки. Если указан org_id, только по этому отделению"""
+    logger.info("tool call", extra={"tool": "review_trends", "org_id": org_id or None, "period": period})
+    if period not in PERIODS:
+        period = "month"
+    scope = review_scope()
+    branch_ids = [org_id] if org_id else (list(scope) if scope is not None else None)
+    trends = branch_trends(branch_ids, period)
+    trends["branches"] = fit_items(trends["branches"], hint="Укажите org_id для динамики отдельного отделения")
+    return trends
+
+@tool
+def branch_profile(org_id: int = 0) -> List[Dict]:
+    """Готовый профиль отделения: название и адрес, число отзывов, средняя оценка и распределение оценок,
+    доли тональности, основные темы жалоб, аномалии и наиболее серьезные жалобы (id отзывов).
+    Если org_id не указан — профили всех отделений анализа"""
+    logger.info("tool call", extra={"tool": "branch_profile", "org_id": org_id or None})
+    scope = review_scope()
+    if org_id:
+        branch_ids = [org_id] if scope is None or org_id in scope else []
+    else:
+        branch_ids = sorted(scope) if scope is not None else None
+    return fit_items(branch_profiles_for(branch_ids), hint="Укажите org_id для профиля отдельного отделения")
 
 @tool
 def access_companies() -> List[Dict]:
     """Возвращает общие данные об отделениях для которых существуют комментарии"""
-    print(f"access_companies")
+    logger.info("tool call", extra={"tool": "access_companies"})
     return readJson("data/companies3.json")
 
+@tool
+def find_branches_in_radius(latitude: float, longitude: float, radius_km: float) -> List[Dict]:
+    """Возвращает отделения в радиусе radius_km километров от точки (широта, долгота), по возрастанию расстояния"""
+    return get_geo_index().within_radius(latitude, longitude, radius_km)
+
+@tool
+def find_nearest_branches(latitude: float, longitude: float, count: int = 3) -> List[Dict]:
+    """Возвращает count ближайших к точке (широта, долгота) отделений с расстоянием в км"""
+    return get_geo_index().nearest(latitude, longitude, count)
+
+@tool
+def find_branches_in_bbox(min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float) -> List[Dict]:
+    """Возвращает отделения внутри прямоугольника, заданного минимальными и максимальными широтой и долготой"""
+    return get_geo_index().in_bbox(min_latitude, min_longitude, max_latitude, max_longitude)
+
+GEO_TOOLS = [find_branches_in_radius, find_nearest_branches, find_branches_in_bbox]
+
 @tool
 def save_insight(insight: str) -> str:
     """Сохраняет ключевой инсайт в память"""
@@ -94,12 +200,12 @@ def save_insight(insight: str) -> str:
 @tool
 def access_risk_methodology() -> str:
     """Возвращает ключевые положения методологии 716-П по операционному риску"""
-    return read_text_file("data/716p.txt")
+    return truncate_to_tokens(read_text_file("data/716p.txt"), TOOL_OUTPUT_BUDGET_TOKENS)
 
 @tool
 def access_wrong_practices() -> str:
     """Возвращает информацию о недобросовестных практиках"""
-    return read_text_file("data/wrongPractices.txt")
+    return truncate_to_tokens(read_text_file("data/wrongPractices.txt"), TOOL_OUTPUT_BUDGET_TOKENS)
 
 # ----------------------------
 # Вспомогательные функции
@@ -118,15 +224,21 @@ def read_rtf(file_path: str) -> str:
             decoded_content = raw_content.decode('cp1251', errors='replace')
     return rtf_to_text(decoded_content)
 
-def generate_plan(question: str) -> List[str]:
-    # Получение контекста из памяти
-    context = shared_memory.get_context()
+# Агенты, задачи и план по умолчанию описаны в config/pipeline.json;
+# файл разбирается и проверяется один раз при импорте
+PIPELINE = load_pipeline_config()
+DEFAULT_PLAN = list(PIPELINE.default_plan)
+
+def build_plan_prompt(question: str) -> list:
+    # Получение контекста из памяти; при нехватке бюджета сокращается в первую очередь
+    context = ContextBudget("plan").add(
+        "request", f"**Запрос пользователя**: {question}", required=True
+    ).add(
+        "memory", f"**Контекст**:\n{shared_memory.get_context()}"
+    ).assemble()
     
     # Шаблон запроса к LLM
-    prompt = [HumanMessage(content=f"""
-    **Запрос пользователя**: {question}
-    
-    **Контекст**: 
+    return [HumanMessage(content=f"""
     {context}
     
     **Доступные действия**:
@@ -139,14 +251,24 @@ def generate_plan(question: str) -> List[str]:
     Сгенерируй JSON-список задач в правильном порядке. Пример:
     {{"tasks": ["risk_analysis", "insights", "report"]}}
     """)]
-    # Запрос к LLM
-    try:
-        response = llm.invoke(prompt).content
-        print(response)
-        plan = json.loads(response)["tasks"]
-        return plan
-    except:
-        return ["data_analysis", "risk_analysis", "insights", "report", "critique"]  # fallback
+
+def parse_plan(response) -> List[str]:
+    logger.debug("plan response", extra={"content": response.content})
+    return json.loads(response.content)["tasks"]
+
+def plan_steps(question: str) -> Steps:
+    # Запрос к быстрой модели; при невалидном JSON — эскалация на более сильную
+    with stage("plan"):
+        try:
+            return (yield from escalation_steps("planner", build_plan_prompt(question), parse_plan))
+        except Exception:
+            return DEFAULT_PLAN  # fallback
+
+def generate_plan(question: str) -> List[str]:
+    return run_sync(plan_steps(question))
+
+async def generate_plan_async(question: str) -> List[str]:
+    return await run_async(plan_steps(question))
 
 # ----------------------------
 # Фабрика агентов с памятью
@@ -156,195 +278,382 @@ def create_agent(
     goal: str,
     backstory: str,
     tools: list,
-    allow_delegation: bool = False
+    allow_delegation: bool = False,
+    route: str = "default",
+    tier: Optional[str] = None
 ) -> Agent:
     return Agent(
         role=role,
         goal=goal,
         backstory=backstory,
-        tools=tools,
-        llm=llm,
-        verbose=True,
+        tools=memoize_tools(tools, role),
+        llm=get_llm(route, tier),
+        verbose=VERBOSE,
         memory=True,
-        system_template=f"{backstory}\n\nТекущий контекст:\n{shared_memory.get_context()}",
+        system_template=ContextBudget(f"agent:{role}", SYSTEM_PROMPT_BUDGET_TOKENS).add(
+            "backstory", backstory, required=True
+        ).add(
+            "memory", f"Текущий контекст:\n{shared_memory.get_context()}"
+        ).assemble(),
         allow_delegation=allow_delegation
     )
 
 # ----------------------------
-# Определение агентов
+# Определение агентов (config/pipeline.json)
 # ----------------------------
-senior_analyst = create_agent(
-    role='Старший аналитик данных',
-    goal='Анализировать данные отзывов и выявлять закономерности, тенденции, ключевые метрики, формировать выводы и рекомендации для улучшения сервиса и принятия решений бизнесом',
-    backstory='Опытный аналитик с 10-летним стажем в банковской сфере, работал в крупнейших российских и международных банках, занимал позицию главного бизнес аналитика в управлении развития розничного бизнеса, кандидат экономических наук, очень ответственный и внимательный к деталям, избегает поверхностных выводов, тщательно проверяет гипотезы',
-    tools=[access_comments, access_companies, save_insight]
-)
+TOOLS = {tool.name: tool for tool in [
+    access_comments, search_reviews, complaint_themes, risk_categories, review_trends, branch_profile,
+    access_companies, save_insight, access_risk_methodology, access_wrong_practices,
+] + GEO_TOOLS}
+PIPELINE.check_tools(TOOLS)
 
-risk_assistant = create_agent(
-    role='Риск-ассистент',
-    goal='Провести глубокий всесторонний анализ на основе отзывов клиентов, идентифицировать риски поведения (риски недобросовестного поведения), которые являются подвидом операционного риска и отражают применение недобросовестных практик от сотрудника Банка к клиенту. Факт применения недобросовестной практики – это и есть риск поведения. Строго используй методологию 716-П',
-    backstory='Специалист по управлению рисками с глубокими знаниями методологии 716-П и значительным опытом выявления операционных рисков, в частности, рисков поведения, в банковской сфере. Является автором методики по идентификации, оценке и мониторингу операционного риска, в особенности риска поведения, бывший руководитель отдела риск-менеджмента крупнейших российских банков, выстроил систему мониторинга риска поведения, сократил количество обращений клиентов на недобросовестные практики продаж на 50 %',
-    tools=[access_comments, access_companies, access_risk_methodology, access_wrong_practices, save_insight]
-)
+def create_config_agent(name: str, tier: Optional[str] = None) -> Agent:
+    """Агент из конфигурации с инструментами из TOOLS"""
+    return create_agent(**PIPELINE.agent_kwargs(name, TOOLS), tier=tier)
 
-insights_agent = create_agent(
-    role='Агент выявления инсайтов',
-    goal='Выявлять ключевые позитивные и негативные особенности по каждому отделению банка, формулировать краткие информативные выводы',
-    backstory='Эксперт по интерпретации данных, способный выделять наиболее значимые аспекты из большого объема информации и представлять их в сжатом виде, возглавлял аналитические отделы в крупных банках, имеет большой опыт в аналитике данных и выявлении причинно-следственных связей, участвовал в автоматизации алгоритма рекомендаций по принятию управленческих решений.',
-    tools=[save_insight]
-)
-
-report_builder = create_agent(
-    role='Агент построения отчетов',
-    goal='На основе данных от других агентов создавать качественные, понятные и структурированные отчеты, отражающие ключевые показатели для принятия оперативных и стратегических решений',
-    backstory='Профессиональный технический писатель с большим опытом подготовки аналитических отчетов для высшего руководства банка, имеет глубокие знания в области построения отчетности, высокий уровень ответственности, внимательность к деталям, был руководителем отдела разработки и внедрения отчетности в Центральном Банке',
-    tools=[save_insight]
-)
-
-critic = create_agent(
-    role='Критик',
-    goal='Оценивать качество и полноту выводов, предоставленных другими агентами, проводя тщательный анализ по всем аспектам, давать проработанные развернутые оценки',
-    backstory='Независимый эксперт с критическим мышлением, отвечающий за контроль качества аналитических материалов перед их представлением руководству. Имеет глубокие знания и богатый опыт в обработке и интерпретации данных и построении аналитики, отличается вниманием к деталям и глубокой проработкой сделанных выводов, возглавлял крупное аналитическое агентство',
-    tools=[]
-)
+def create_run_agents() -> Dict[str, Agent]:
+    """Агенты одного запуска.
 
-planner = create_agent(
-    role='Планировщик задач',
-    goal='Генерировать оптимальный порядок задач для решения запроса',
-    backstory='Эксперт в анализе запросов и построении рабочих процессов. Использует данные из памяти и знания предметной области.',
-    tools=[access_comments, access_companies, save_insight],
-    allow_delegation=False
-)
+    Agent хранит состояние выполнения (память, кеш инструментов), поэтому
+    одновременные анализы (async в процессе бота) не должны делить агентов
+    """
+    names = PIPELINE.pipeline_agents("analysis") + [PIPELINE.tasks["critique"].agent, PIPELINE.tasks["refine"].agent]
+    return {name: create_config_agent(name) for name in dict.fromkeys(names)}
 
 # ----------------------------
 # Определение задач
 # ----------------------------
-def create_analysis_tasks(question: str) -> List[Task]:
-    
-    plan = generate_plan(question)
-
-    data_analysis_task = Task(
-            description=f"Анализ данных отзывов. Вопрос: {question}. Сформируйте инсайты на основе анализа данных и сохраните их через save_insight(insight='ваш_текст')",
-            agent=senior_analyst,
-            expected_output="Отчет с рейтингами и динамикой оценок"
-        )
-
-    risk_analysis_task = Task(
-            description=f"""На основе отзывов клиентов идентифицируйте потенциальные риски поведения 
-        и случаи применения сотрудниками банка недобросовестных практик в банковских отделениях.
-        Вопрос для анализа: {question}
-        
-        Используйте методологию 716-П и примеры недобросовестных практик для классификации выявленных рисков.
-        Особое внимание уделите:
-        1. Жалобам на навязывание услуг, связанные продажи
-        2. Скрытым комиссиям и платежам
-        3. Неполному, непрозрачному информированию клиентов, введению в заблуждение относительно условий продукта
-        4. Подключению продуктов клиентам без их ведома
-        5. Продаже неподходящих продуктов клиентам
-        Очереди, долгое обслуживание, отсутствие кофемашин, грубое и предвзятоез общение сотрудников банка с клиентами, неправильный график работы негативно характеризуют отделения, но не являются недобросовестными практиками и не относятся к риску поведения.
-        Сформируйте инсайты на основе анализа данных и сохраните их через save_insight(insight='ваш_текст')""",
-            agent=risk_assistant,
-            expected_output="""Отчет о выявленных риска поведения, содержащий:
-        - Классификацию недобросовестных практик (рисков) по методологии 716-П
-        - Список наиболее часто совершенных инцидентов риска поведения
-        - Отделения с наибольшим количеством жалоб и обращений клиентов
-        - Рекомендации по снижению рисков и недобросовестных практик
-        """)
-
-    insights_task = Task(
-            description=f"""Формулировка ключевых выводов. Обратите внимание на:
-        1. Уникальные особенности отделения
-        2. Основные проблемы и преимущества
-        3. Рекомендации по улучшению. Вопрос: {question}
-        Сформируйте инсайты на основе анализа данных и сохраните их через save_insight(insight='ваш_текст')""",
-            agent=insights_agent,
-            expected_output="Краткий отчет с сильными и слабыми сторонами"
-        )
-
-    report_task = Task(
-            description=f"""На основе данных от всех аналитиков подготовьте итоговый отчет, 
-        отвечающий на вопрос: {question}
-        Отчет должен быть:
-        1. Структурированным и понятным
-        2. Содержать ключевые выводы
-        3. Включать рекомендации для руководства
-        4. Быть адаптирован для презентации топ-менеджменту""",
-            agent=report_builder,
-            expected_output="""Профессиональный отчет в формате Markdown для вывода в телеграм, содержащий:
-        - Ответ на исходный вопрос
-        - Ключевые выводы
-        - Рекомендации по улучшению""",
-            output_file="report.md",
-            context=[data_analysis_task, risk_analysis_task]
-        )
-
-    critique_task = Task(
-            description=f""" Критически оцените качество аналитического отчета, подготовленного командой.
-        Проверьте:
-        1. Полноту ответа на вопрос: {question}
-        2. Обоснованность выводов""",
-            agent=critic,
-            expected_output="Либо 'APPROVED', либо список замечаний"
-        )
-    
-    task_templates = {
-        "data_analysis": data_analysis_task,
-        "risk_analysis": risk_analysis_task,
-        "insights": insights_task,
-        "report": report_task,
-        "critique": critique_task
-    }
-    
-    # Сборка задач по плану
-    tasks = []
-    for task_name in plan:
-        if task_name in task_templates:
-            tasks.append(task_templates[task_name])
+def create_task(name: str, agents: Dict[str, Agent], built: Optional[Dict[str, Task]] = None, **inputs) -> Task:
+    """Задача по шаблону из конфигурации.
+
+    Task создается заново на каждый запуск (crewai хранит в нем результат, а
+    restore_completed_tasks дополняет описание), шаблон — общий. Зависимости
+    берутся из уже созданных задач built; не вошедшие в план пропускаются
+    """
+    spec = PIPELINE.tasks[name]
+    kwargs = spec.render(**inputs)
+    if spec.context is not None:
+        kwargs["context"] = [built[dependency] for dependency in spec.context if dependency in (built or {})]
+    return Task(agent=agents[spec.agent], **kwargs)
+
+def create_analysis_tasks(question: str, plan: List[str], agents: Dict[str, Agent]) -> Dict[str, Task]:
+
+    # Сборка задач по плану; критика выполняется отдельным шагом после отчета
+    names = [name for name in plan if name in PIPELINE.pipelines["analysis"] and name != "report"] + ["report"]
+    tasks: Dict[str, Task] = {}
+    for name in dict.fromkeys(names):
+        tasks[name] = create_task(name, agents, tasks, question=question)
 
     shared_memory.add_historical_data("latest_plan", {"plan": plan, "question": question})
     
     return tasks
 
-# ----------------------------
-# Основная логика анализа
-# ----------------------------
-def analyze_bank_reviews(question: str) -> str:
-    max_revisions = 2
-    current_revision = 0
-    approved = False
-    final_report = None
-
-    while not approved and current_revision < max_revisions:
-        print("Создание задачи на анализ")
-        tasks = create_analysis_tasks(question)
-        print("create_analysis_tasks done")
-        print(current_revision)
-        if current_revision > 0:
-            print(current_revision)
-            tasks[3].description += f"\n\nЗАМЕЧАНИЯ ИЗ ПРЕДЫДУЩЕЙ ИТЕРАЦИИ:\n{shared_memory.get_context()}"
-        print("crew")
-        crew = Crew(
-            agents=[senior_analyst, risk_assistant, insights_agent, report_builder, critic],
-            tasks=tasks,
-            process=Process.sequential,
-            verbose=True
+def create_critique_task(question: str, report: str, agent: Agent) -> Task:
+    spec = PIPELINE.tasks["critique"].render(question=question)
+    return Task(
+            description=ContextBudget("task:critique").add("instructions", spec["description"], required=True).add(
+                "report", f"ОТЧЕТ:\n{report}", priority=1
+            ).assemble(),
+            agent=agent,
+            expected_output=spec["expected_output"],
+            output_pydantic=CriticVerdict
         )
-        print("crew.kickoff")
-        result = crew.kickoff()
-        print("tasks_output")
-        tasks_output = getattr(result, 'tasks_output', [None] * 5)
-        print("report")
-        report = str(tasks_output[3]) if tasks_output[3] else ""
-        critique = str(tasks_output[4]) if tasks_output[4] else ""
-
-        if "APPROVED" in critique:
-            approved = True
-            final_report = report
+
+def create_refinement_task(question: str, report: str, agent: Agent, feedback: Optional[str] = None) -> Task:
+    spec = PIPELINE.tasks["refine"].render(question=question)
+    budget = ContextBudget("task:refine").add("instructions", spec["description"], required=True)
+    if feedback:
+        budget.add("feedback", f"ЗАМЕЧАНИЯ КРИТИКА К ПРЕДЫДУЩЕЙ ВЕРСИИ:\n{feedback}", priority=2)
+    budget.add("report", f"ОТЧЕТ:\n{report}", priority=1)
+    return Task(
+            description=budget.assemble(),
+            agent=agent,
+            expected_output=spec["expected_output"]
+        )
+
+def refine_steps(question: str, report: str, agents: Dict[str, Agent], feedback: Optional[str] = None) -> Steps:
+    """Следующая версия отчета: самопроверка report_builder и, если есть, замечания критика"""
+    agent = agents[PIPELINE.tasks["refine"].agent]
+    task = create_refinement_task(question, report, agent, feedback)
+    with stage("refine"):
+        yield from kickoff_steps(Crew(agents=[agent], tasks=[task], process=Process.sequential, verbose=VERBOSE))
+    return str(task.output or report)
+
+def critic_for_tier(tier: str, tiers: List[str], agents: Dict[str, Agent]) -> Agent:
+    # критик запуска для первого уровня, временный агент для эскалации
+    name = PIPELINE.tasks["critique"].agent
+    if tier == tiers[0]:
+        return agents[name]
+    return create_config_agent(name, tier=tier)
+
+def review_report_steps(question: str, report: str, agents: Dict[str, Agent]) -> Steps:
+    """Проверка отчета: сначала локально, критик вызывается только в неоднозначных случаях"""
+    reviews = yield thread_step(scoped_reviews)
+    companies = yield Step(load_companies, load_companies_async)
+    verdict = local_quality_check(report, reviews, companies, review_index())
+    if verdict is not None:
+        logger.info("local quality check", extra={"approved": verdict.approved})
+        return verdict
+
+    # критик на быстрой модели; если вердикт не соответствует схеме — повтор на более сильной
+    output = None
+    tiers = escalation_chain("critic")
+    for tier in tiers:
+        agent = critic_for_tier(tier, tiers, agents)
+        crew = Crew(agents=[agent], tasks=[create_critique_task(question, report, agent)], process=Process.sequential, verbose=VERBOSE)
+        result = yield from kickoff_steps(crew)
+        output = getattr(result, 'tasks_output', [None])[0]
+        verdict = try_parse_verdict(output)
+        if verdict is not None:
+            return verdict
+        logger.warning("critic verdict does not match schema", extra={"tier": tier})
+    return parse_verdict(output)
+
+def restore_completed_tasks(
+    tasks: Dict[str, Task],
+    checkpoint: RunCheckpoint,
+    revision: int,
+    feedback: Optional[str] = None
+) -> List[Task]:
+    """Возвращает задачи, которые еще нужно выполнить в ревизии.
+
+    Результаты уже выполненных задач берутся из контрольной точки и подставляются
+    в описание оставшихся задач вместо контекста crew. Описание каждой задачи
+    собирается в пределах бюджета токенов: сначала сокращаются результаты
+    предыдущих задач, затем замечания критика
+    """
+    completed = {name: checkpoint.load_task_output(revision, name) for name in tasks}
+    completed = {name: output for name, output in completed.items() if output is not None}
+    pending = []
+    for name, task in tasks.items():
+        if name in completed:
+            continue
+        if isinstance(task.context, list):
+            restored = [n for n, t in tasks.items() if n in completed and t in task.context]
+            task.context = [t for t in task.context if t not in [tasks[n] for n in restored]]
         else:
-            shared_memory.add_conversation("Critic", critique)
-            current_revision += 1
+            # без явного контекста задача получает результаты всех предыдущих задач
+            restored = [n for n in completed if list(tasks).index(n) < list(tasks).index(name)]
+        budget = ContextBudget(f"task:{name}").add("description", task.description, required=True)
+        if feedback and name == "report":
+            budget.add("feedback", f"ЗАМЕЧАНИЯ ИЗ ПРЕДЫДУЩЕЙ ИТЕРАЦИИ:\n{feedback}", priority=2)
+        for restored_name in restored:
+            budget.add(f"result:{restored_name}", f"РЕЗУЛЬТАТ ЗАДАЧИ {restored_name}:\n{completed[restored_name]}", priority=1)
+        task.description = budget.assemble()
+        task.callback = partial(checkpoint.save_task_output, revision, name)
+        pending.append(task)
+    return pending
+
+def region_scope(question: str) -> Tuple[str, Optional[List[int]]]:
+    """Предварительный отбор отделений по району из вопроса (без вызова LLM).
+
+    Returns:
+        Вопрос для задач (с пометкой о районе) и id отделений района или None, если район не указан
+    """
+    region = branches_for_question(question)
+    if region is None:
+        return question, None
+    region_name, branch_ids = region
+    companies = load_companies()
+    names = ", ".join(companies[org_id]["name"] for org_id in branch_ids) or "нет отделений"
+    logger.info("region scope", extra={"region": region_name, "branch_ids": branch_ids})
+    return f"{question}\n(Анализ ограничен отделениями района «{region_name}»: {names})", branch_ids
+
+@contextmanager
+def run_context(run_id: str):
+    """Состояние одного запуска: run_id в журнале, учет вызовов инструментов и профилирование (PROFILE_RUNS)"""
+    run_token = set_run_id(run_id)
+    tool_token = start_tool_log()
+    profile_token = start_profile()
+    try:
+        with stage("run"):
+            yield
+    finally:
+        logger.info("tool usage", extra={"tool_usage": current_tool_log().report()})
+        reset_tool_log(tool_token)
+        profile = finish_profile(profile_token, RunCheckpoint(run_id).path)
+        if profile is not None:
+            logger.info("run profile", extra={"profile": profile})
+        reset_run_id(run_token)
+
+def analyze_bank_reviews(question: str, per_branch: bool = False, run_id: Optional[str] = None) -> str:
+    # все события журнала в рамках анализа помечаются run_id запуска
+    run_id = run_id or new_run_id()
+    with run_context(run_id):
+        with stage("scope"):
+            task_question, branch_ids = region_scope(question)
+        if per_branch:
+            # отчет собирается из секций, рассчитанных по каждому отделению отдельно
+            from branch_fanout import analyze_by_branch
+            return analyze_by_branch(question, branch_ids=branch_ids)
+
+        # инструменты видят только отзывы отделений района из вопроса
+        scope_token = set_review_scope(branch_ids)
+        try:
+            return run_revisions(question, task_question, run_id)
+        finally:
+            reset_review_scope(scope_token)
+
+# Ревизий отчета (прогон задач + проверка критиком) на один запуск
+MAX_REVISIONS = 2
+# Запусков crew ревизии, если временная ошибка пробилась через повторы запросов к LLM
+CREW_MAX_ATTEMPTS = int(os.getenv("CREW_MAX_ATTEMPTS", "2"))
+# Спекулятивная доработка: следующая версия отчета готовится, пока критик проверяет текущую
+SPECULATIVE_REVISIONS = os.getenv("SPECULATIVE_REVISIONS", "false").lower() in ("1", "true", "yes")
+
+def draft_steps(task_question: str, checkpoint: RunCheckpoint, revision: int, agents: Dict[str, Agent]) -> Steps:
+    """Полный прогон задач ревизии (план -> задачи -> crew); возвращает отчет"""
+    plan = checkpoint.load_plan(revision)
+    if plan is None:
+        plan = yield from plan_steps(task_question)
+        checkpoint.save_plan(revision, plan)
+    for attempt in range(CREW_MAX_ATTEMPTS):
+        with stage("tasks"):
+            tasks = create_analysis_tasks(task_question, plan, agents)
+        pending = start_revision(tasks, checkpoint, revision, plan)
+        if not pending:
+            break
+        try:
+            with stage("crew"):
+                yield from kickoff_steps(analysis_crew(pending, agents))
+            break
+        except Exception as e:
+            if not is_transient(e) or attempt == CREW_MAX_ATTEMPTS - 1:
+                raise
+            delay = backoff_delay(attempt, e)
+            logger.warning("crew failed, resuming from checkpoint",
+                           extra={"revision": revision, "error": type(e).__name__, "delay": round(delay, 1)})
+        # повтор продолжает с контрольной точки: задачи, завершенные до ошибки, не выполняются заново
+        yield sleep_step(delay)
+    return checkpoint.load_task_output(revision, "report") or str(tasks["report"].output or "")
+
+def start_revision(tasks: Dict[str, Task], checkpoint: RunCheckpoint, revision: int, plan: List[str]) -> List[Task]:
+    # раунд учета вызовов инструментов начинается при каждом запуске crew (kickoff_steps)
+    logger.info("revision started", extra={"revision": revision, "plan": plan})
+    previous_verdict = checkpoint.load_verdict(revision - 1) if revision > 0 else None
+    feedback = CriticVerdict(**previous_verdict).as_feedback() if previous_verdict is not None else None
+    return restore_completed_tasks(tasks, checkpoint, revision, feedback)
+
+def analysis_crew(tasks: List[Task], agents: Dict[str, Agent]) -> Crew:
+    return Crew(
+        agents=[agents[name] for name in PIPELINE.pipeline_agents("analysis")],
+        tasks=tasks,
+        process=Process.sequential,
+        verbose=VERBOSE
+    )
+
+def review_draft_steps(task_question: str, report: str, checkpoint: RunCheckpoint, revision: int,
+                       agents: Dict[str, Agent]) -> Steps:
+    """Вердикт по отчету ревизии: из контрольной точки или от критика"""
+    saved_verdict = checkpoint.load_verdict(revision)
+    if saved_verdict is not None:
+        verdict = CriticVerdict(**saved_verdict)
+    else:
+        with stage("critic"):
+            verdict = yield from review_report_steps(task_question, report, agents)
+        checkpoint.save_verdict(revision, verdict.model_dump())
+    logger.info("revision reviewed", extra={"revision": revision, "approved": verdict.approved, "source": verdict.source})
+    return verdict
+
+def finish_run(checkpoint: RunCheckpoint, report: str, approved: bool, revisions: int) -> str:
+    result = report if approved else f"{report}\n\n⚠️ Достигнут лимит доработок"
+    checkpoint.save_tool_usage(current_tool_log().report())
+    checkpoint.save_final(result)
+    logger.info("run finished", extra={"approved": approved, "revisions": revisions})
+    return result
+
+def revision_steps(question: str, task_question: str, run_id: Optional[str] = None) -> Steps:
+    """Цикл отчет -> проверка -> доработка с сохранением контрольных точек"""
+    if SPECULATIVE_REVISIONS:
+        return (yield from speculative_revision_steps(question, task_question, run_id))
+    # план, результаты задач и вердикты сохраняются по мере готовности
+    checkpoint = RunCheckpoint(run_id, question)
+    logger.info("run started", extra={"question": question})
+    agents = create_run_agents()
+
+    report = ""
+    for revision in range(MAX_REVISIONS):
+        report = yield from draft_steps(task_question, checkpoint, revision, agents)
+        verdict = yield from review_draft_steps(task_question, report, checkpoint, revision, agents)
+        if verdict.approved:
+            return finish_run(checkpoint, report, True, revision + 1)
+        shared_memory.add_conversation("Critic", verdict.as_feedback())
+    return finish_run(checkpoint, report, False, MAX_REVISIONS)
+
+def speculative_revision_steps(question: str, task_question: str, run_id: Optional[str] = None) -> Steps:
+    """Спекулятивный цикл: пока критик проверяет версию N, report_builder уже готовит заготовку N+1.
+
+    Заготовка — доработка отчета по самопроверке, без повторного прогона всех задач;
+    замечаний критика к версии N она еще не видит. Если критик отклонил версию N,
+    заготовка дорабатывается по его замечаниям и становится версией N+1; если заготовка
+    завершилась ошибкой, по замечаниям дорабатывается сама версия N. Если одобрил —
+    заготовка отменяется: уже запущенный crew при этом не прерывается (см. io_steps.Background),
+    он дорабатывает в фоне, и его результат не используется
+    """
+    checkpoint = RunCheckpoint(run_id, question)
+    logger.info("run started", extra={"question": question, "speculative": True})
+    agents = create_run_agents()
+
+    report = yield from draft_steps(task_question, checkpoint, 0, agents)
+    for revision in range(MAX_REVISIONS):
+        candidate = None
+        if revision + 1 < MAX_REVISIONS and checkpoint.load_task_output(revision + 1, "report") is None:
+            candidate = yield spawn_step(partial(refine_steps, task_question, report, agents))
+        try:
+            verdict = yield from review_draft_steps(task_question, report, checkpoint, revision, agents)
+        except BaseException:
+            if candidate is not None:
+                candidate.cancel()
+            raise
+        if verdict.approved:
+            if candidate is not None:
+                candidate.cancel()
+                # начатый crew доработает в фоне; его результат не используется и не сохраняется
+                logger.info("speculative refinement cancelled", extra={"revision": revision + 1})
+            return finish_run(checkpoint, report, True, revision + 1)
+        feedback = verdict.as_feedback()
+        shared_memory.add_conversation("Critic", feedback)
+        if candidate is None:
+            report = checkpoint.load_task_output(revision + 1, "report") or report
+            continue
+        try:
+            draft = yield wait_step(candidate)
+        except Exception as e:
+            # заготовка не получилась — ревизия дорабатывает текущую версию, как без спекуляции
+            logger.warning("speculative refinement failed, refining current report",
+                           extra={"revision": revision + 1, "error": str(e)})
+            draft = report
+        # заготовка готовилась без замечаний к версии N — дорабатываем ее по ним
+        report = yield from refine_steps(task_question, draft, agents, feedback)
+        checkpoint.save_task_output(revision + 1, "report", report)
+    return finish_run(checkpoint, report, False, MAX_REVISIONS)
+
+def run_revisions(question: str, task_question: str, run_id: Optional[str] = None) -> str:
+    return run_sync(revision_steps(question, task_question, run_id))
+
+def resume_analysis(run_id: str) -> str:
+    """Продолжает прерванный запуск с первой невыполненной задачи"""
+    question = RunCheckpoint(run_id).meta["question"]
+    return analyze_bank_reviews(question, run_id=run_id)
+
+async def analyze_bank_reviews_async(question: str, run_id: Optional[str] = None) -> str:
+    """Асинхронный вариант analyze_bank_reviews для вызова из обработчиков бота.
+
+    Запросы к LLM и запуск crew не блокируют цикл событий, поэтому несколько
+    анализов выполняются одновременно в одном цикле
+    """
+    run_id = run_id or new_run_id()
+    with run_context(run_id):
+        with stage("scope"):
+            task_question, branch_ids = region_scope(question)
+        scope_token = set_review_scope(branch_ids)
+        try:
+            return await run_revisions_async(question, task_question, run_id)
+        finally:
+            reset_review_scope(scope_token)
 
-    return final_report if approved else f"{report}\n\n⚠️ Достигнут лимит доработок"
+async def run_revisions_async(question: str, task_question: str, run_id: Optional[str] = None) -> str:
+    return await run_async(revision_steps(question, task_question, run_id))
 
 # ----------------------------
 # Запуск системы
@@ -353,7 +662,11 @@ if __name__ == "__main__":
     try:
         print("🚀 Запуск анализа...")
         shared_memory.add_conversation("System", "Инициализация анализа")
-        result = analyze_bank_reviews("Проанализируйте данные из клиентских комментариев и найдите инциденты операционного риска в отделениях")
+        if len(sys.argv) > 2 and sys.argv[1] == "--resume":
+            result = resume_analysis(sys.argv[2])
+        else:
+            result = analyze_bank_reviews("Проанализируйте данные из клиентских комментариев и найдите инциденты операционного риска в отделениях")
         print("\n📊 Результат:", result)
     except Exception as e:
+        logger.exception("analysis failed")
         print(f"❌ Ошибка: {e}")
\ No newline at end of file
@@ -0,0 +1,205 @@
+import asyncio
+import io
+import os
+import re
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InputFile
+from telegram.error import RetryAfter
+
+# ----------------------------
+# Разбивка длинных отчетов на сообщения
+# ----------------------------
+TELEGRAM_MAX_LENGTH = 4000
+FENCE = "```"
+# ограничитель блока кода стоит на отдельной строке (после открывающего — только язык);
+# ``` внутри строки текста блок кода не открывает
+FENCE_LINE = re.compile(r"^\s*```[\w+#.-]*\s*$")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+def _blocks(text: str) -> List[Tuple[str, List[str]]]:
+    """Делит Markdown на блоки (code | table | text) за один проход по строкам"""
+    blocks: List[Tuple[str, List[str]]] = []
+    kind, lines = None, []
+
+    def flush():
+        nonlocal kind, lines
+        if lines:
+            blocks.append((kind, lines))
+        kind, lines = None, []
+
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if kind == "code":
+            lines.append(line)
+            if stripped == FENCE:
+                flush()
+        elif FENCE_LINE.match(line):
+            flush()
+            kind, lines = "code", [line]
+        elif stripped.startswith("|"):
+            if kind != "table":
+                flush()
+                kind = "table"
+            lines.append(line)
+        elif not stripped:
+            flush()
+        else:
+            if kind != "text":
+                flush()
+                kind = "text"
+            lines.append(line)
+    # незакрытый блок кода закрывается, чтобы разметка осталась корректной
+    if kind == "code":
+        lines.append(FENCE)
+    flush()
+    return blocks
+
+
+def _pack(pieces: List[str], separator: str, max_length: int) -> List[str]:
+    """Жадно собирает части (каждая не длиннее max_length) в сообщения"""
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        extra = len(piece) + (len(separator) if current else 0)
+        if current and size + extra > max_length:
+            chunks.append(separator.join(current))
+            current, size = [], 0
+            extra = len(piece)
+        current.append(piece)
+        size += extra
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def _split_line(line: str, max_length: int) -> List[str]:
+    """Длинная строка: по предложениям, затем по словам, затем принудительно"""
+    if len(line) <= max_length:
+        return [line]
+    pieces = []
+    for token in re.findall(r"[^.!?]+[.!?]*\s*", line) or [line]:
+        if len(token) <= max_length:
+            pieces.append(token)
+            continue
+        for word in re.findall(r"\S+\s*", token):
+            pieces.extend(word[i:i + max_length] for i in range(0, len(word), max_length))
+    return [chunk.strip() for chunk in _pack(pieces, "", max_length)]
+
+
+def _split_block(kind: str, lines: List[str], max_length: int) -> List[str]:
+    """Разбивает блок, не помещающийся в одно сообщение"""
+    if kind == "code":
+        # каждая часть кода получает свои открывающий и закрывающий ограничители
+        opening, inner = lines[0], lines[1:-1]
+        budget = max_length - len(opening) - len(FENCE) - 2
+        pieces = [part for line in inner for part in _split_line(line, budget)]
+        return [f"{opening}\n{body}\n{FENCE}" for body in _pack(pieces, "\n", budget)]
+    if kind == "table":
+        # шапка таблицы повторяется в каждой части
+        has_header = len(lines) > 1 and TABLE_SEPARATOR.match(lines[1])
+        header = "\n".join(lines[:2]) if has_header else ""
+        rows = lines[2:] if has_header else lines
+        budget = max_length - len(header) - 1 if header else max_length
+        pieces = [part for row in rows for part in _split_line(row, budget)]
+        return [f"{header}\n{body}" if header else body for body in _pack(pieces, "\n", budget)]
+    pieces = [part for line in lines for part in _split_line(line, max_length)]
+    return _pack(pieces, "\n", max_length)
+
+
+def split_message(text: str, max_length: int = TELEGRAM_MAX_LENGTH) -> list:
+    """Умная разбивка текста с сохранением структуры.
+
+    Линейный проход: текст делится на абзацы, блоки кода и таблицы, которые
+    упаковываются в сообщения целиком; крупный блок делится по строкам так,
+    что блоки кода остаются закрытыми, а таблицы сохраняют шапку
+    """
+    if not text:
+        return []
+    if len(text) <= max_length:
+        return [text]
+
+    pieces = []
+    for kind, lines in _blocks(text):
+        block = "\n".join(lines)
+        if len(block) <= max_length:
+            pieces.append(block)
+        else:
+            pieces.extend(_split_block(kind, lines, max_length))
+    return _pack(pieces, "\n\n", max_length)
+
+
+# ----------------------------
+# Очередь отправки с учетом лимитов Telegram
+# ----------------------------
+# Не больше одного сообщения в секунду в один чат и ~30 сообщений в секунду всего
+PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1.0"))
+GLOBAL_INTERVAL = float(os.getenv("TELEGRAM_GLOBAL_INTERVAL", str(1 / 30)))
+# Отчеты длиннее этого порога отправляются файлом
+DOCUMENT_THRESHOLD = int(os.getenv("REPORT_DOCUMENT_THRESHOLD", "12000"))
+
+
+class SendQueue:
+    """Планирует отправку так, чтобы не превышать лимиты Telegram и не получать flood-ошибки"""
+
+    def __init__(self, per_chat_interval: float = PER_CHAT_INTERVAL, global_interval: float = GLOBAL_INTERVAL):
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = global_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[int, float] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # блокировка пересоздается для каждого цикла событий (бот и планировщик используют разные)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        return self._lock
+
+    async def _reserve(self, chat_id: int) -> float:
+        """Резервирует слот отправки и возвращает, сколько нужно подождать"""
+        async with self._get_lock():
+            now = time.monotonic()
+            slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+            self._next_global = slot + self.global_interval
+            self._next_chat[chat_id] = slot + self.per_chat_interval
+            return slot - now
+
+    async def _call(self, chat_id: int, send):
+        while True:
+            await asyncio.sleep(await self._reserve(chat_id))
+            try:
+                return await send()
+            except RetryAfter as e:
+                # retry_after — число секунд или timedelta (в новых версиях python-telegram-bot)
+                ra = e.retry_after
+                delay = ra.total_seconds() if isinstance(ra, timedelta) else float(ra)
+                async with self._get_lock():
+                    self._next_chat[chat_id] = time.monotonic() + delay
+                await asyncio.sleep(delay)
+
+    async def send_text(self, bot, chat_id: int, text: str, **kwargs):
+        return await self._call(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+    async def send_document(self, bot, chat_id: int, content: str, filename: str, caption: Optional[str] = None):
+        def send():
+            document = InputFile(io.BytesIO(content.encode('utf-8')), filename=filename)
+            return bot.send_document(chat_id=chat_id, document=document, caption=caption)
+        return await self._call(chat_id, send)
+
+
+send_queue = SendQueue()
+
+
+async def deliver_report(bot, chat_id: int, report: str, as_document: Optional[bool] = None):
+    """Отправляет отчет частями или, если он слишком длинный, одним файлом report.md"""
+    if as_document is None:
+        as_document = len(report) > DOCUMENT_THRESHOLD
+    if as_document:
+        await send_queue.send_document(bot, chat_id, report, "report.md", caption="📋 Полный отчет")
+        return
+    for chunk in split_message(report):
+        await send_queue.send_text(bot, chat_id, chunk)
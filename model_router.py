@@ -0,0 +1,112 @@
+import os
+from typing import Callable, Dict, List, Optional, Any
+
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+from llm_client import ResilientLLM, FALLBACK_MODELS, build_chat_model
+from io_steps import Steps, run_sync, run_async
+from event_log import get_logger
+
+load_dotenv()
+
+# ----------------------------
+# Маршрутизация задач по моделям
+# ----------------------------
+logger = get_logger("model_router")
+# Уровни моделей. Если отдельные модели не заданы, используется MODEL_NAME
+MODEL_TIERS: Dict[str, str] = {
+    "small": os.getenv("SMALL_MODEL_NAME") or os.getenv("MODEL_NAME"),
+    "large": os.getenv("LARGE_MODEL_NAME") or os.getenv("MODEL_NAME"),
+}
+
+# Агент/задача -> уровень модели.
+# Простые задачи (план, проверка качества, краткие выводы) — на быстрой модели,
+# классификация рисков и итоговый отчет — на сильной
+MODEL_ROUTES: Dict[str, str] = {
+    "default": "large",
+    "planner": "small",
+    "critic": "small",
+    "insights": "small",
+    "data_analysis": "large",
+    "risk_analysis": "large",
+    "report": "large",
+}
+
+# Куда эскалировать запрос, если ответ модели не прошел валидацию
+ESCALATION: Dict[str, str] = {"small": "large"}
+
+
+def _load_route_overrides():
+    """Переопределение маршрутов из окружения: MODEL_ROUTES="critic=large,insights=large" """
+    for item in filter(None, os.getenv("MODEL_ROUTES", "").split(",")):
+        route, _, tier = item.partition("=")
+        if tier.strip() in MODEL_TIERS:
+            MODEL_ROUTES[route.strip()] = tier.strip()
+
+_load_route_overrides()
+
+_LLM_CACHE: Dict[str, ChatOpenAI] = {}
+_RESILIENT_CACHE: Dict[str, ResilientLLM] = {}
+
+
+def tier_for(route: str) -> str:
+    return MODEL_ROUTES.get(route, MODEL_ROUTES["default"])
+
+
+def escalation_chain(route: str) -> List[str]:
+    """Уровни моделей в порядке попыток: ['small', 'large'] для дешевых маршрутов"""
+    chain = [tier_for(route)]
+    while chain[-1] in ESCALATION and ESCALATION[chain[-1]] not in chain:
+        chain.append(ESCALATION[chain[-1]])
+    return chain
+
+
+def get_llm(route: str = "default", tier: Optional[str] = None) -> ChatOpenAI:
+    """Возвращает клиента модели для маршрута (или явно указанного уровня).
+
+    Клиенты кешируются по имени модели, поэтому уровни с одной моделью делят клиента
+    """
+    model = MODEL_TIERS[tier or tier_for(route)]
+    if model not in _LLM_CACHE:
+        _LLM_CACHE[model] = build_chat_model(model)
+    return _LLM_CACHE[model]
+
+
+def get_resilient_llm(route: str = "default", tier: Optional[str] = None) -> ResilientLLM:
+    """Клиент для прямых вызовов: модель уровня + резервные модели LLM_FALLBACK_MODELS"""
+    model = MODEL_TIERS[tier or tier_for(route)]
+    if model not in _RESILIENT_CACHE:
+        _RESILIENT_CACHE[model] = ResilientLLM([model] + FALLBACK_MODELS)
+    return _RESILIENT_CACHE[model]
+
+
+def escalation_steps(route: str, messages: list, validate: Callable[[Any], Any]) -> Steps:
+    """Вызывает модель маршрута и эскалирует на более сильную, если validate не принял ответ.
+
+    Args:
+        route: Маршрут из MODEL_ROUTES
+        messages: Сообщения для LLM
+        validate: Функция, возвращающая разобранный результат или бросающая исключение
+
+    Returns:
+        Результат validate для первого принятого ответа
+    """
+    last_error: Optional[Exception] = None
+    for tier in escalation_chain(route):
+        response = yield from get_resilient_llm(route, tier).invoke_steps(messages)
+        try:
+            return validate(response)
+        except Exception as e:
+            logger.warning("model response rejected, escalating", extra={"route": route, "tier": tier, "error": str(e)})
+            last_error = e
+    raise last_error
+
+
+def invoke_with_escalation(route: str, messages: list, validate: Callable[[Any], Any]) -> Any:
+    return run_sync(escalation_steps(route, messages, validate))
+
+
+async def ainvoke_with_escalation(route: str, messages: list, validate: Callable[[Any], Any]) -> Any:
+    """Асинхронный вариант invoke_with_escalation"""
+    return await run_async(escalation_steps(route, messages, validate))
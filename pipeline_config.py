@@ -0,0 +1,233 @@
+import functools
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from evidence import CITATION_FORMAT
+from quality_check import VERDICT_FORMAT
+
+# ----------------------------
+# Декларативное описание агентов и задач (config/pipeline.json)
+# ----------------------------
+# Файл разбирается и проверяется один раз при первом обращении; на каждый запуск
+# в готовые шаблоны подставляются только входы задачи (вопрос, отделение и т.п.)
+PIPELINE_CONFIG_PATH = os.getenv("PIPELINE_CONFIG", os.path.join("config", "pipeline.json"))
+# Постоянные подстановки: вносятся в текст шаблона при загрузке
+CONSTANTS = {"citation_format": CITATION_FORMAT, "verdict_format": VERDICT_FORMAT}
+DEFAULT_INPUTS = ("question",)
+# {имя} — подстановка; JSON-примеры в тексте ({"tasks": ...}) под шаблон не попадают
+_FIELD = re.compile(r"\{([a-z_]+)\}")
+_AGENT_FIELDS = ("role", "goal", "backstory")
+
+
+class PipelineConfigError(ValueError):
+    pass
+
+
+class TextTemplate:
+    """Текст с подстановками {имя}, заранее разбитый на части.
+
+    Константы (CONSTANTS) подставлены при разборе, render только склеивает
+    части со значениями входов
+    """
+
+    __slots__ = ("parts",)
+
+    def __init__(self, text: str, inputs: Tuple[str, ...], where: str):
+        parts = _FIELD.split(text)   # [текст, имя, текст, имя, ..., текст]
+        unknown = sorted({name for name in parts[1::2] if name not in inputs and name not in CONSTANTS})
+        if unknown:
+            raise PipelineConfigError(f"{where}: неизвестные подстановки {unknown}, допустимы {list(inputs)}")
+        merged = [parts[0]]
+        for name, literal in zip(parts[1::2], parts[2::2]):
+            if name in CONSTANTS:
+                merged[-1] += CONSTANTS[name] + literal
+            else:
+                merged += [name, literal]
+        self.parts = tuple(merged)
+
+    def render(self, values: Dict[str, object]) -> str:
+        parts = self.parts
+        if len(parts) == 1:
+            return parts[0]
+        chunks = [parts[0]]
+        for i in range(1, len(parts), 2):
+            chunks.append(str(values[parts[i]]))
+            chunks.append(parts[i + 1])
+        return "".join(chunks)
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    name: str
+    role: str
+    goal: str
+    backstory: str
+    tools: Tuple[str, ...]
+    route: str
+    allow_delegation: bool
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    name: str
+    agent: str
+    inputs: Tuple[str, ...]
+    description: TextTemplate
+    expected_output: TextTemplate
+    context: Optional[Tuple[str, ...]]   # None — результаты всех предыдущих задач (по умолчанию crewai)
+    output_file: Optional[str]
+
+    def render(self, **values) -> Dict[str, str]:
+        """Описание и ожидаемый результат задачи для одного запуска"""
+        missing = [name for name in self.inputs if name not in values]
+        if missing:
+            raise PipelineConfigError(f"Задача {self.name}: не переданы входы {missing}")
+        rendered = {
+            "description": self.description.render(values),
+            "expected_output": self.expected_output.render(values),
+        }
+        if self.output_file:
+            rendered["output_file"] = self.output_file
+        return rendered
+
+
+def _text(value, where: str) -> str:
+    # многострочные тексты в JSON удобнее хранить списком строк
+    if isinstance(value, list) and all(isinstance(line, str) for line in value):
+        return "\n".join(value)
+    if isinstance(value, str):
+        return value
+    raise PipelineConfigError(f"{where}: ожидается строка или список строк")
+
+
+def _names(value, where: str) -> Tuple[str, ...]:
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise PipelineConfigError(f"{where}: ожидается список имен")
+    return tuple(value)
+
+
+class PipelineConfig:
+    """Проверенное описание агентов, задач и их зависимостей"""
+
+    def __init__(self, raw: Dict, source: str = "<config>"):
+        self.source = source
+        for key in ("agents", "tasks", "pipelines", "default_plan"):
+            if key not in raw:
+                raise PipelineConfigError(f"{source}: нет раздела '{key}'")
+        self.agents = self._parse_agents(raw["agents"])
+        self.tasks = self._parse_tasks(raw["tasks"])
+        self.pipelines = self._parse_pipelines(raw["pipelines"])
+        self.default_plan = _names(raw["default_plan"], f"{source}: default_plan")
+        unknown = [name for name in self.default_plan if name not in self.tasks]
+        if unknown:
+            raise PipelineConfigError(f"{source}: в default_plan неизвестные задачи {unknown}")
+
+    def _parse_agents(self, raw: Dict) -> Dict[str, AgentSpec]:
+        agents = {}
+        for name, spec in raw.items():
+            where = f"{self.source}: агент {name}"
+            # extends — та же роль с другим набором инструментов/маршрутом (например, для пофилиального анализа)
+            base = raw.get(spec["extends"]) if "extends" in spec else {}
+            if base is None or "extends" in base:
+                raise PipelineConfigError(f"{where}: extends должен ссылаться на агента без extends")
+            spec = {**base, **spec}
+            missing = [field for field in _AGENT_FIELDS if not spec.get(field)]
+            if missing:
+                raise PipelineConfigError(f"{where}: не заданы {missing}")
+            agents[name] = AgentSpec(
+                name=name,
+                role=spec["role"],
+                goal=spec["goal"],
+                backstory=spec["backstory"],
+                tools=_names(spec.get("tools", []), f"{where}: tools"),
+                route=spec.get("route", "default"),
+                allow_delegation=bool(spec.get("allow_delegation", False)),
+            )
+        return agents
+
+    def _parse_tasks(self, raw: Dict) -> Dict[str, TaskSpec]:
+        tasks = {}
+        for name, spec in raw.items():
+            where = f"{self.source}: задача {name}"
+            if spec.get("agent") not in self.agents:
+                raise PipelineConfigError(f"{where}: неизвестный агент {spec.get('agent')!r}")
+            for field in ("description", "expected_output"):
+                if field not in spec:
+                    raise PipelineConfigError(f"{where}: не задано {field}")
+            inputs = _names(spec.get("inputs", list(DEFAULT_INPUTS)), f"{where}: inputs")
+            context = spec.get("context")
+            if context is not None:
+                context = _names(context, f"{where}: context")
+                unknown = [dependency for dependency in context if dependency not in raw]
+                if unknown:
+                    raise PipelineConfigError(f"{where}: в context неизвестные задачи {unknown}")
+            tasks[name] = TaskSpec(
+                name=name,
+                agent=spec["agent"],
+                inputs=inputs,
+                description=TextTemplate(_text(spec["description"], f"{where}: description"), inputs, where),
+                expected_output=TextTemplate(_text(spec["expected_output"], f"{where}: expected_output"), inputs, where),
+                context=context,
+                output_file=spec.get("output_file"),
+            )
+        return tasks
+
+    def _parse_pipelines(self, raw: Dict) -> Dict[str, Tuple[str, ...]]:
+        pipelines = {}
+        for name, task_names in raw.items():
+            where = f"{self.source}: конвейер {name}"
+            task_names = _names(task_names, where)
+            for position, task_name in enumerate(task_names):
+                if task_name not in self.tasks:
+                    raise PipelineConfigError(f"{where}: неизвестная задача {task_name}")
+                # зависимость должна выполняться раньше задачи — так исключаются и циклы
+                later = [d for d in self.tasks[task_name].context or () if d not in task_names[:position]]
+                if later:
+                    raise PipelineConfigError(f"{where}: задача {task_name} зависит от {later}, которые не выполняются раньше нее")
+            pipelines[name] = task_names
+        return pipelines
+
+    def check_tools(self, tools: Dict[str, object], agents: Optional[List[str]] = None):
+        """Проверяет, что у точки входа есть все инструменты агентов (по умолчанию — всех)"""
+        missing = {
+            name: [tool for tool in self.agents[name].tools if tool not in tools]
+            for name in (agents if agents is not None else self.agents)
+        }
+        missing = {name: names for name, names in missing.items() if names}
+        if missing:
+            raise PipelineConfigError(f"{self.source}: нет инструментов {missing}")
+
+    def agent_kwargs(self, name: str, tools: Dict[str, object]) -> Dict:
+        """Параметры для create_agent: инструменты подставляются из реестра точки входа"""
+        spec = self.agents[name]
+        return {
+            "role": spec.role,
+            "goal": spec.goal,
+            "backstory": spec.backstory,
+            "tools": [tools[tool] for tool in spec.tools],
+            "allow_delegation": spec.allow_delegation,
+            "route": spec.route,
+        }
+
+    def pipeline_agents(self, pipeline: str) -> List[str]:
+        """Агенты задач конвейера в порядке первого появления"""
+        return list(dict.fromkeys(self.tasks[name].agent for name in self.pipelines[pipeline]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_pipeline_config(path: str = PIPELINE_CONFIG_PATH) -> PipelineConfig:
+    """Разбирает и проверяет конфигурацию; повторные вызовы возвращают тот же объект"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return PipelineConfig(json.load(f), source=path)
+
+
+if __name__ == "__main__":
+    # python pipeline_config.py [путь] — проверка конфигурации без запуска агентов
+    config = load_pipeline_config(sys.argv[1] if len(sys.argv) > 1 else PIPELINE_CONFIG_PATH)
+    for pipeline, task_names in config.pipelines.items():
+        print(f"{pipeline}: " + " -> ".join(f"{name} ({config.tasks[name].agent})" for name in task_names))
+    print(f"агентов: {len(config.agents)}, задач: {len(config.tasks)}, план по умолчанию: {list(config.default_plan)}")
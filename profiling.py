@@ -0,0 +1,201 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# ----------------------------
+# Профилирование этапов анализа
+# ----------------------------
+# PROFILE_RUNS=true — время (wall/CPU) и пиковая память по этапам и вызовам инструментов;
+# PROFILE_CPROFILE=true — дополнительно дамп cProfile всего запуска (runs/<run_id>/profile.prof)
+PROFILE_RUNS = os.getenv("PROFILE_RUNS", "false").lower() in ("1", "true", "yes")
+PROFILE_CPROFILE = os.getenv("PROFILE_CPROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_FILE = "profile.json"
+CPROFILE_FILE = "profile.prof"
+
+_PROFILE: ContextVar[Optional["RunProfile"]] = ContextVar("run_profile", default=None)
+# Текущий открытый этап: у каждого потока/задачи свой, поэтому вложенность этапов не перепутается
+_FRAME: ContextVar[Optional["_Frame"]] = ContextVar("profile_frame", default=None)
+_NO_STAGE = nullcontext()
+_CPROFILE_LOCK = threading.Lock()
+# tracemalloc общий для процесса: включен, пока идет хотя бы один профилируемый запуск
+_TRACING_LOCK = threading.Lock()
+_TRACING_RUNS = 0
+# Открытые этапы всех запусков и потоков. reset_peak сбрасывает пик для всего процесса,
+# поэтому перед сбросом каждый открытый этап забирает себе текущий пик
+_OPEN_FRAMES = set()
+
+
+class _Frame:
+    __slots__ = ("name", "parent", "peak")
+
+    def __init__(self, name: str, parent: Optional["_Frame"]):
+        self.name = name
+        self.parent = parent
+        self.peak = 0
+
+
+class RunProfile:
+    """Замеры этапов одного запуска анализа.
+
+    Пиковая память — по tracemalloc для всего процесса: при параллельных
+    этапах (пофилиальный анализ) и одновременных запусках она включает память
+    соседних потоков. Начало этапа в другом потоке пик уже открытых этапов не теряет
+    """
+
+    def __init__(self, cprofile: bool = PROFILE_CPROFILE):
+        global _TRACING_RUNS
+        self.records: List[Dict] = []
+        with _TRACING_LOCK:
+            if _TRACING_RUNS == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _TRACING_RUNS += 1
+        self.profiler = None
+        # одновременно может работать только один cProfile на процесс
+        if cprofile and _CPROFILE_LOCK.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def close(self):
+        global _TRACING_RUNS
+        if self.profiler is not None:
+            self.profiler.disable()
+            _CPROFILE_LOCK.release()
+        with _TRACING_LOCK:
+            _TRACING_RUNS -= 1
+            if _TRACING_RUNS == 0:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        parent = _FRAME.get()
+        frame = _Frame(name, parent)
+        with _TRACING_LOCK:
+            current = tracemalloc.get_traced_memory()[1]
+            for open_frame in _OPEN_FRAMES:
+                open_frame.peak = max(open_frame.peak, current)
+            tracemalloc.reset_peak()
+            _OPEN_FRAMES.add(frame)
+        token = _FRAME.set(frame)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            _FRAME.reset(token)
+            with _TRACING_LOCK:
+                _OPEN_FRAMES.discard(frame)
+                peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            if parent is not None:
+                parent.peak = max(parent.peak, peak)
+            self.records.append({
+                "stage": name,
+                "parent": parent.name if parent is not None else None,
+                "wall": wall,
+                "cpu": cpu,
+                "peak_bytes": peak,
+            })
+
+    def summary(self) -> Dict[str, Dict]:
+        """Сводка по этапам: число вызовов, суммарное wall/CPU время (с) и максимальная пиковая память (МБ)"""
+        stages: Dict[str, Dict] = {}
+        for record in list(self.records):
+            stats = stages.setdefault(record["stage"], {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_mb": 0.0})
+            stats["calls"] += 1
+            stats["wall"] += record["wall"]
+            stats["cpu"] += record["cpu"]
+            stats["peak_mb"] = max(stats["peak_mb"], record["peak_bytes"] / 2 ** 20)
+        for stats in stages.values():
+            stats.update({key: round(stats[key], 3) for key in ("wall", "cpu", "peak_mb")})
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["wall"]))
+
+    def save(self, directory: str):
+        with open(os.path.join(directory, PROFILE_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"stages": self.summary(), "records": self.records}, f, ensure_ascii=False, indent=2)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(directory, CPROFILE_FILE))
+
+
+def start_profile(enabled: bool = PROFILE_RUNS):
+    """Включает профилирование текущего запуска; возвращает токен для finish_profile (None — выключено)"""
+    if not enabled:
+        return None
+    return _PROFILE.set(RunProfile())
+
+
+def finish_profile(token, directory: Optional[str] = None) -> Optional[Dict]:
+    """Завершает профилирование, сохраняет результаты в directory и возвращает сводку"""
+    if token is None:
+        return None
+    profile = _PROFILE.get()
+    _PROFILE.reset(token)
+    profile.close()
+    if directory is not None:
+        profile.save(directory)
+    return profile.summary()
+
+
+def stage(name: str):
+    """Контекст этапа; без активного профилирования — пустой контекст без замеров"""
+    profile = _PROFILE.get()
+    return _NO_STAGE if profile is None else profile.stage(name)
+
+
+def profiled(name: str):
+    """Декоратор: замер функции (синхронной или async) как этапа name"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize_profiles(runs_dir: str, limit: int = 10) -> Optional[Dict]:
+    """Средние по этапам для последних limit запусков с профилем"""
+    if not os.path.isdir(runs_dir):
+        return None
+    paths = [os.path.join(runs_dir, run_id, PROFILE_FILE) for run_id in os.listdir(runs_dir)]
+    paths = sorted((p for p in paths if os.path.exists(p)), key=os.path.getmtime)[-limit:]
+    if not paths:
+        return None
+    totals: Dict[str, Dict] = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            stages = json.load(f)["stages"]
+        for name, stats in stages.items():
+            total = totals.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_mb": 0.0})
+            total["calls"] += stats["calls"]
+            total["wall"] += stats["wall"]
+            total["cpu"] += stats["cpu"]
+            total["peak_mb"] = max(total["peak_mb"], stats["peak_mb"])
+    runs = len(paths)
+    stages = {
+        name: {"calls": t["calls"] / runs, "wall": t["wall"] / runs, "cpu": t["cpu"] / runs, "peak_mb": t["peak_mb"]}
+        for name, t in totals.items()
+    }
+    return {"runs": runs, "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["wall"]))}
+
+
+def format_profile_summary(summary: Dict, top: int = 15) -> str:
+    lines = [f"⏱ Профиль: среднее по {summary['runs']} запускам (wall / CPU, с; пик памяти, МБ)"]
+    for name, stats in list(summary["stages"].items())[:top]:
+        lines.append(
+            f"{name}: {stats['wall']:.2f} / {stats['cpu']:.2f}, {stats['peak_mb']:.1f} МБ, вызовов {stats['calls']:.1f}"
+        )
+    return "\n".join(lines)
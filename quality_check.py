@@ -0,0 +1,148 @@
+import json
+import re
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from evidence import verify_citations
+
+# ----------------------------
+# Структурированный вердикт критика
+# ----------------------------
+class CriticVerdict(BaseModel):
+    approved: bool = Field(description="Отчет принят без доработок")
+    severity: Literal["none", "minor", "major", "critical"] = Field(
+        default="none", description="Серьезность замечаний"
+    )
+    sections: List[str] = Field(default_factory=list, description="Разделы отчета, требующие доработки")
+    remarks: List[str] = Field(default_factory=list, description="Конкретные замечания")
+    source: Literal["critic", "local"] = Field(default="critic", description="Кто вынес вердикт")
+
+    def as_feedback(self) -> str:
+        """Замечания в виде текста для следующей итерации"""
+        sections = ", ".join(self.sections) or "весь отчет"
+        remarks = "\n".join(f"- {remark}" for remark in self.remarks)
+        return f"Серьезность: {self.severity}. Разделы: {sections}\n{remarks}"
+
+
+VERDICT_FORMAT = """JSON-объект вида:
+{"approved": true|false, "severity": "none"|"minor"|"major"|"critical",
+ "sections": ["названия разделов для доработки"], "remarks": ["конкретные замечания"]}"""
+
+
+def try_parse_verdict(task_output) -> Optional[CriticVerdict]:
+    """Извлекает вердикт из результата задачи критика или возвращает None, если ответ не по схеме.
+
+    Сначала используется pydantic-вывод crewai, затем JSON из текста ответа
+    """
+    pydantic_output = getattr(task_output, 'pydantic', None)
+    if isinstance(pydantic_output, CriticVerdict):
+        return pydantic_output
+
+    match = re.search(r"\{.*\}", str(task_output or ""), re.DOTALL)
+    if match:
+        try:
+            return CriticVerdict(**json.loads(match.group(0)))
+        except (ValueError, ValidationError):
+            pass
+    return None
+
+
+def parse_verdict(task_output) -> CriticVerdict:
+    """Как try_parse_verdict, но ответ не по схеме считается списком замечаний"""
+    verdict = try_parse_verdict(task_output)
+    if verdict is not None:
+        return verdict
+    raw = str(task_output or "").strip()
+    return CriticVerdict(approved=False, severity="major", remarks=[raw or "Пустой ответ критика"])
+
+
+# ----------------------------
+# Быстрая локальная проверка отчета
+# ----------------------------
+# Обязательные разделы итогового отчета (по expected_output задачи report)
+REQUIRED_SECTIONS = {
+    "Ключевые выводы": r"вывод",
+    "Рекомендации": r"рекомендац",
+}
+# Доля отделений, которые должны быть упомянуты в отчете
+MIN_BRANCH_COVERAGE = 0.5
+# Цитаты короче этого порога не проверяются
+MIN_QUOTE_LENGTH = 20
+QUOTE_PATTERN = re.compile(r"[«\"“]([^«»\"“”]{%d,})[»\"”]" % MIN_QUOTE_LENGTH)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower().replace("ё", "е")).strip(" .,!?")
+
+
+def _headings(report: str) -> str:
+    """Заголовки и выделенные строки отчета, в которых ищутся разделы"""
+    lines = [line for line in report.splitlines() if line.lstrip().startswith(("#", "**"))]
+    return "\n".join(lines).lower()
+
+
+def _mentions(report: str, term: str) -> bool:
+    """Упоминание целым словом: orgId 12 не находится внутри 120, «Арбат» — внутри «Арбатская»"""
+    return re.search(rf"(?<!\w){re.escape(term)}(?!\w)", report) is not None
+
+
+def local_quality_check(
+    report: str,
+    reviews: List[Dict],
+    companies: Dict[int, Dict],
+    index: Optional[Dict[str, Dict]] = None
+) -> Optional[CriticVerdict]:
+    """Дешевая проверка отчета без LLM.
+
+    Args:
+        index: Предрассчитанный индекс id -> отзыв для проверки ссылок [R-xxxxxxxxxxxxxxxx]
+
+    Returns:
+        Вердикт, если отчет однозначно проходит или однозначно не проходит проверку,
+        иначе None — тогда решение принимает критик
+    """
+    if not report.strip():
+        return CriticVerdict(approved=False, severity="critical", remarks=["Отчет пуст"], source="local")
+
+    remarks: List[str] = []
+    sections: List[str] = []
+
+    headings = _headings(report)
+    missing = [name for name, pattern in REQUIRED_SECTIONS.items() if not re.search(pattern, headings)]
+    if missing:
+        sections.extend(missing)
+        remarks.append(f"Отсутствуют обязательные разделы: {', '.join(missing)}")
+
+    branch_ids = {review.get("orgId") for review in reviews}
+    mentioned = {
+        org_id for org_id in branch_ids
+        if _mentions(report, str(org_id)) or (org_id in companies and _mentions(report, companies[org_id]["name"]))
+    }
+    coverage = len(mentioned) / len(branch_ids) if branch_ids else 1.0
+    if coverage < 1.0:
+        not_mentioned = sorted(companies[o]["name"] if o in companies else str(o) for o in branch_ids - mentioned)
+        remarks.append(f"Не упомянуты отделения: {', '.join(not_mentioned)}")
+
+    corpus = "\n".join(_normalize(review.get("comment", "")) for review in reviews)
+    quotes = [_normalize(q) for q in QUOTE_PATTERN.findall(report)]
+    untraceable = [q for q in quotes if q not in corpus]
+    if untraceable:
+        remarks.append(f"Цитаты не найдены в отзывах: {'; '.join(untraceable[:5])}")
+
+    evidence = verify_citations(report, index if index is not None else {r["id"]: r for r in reviews}, companies)
+    remarks.extend(evidence.remarks())
+
+    # инциденты подтверждаются цитатами и ссылками на id отзывов
+    cited = len(quotes) + evidence.cited
+    unconfirmed = len(untraceable) + len(evidence.invalid)
+
+    # однозначный провал: структура отчета нарушена или большая часть данных не покрыта
+    if missing or coverage < MIN_BRANCH_COVERAGE or (cited and unconfirmed * 2 > cited):
+        return CriticVerdict(
+            approved=False, severity="major", sections=sections or ["весь отчет"], remarks=remarks, source="local"
+        )
+    # однозначный успех: все разделы, все отделения и все ссылки подтверждены отзывами
+    if not remarks and cited:
+        return CriticVerdict(approved=True, severity="none", source="local")
+    return None
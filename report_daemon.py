@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Set
+
+from dotenv import load_dotenv
+from telegram import Bot
+
+from data_store import (
+    REVIEWS_PATH,
+    COMPANIES_PATH,
+    load_reviews,
+    load_companies,
+    review_key,
+    file_fingerprint,
+    branch_title,
+)
+from branch_fanout import analyze_branches, remember_sections
+from subscriptions import STATE_DIR, load_subscribers
+from message_delivery import send_queue, deliver_report
+from checkpoint import new_run_id
+from complaint_themes import get_theme_index
+from branch_profiles import get_branch_profiles
+from review_trends import recent_anomalies, describe_anomaly
+from event_log import setup_logging, get_logger, set_run_id, reset_run_id
+
+load_dotenv()
+
+# ----------------------------
+# Планировщик инкрементальных отчетов
+# ----------------------------
+logger = get_logger("report_daemon")
+POLL_INTERVAL = int(os.getenv("REPORT_POLL_INTERVAL", "60"))
+DAEMON_QUESTION = os.getenv(
+    "REPORT_QUESTION",
+    "Проанализируйте данные из клиентских комментариев и найдите инциденты операционного риска в отделениях"
+)
+DAEMON_STATE_PATH = os.path.join(STATE_DIR, "daemon_state.json")
+LAST_REPORT_PATH = os.path.join(STATE_DIR, "last_report.md")
+# Период для оповещений о всплесках негатива: week или month
+ALERT_PERIOD = os.getenv("TREND_ALERT_PERIOD", "week")
+
+
+def load_state() -> Dict:
+    if not os.path.exists(DAEMON_STATE_PATH):
+        return {"fingerprints": {}, "reviews": [], "companies": {}, "sections": {}}
+    with open(DAEMON_STATE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state: Dict):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = DAEMON_STATE_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, DAEMON_STATE_PATH)
+
+
+def _company_hash(company: Dict) -> str:
+    return hashlib.sha1(json.dumps(company, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def data_changed(state: Dict) -> bool:
+    """Сравнивает отпечатки файлов данных с последним обработанным состоянием"""
+    return any(
+        state["fingerprints"].get(path) != file_fingerprint(path)
+        for path in (REVIEWS_PATH, COMPANIES_PATH)
+    )
+
+
+def affected_branches(state: Dict) -> Set[int]:
+    """Отделения с новыми отзывами или изменившимися данными об отделении"""
+    seen = set(state["reviews"])
+    affected = {review.get("orgId") for review in load_reviews() if review_key(review) not in seen}
+    for org_id, company in load_companies().items():
+        if state["companies"].get(str(org_id)) != _company_hash(company):
+            affected.add(org_id)
+    return affected
+
+
+async def push_report(report: str, branch_ids: List[int]):
+    """Рассылает обновленный отчет подписчикам"""
+    chat_ids = load_subscribers()
+    if not chat_ids:
+        return
+    companies = load_companies()
+    header = "🔔 Отчет обновлен по отделениям: " + ", ".join(branch_title(org_id, companies) for org_id in branch_ids)
+    bot = Bot(os.getenv("TELEGRAM_BOT_TOKEN"))
+    async with bot:
+        for chat_id in chat_ids:
+            try:
+                await send_queue.send_text(bot, chat_id, header)
+                await deliver_report(bot, chat_id, report)
+            except Exception:
+                logger.exception("report delivery failed", extra={"chat_id": chat_id})
+
+
+async def push_alerts(anomalies: List[Dict]):
+    """Оповещает подписчиков о всплесках негатива и падении оценок"""
+    chat_ids = load_subscribers()
+    if not chat_ids or not anomalies:
+        return
+    companies = load_companies()
+    text = "⚠️ Аномалии в отзывах:\n" + "\n".join(f"• {describe_anomaly(a, companies)}" for a in anomalies)
+    bot = Bot(os.getenv("TELEGRAM_BOT_TOKEN"))
+    async with bot:
+        for chat_id in chat_ids:
+            try:
+                await send_queue.send_text(bot, chat_id, text)
+            except Exception:
+                logger.exception("alert delivery failed", extra={"chat_id": chat_id})
+
+
+def check_anomalies(state: Dict) -> List[Dict]:
+    """Аномалии последнего периода, о которых еще не оповещали"""
+    alerted = set(state.get("alerted", []))
+    fresh = [
+        a for a in recent_anomalies(ALERT_PERIOD)
+        if f"{a['orgId']}|{a['period']}|{a['kind']}" not in alerted
+    ]
+    state["alerted"] = sorted(alerted | {f"{a['orgId']}|{a['period']}|{a['kind']}" for a in fresh})
+    return fresh
+
+
+def refresh_once(state: Dict) -> bool:
+    """Один цикл проверки: анализирует только затронутые отделения и дополняет отчет.
+
+    Returns:
+        True, если отчет был обновлен хотя бы по одному отделению
+    """
+    if not data_changed(state):
+        return False
+
+    # темы жалоб и профили отделений дополняются новыми отзывами заранее, до запросов агентов
+    get_theme_index()
+    get_branch_profiles()
+    anomalies = check_anomalies(state)
+    if anomalies:
+        logger.info("anomalies detected", extra={"anomalies": anomalies})
+        asyncio.run(push_alerts(anomalies))
+    branch_ids = sorted(affected_branches(state), key=str)
+    updated = []
+    failed: Set[int] = set()
+    if branch_ids:
+        logger.info("branches changed", extra={"branch_ids": branch_ids})
+        # секции прошлых запусков не пересчитываются, если вопрос отчета не менялся
+        if state.get("question") != DAEMON_QUESTION:
+            state["question"], state["sections"] = DAEMON_QUESTION, {}
+        remember_sections(DAEMON_QUESTION, {int(k): v for k, v in state["sections"].items()})
+        # отделения с ошибкой анализа остаются в отчете с прежней секцией (если она была)
+        run = analyze_branches(DAEMON_QUESTION, branch_ids=branch_ids, reuse_sections=True, include_failed=False)
+        with open(LAST_REPORT_PATH, 'w', encoding='utf-8') as f:
+            f.write(run.report)
+        state["sections"] = {str(k): v for k, v in run.sections.items()}
+        failed = run.failed
+        updated = [org_id for org_id in branch_ids if org_id not in failed]
+        if updated:
+            asyncio.run(push_report(run.report, updated))
+
+    # при ошибках отпечатки не обновляются: следующий цикл снова увидит изменения
+    # и повторит анализ отделений, отзывы которых не помечены как обработанные
+    if not failed:
+        state["fingerprints"] = {path: file_fingerprint(path) for path in (REVIEWS_PATH, COMPANIES_PATH)}
+    state["reviews"] = [
+        review_key(review) for review in load_reviews()
+        if review.get("orgId") not in failed
+    ]
+    state["companies"] = {
+        str(org_id): _company_hash(c) for org_id, c in load_companies().items()
+        if org_id not in failed
+    }
+    save_state(state)
+    return bool(updated)
+
+
+def run_daemon(poll_interval: int = POLL_INTERVAL):
+    """Следит за data/ и обновляет отчет при появлении новых отзывов"""
+    setup_logging()
+    logger.info("watching data files", extra={"paths": [REVIEWS_PATH, COMPANIES_PATH], "interval": poll_interval})
+    state = load_state()
+    while True:
+        # каждый цикл проверки — отдельный запуск в журнале
+        run_token = set_run_id(new_run_id())
+        try:
+            refresh_once(state)
+        except Exception:
+            # состояние не сохранено — изменения будут обработаны на следующем цикле
+            logger.exception("report refresh failed")
+        finally:
+            reset_run_id(run_token)
+        time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+from data_store import branch_title
+from event_log import get_logger
+
+# ----------------------------
+# Секции отчета с кешем по хешу входных данных
+# ----------------------------
+logger = get_logger("report_sections")
+SECTIONS_DIR = os.path.join("state", "sections")
+# Меняется при изменении формата секций: старые записи кеша перестают совпадать
+SECTIONS_VERSION = 1
+RISK_TABLE_BRANCHES = 3
+RISK_TABLE_EXAMPLES = 3
+
+
+def section_key(name: str, inputs) -> str:
+    """Хеш входных данных секции: одинаковые входы — та же секция без повторной генерации"""
+    raw = json.dumps({"name": name, "version": SECTIONS_VERSION, "inputs": inputs},
+                     ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]
+
+
+class SectionCache:
+    """Готовые секции на диске: state/sections/<имя>/<хеш входов>.md.
+
+    Для каждой секции хранится только последняя версия: при изменении
+    входов новая запись заменяет прежнюю
+    """
+
+    def __init__(self, path: str = SECTIONS_DIR):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.path, name.replace("/", "_"))
+
+    def get(self, name: str, key: str) -> Optional[str]:
+        path = os.path.join(self._dir(name), f"{key}.md")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def put(self, name: str, key: str, text: str):
+        directory = self._dir(name)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f"{key}.md.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, os.path.join(directory, f"{key}.md"))
+        for stale in os.listdir(directory):
+            if stale != f"{key}.md" and not stale.endswith(".tmp"):
+                os.remove(os.path.join(directory, stale))
+
+    def section(self, name: str, inputs, render: Callable[[], str]) -> str:
+        """Секция из кеша или, если входы изменились, результат render()"""
+        key = section_key(name, inputs)
+        text = self.get(name, key)
+        if text is not None:
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = render()
+        self.put(name, key, text)
+        logger.info("section rendered", extra={"section": name, "key": key})
+        return text
+
+
+def _share(part: int, total: int) -> str:
+    return f"{part / total:.0%}" if total else "—"
+
+
+def render_summary(profiles: List[Dict]) -> str:
+    """Сводная таблица по отделениям из профилей (branch_profiles), без LLM"""
+    lines = [
+        "## Сводка",
+        "",
+        "| Отделение | Отзывов | Средняя оценка | Негативных | Основная тема жалоб | Аномалии |",
+        "|---|---|---|---|---|---|",
+    ]
+    for profile in sorted(profiles, key=lambda p: (p["rating"]["mean"] is None, p["rating"]["mean"] or 0)):
+        mean = profile["rating"]["mean"]
+        theme = profile["themes"][0]["label"] if profile["themes"] else "—"
+        lines.append(
+            f"| {profile['name']} ({profile['address']}) | {profile['reviews']} | "
+            f"{mean if mean is not None else '—'} | "
+            f"{_share(profile['tones'].get('Негативный', 0), profile['reviews'])} | {theme} | "
+            f"{len(profile['anomalies']) or '—'} |"
+        )
+    return "\n".join(lines)
+
+
+def render_risk_table(summary: Dict, companies: Dict[int, Dict]) -> str:
+    """Таблица категорий риска поведения (risk_classifier) с отделениями и примерами отзывов, без LLM"""
+    categories = summary["categories"]
+    lines = ["## Риски поведения", ""]
+    if categories:
+        lines += ["| Категория | Жалоб | Отделения | Примеры |", "|---|---|---|---|"]
+    else:
+        lines.append("Жалоб с признаками недобросовестных практик не выявлено.")
+    for category, entry in sorted(categories.items(), key=lambda item: -item[1]["count"]):
+        branches = ", ".join(
+            f"{branch_title(int(org_id), companies)}: {count}"
+            for org_id, count in list(entry["branches"].items())[:RISK_TABLE_BRANCHES]
+        )
+        examples = " ".join(f"[{example['id']}]" for example in entry["examples"][:RISK_TABLE_EXAMPLES])
+        lines.append(f"| {category} | {entry['count']} | {branches} | {examples} |")
+    stats = summary["stats"]
+    lines += ["", f"_Классификация: локально {stats['local']}, разметка LLM {stats['stored'] + stats['llm']}, "
+                  f"требуют проверки {stats['uncertain']}._"]
+    return "\n".join(lines)
+
+
+def compose_report(question: str, sections: Dict[str, str], branch_sections: Dict[int, str]) -> str:
+    """Итоговый Markdown из готовых секций: сводка, риски, рекомендации, разделы отделений"""
+    body = [sections[name] for name in ("summary", "risks", "recommendations") if sections.get(name)]
+    body += [branch_sections[org_id] for org_id in sorted(branch_sections, key=str)]
+    header = f"# Отчет по отделениям\n\n**Вопрос**: {question}\n\nОтделений в отчете: {len(branch_sections)}"
+    return "\n\n".join([header] + body)
@@ -0,0 +1,244 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from data_store import REVIEWS_PATH, load_reviews, load_companies, branch_title
+
+# ----------------------------
+# Динамика оценок и тональности по отделениям
+# ----------------------------
+# Окно скользящего среднего и базовой линии, в периодах
+TREND_WINDOW = int(os.getenv("TREND_WINDOW", "3"))
+# Порог z-статистики для всплеска негатива / падения оценки
+TREND_Z = float(os.getenv("TREND_Z", "3.0"))
+# Периоды с меньшим числом отзывов не проверяются на аномалии
+TREND_MIN_REVIEWS = int(os.getenv("TREND_MIN_REVIEWS", "3"))
+PERIODS = ("week", "month")
+NEGATIVE_TONE = "Негативный"
+
+
+def to_days(values: List[Optional[str]]) -> np.ndarray:
+    """Даты отзывов в datetime64[D]; нераспознанные — NaT.
+
+    Даты в данных в формате m/d/yyyy, поддерживается и ISO (берется префикс yyyy-mm-dd).
+    Строки приводятся к ISO операциями над массивом и разбираются одним вызовом NumPy
+    """
+    raw = np.char.strip(np.array([v if isinstance(v, str) else "" for v in values], dtype=str))
+    if not len(raw):
+        return np.zeros(0, dtype="datetime64[D]")
+    month, _, rest = np.char.partition(raw, "/").reshape(-1, 3).T
+    day, _, year = np.char.partition(rest, "/").reshape(-1, 3).T
+    is_us = (np.char.isdigit(month) & np.char.isdigit(day) & np.char.isdigit(year)
+             & (np.char.str_len(month) <= 2) & (np.char.str_len(day) <= 2) & (np.char.str_len(year) == 4))
+    us = np.char.add(np.char.add(np.char.add(year, "-"), np.char.add(np.char.zfill(month, 2), "-")), np.char.zfill(day, 2))
+    prefix = raw.astype("<U10")
+    is_iso = (np.char.str_len(prefix) == 10) & np.char.isdigit(np.char.replace(prefix, "-", "")) \
+        & (np.char.count(prefix, "-") == 2)
+    iso = np.where(is_us, us, np.where(is_iso, prefix, "NaT"))
+    try:
+        return iso.astype("datetime64[D]")
+    except ValueError:
+        # несуществующая дата (например, 2/30/2024) — разбор по одной только в этом случае
+        return np.array([_parse_day(value) for value in iso], dtype="datetime64[D]")
+
+
+def _parse_day(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(value, "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+class ReviewSeries:
+    """Отзывы в виде массивов NumPy: отделение, дата, оценка, негативный тон.
+
+    Отзывы без даты, оценки или отделения (orgId) в ряды не входят
+    """
+
+    def __init__(self, reviews: List[Dict]):
+        reviews = [r for r in reviews if r.get("rate") is not None and r.get("orgId") is not None]
+        days = to_days([review.get("date") for review in reviews])
+        valid = ~np.isnat(days)
+        branches = np.array([review["orgId"] for review in reviews], dtype=np.int64)
+        self.branch_ids, self.branch_idx = np.unique(branches[valid], return_inverse=True)
+        self.days = days[valid]
+        self.rates = np.array([review["rate"] for review in reviews], dtype=np.float64)[valid]
+        self.negative = np.array([review.get("tone") == NEGATIVE_TONE for review in reviews], dtype=np.float64)[valid]
+
+    def buckets(self, period: str):
+        """Номер периода для каждого отзыва и подписи периодов от первого до последнего"""
+        if period == "month":
+            units = self.days.astype("datetime64[M]")
+        elif period == "week":
+            # недели начинаются с понедельника (1970-01-01 — четверг)
+            units = ((self.days.astype(np.int64) + 3) // 7 * 7 - 3).astype("datetime64[D]")
+        else:
+            raise ValueError(f"Период должен быть одним из {PERIODS}")
+        if not len(units):
+            return np.zeros(0, dtype=np.int64), []
+        step = 1 if period == "month" else 7
+        origin = units.min()
+        index = (units - origin).astype(np.int64) // step
+        labels = [str(origin + i * step) for i in range(int(index.max()) + 1)]
+        return index, labels
+
+    def aggregate(self, period: str) -> Dict:
+        """Матрицы (отделение x период): число отзывов, сумма оценок, сумма квадратов, число негативных"""
+        index, labels = self.buckets(period)
+        shape = (len(self.branch_ids), len(labels))
+        flat = self.branch_idx * shape[1] + index
+
+        def total(weights=None):
+            return np.bincount(flat, weights=weights, minlength=shape[0] * shape[1]).reshape(shape)
+
+        return {
+            "labels": labels,
+            "count": total(),
+            "rate_sum": total(self.rates),
+            "rate_sq": total(self.rates ** 2),
+            "negative": total(self.negative),
+        }
+
+
+def _trailing(matrix: np.ndarray, window: int, include_current: bool = True) -> np.ndarray:
+    """Сумма по скользящему окну вдоль оси периодов (через накопленные суммы)"""
+    cumulative = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    end = np.arange(1, matrix.shape[1] + 1) if include_current else np.arange(matrix.shape[1])
+    start = np.maximum(end - window, 0)
+    return cumulative[:, end] - cumulative[:, start]
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def compute_trends(series: ReviewSeries, period: str = "month", window: int = TREND_WINDOW,
+                   z_threshold: float = TREND_Z, min_reviews: int = TREND_MIN_REVIEWS) -> Dict:
+    """Скользящие средние и аномалии для всех отделений сразу.
+
+    Аномалии двух видов проверяются и возвращаются отдельно: всплеск негатива
+    (negative_spike) — доля негативных отзывов выше базовой линии (предыдущие window
+    периодов), падение оценки (rating_drop) — средняя оценка ниже нее; в обоих случаях
+    со значимостью z >= z_threshold
+    """
+    data = series.aggregate(period)
+    count, rate_sum, rate_sq, negative = data["count"], data["rate_sum"], data["rate_sq"], data["negative"]
+
+    rolling_count = _trailing(count, window)
+    rolling_rate = _ratio(_trailing(rate_sum, window), rolling_count)
+    rolling_negative = _ratio(_trailing(negative, window), rolling_count)
+
+    # базовая линия — предыдущие периоды без текущего
+    base_count = _trailing(count, window, include_current=False)
+    base_rate_sum = _trailing(rate_sum, window, include_current=False)
+    base_negative = _trailing(negative, window, include_current=False)
+    mean_rate = _ratio(rate_sum, count)
+    share = _ratio(negative, count)
+    base_rate = _ratio(base_rate_sum, base_count)
+    base_share = _ratio(base_negative, base_count)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # всплеск негатива: z-тест разности долей
+        pooled = _ratio(negative + base_negative, count + base_count)
+        share_se = np.sqrt(pooled * (1 - pooled) * (1 / count + 1 / base_count))
+        share_z = np.where(share_se > 0, (share - base_share) / share_se, np.nan)
+        # падение оценки: разность средних с объединенной дисперсией
+        total_count = count + base_count
+        total_sum = rate_sum + base_rate_sum
+        variance = _ratio(rate_sq + _trailing(rate_sq, window, include_current=False) - total_sum ** 2 / total_count,
+                          total_count - 1)
+        rate_se = np.sqrt(variance * (1 / count + 1 / base_count))
+        rate_z = np.where(rate_se > 0, (base_rate - mean_rate) / rate_se, np.nan)
+
+    checked = (count >= min_reviews) & (base_count >= min_reviews)
+    anomalies = []
+    for kind, z, value, baseline in (
+        ("negative_spike", share_z, share, base_share),
+        ("rating_drop", rate_z, mean_rate, base_rate),
+    ):
+        rows, cols = np.nonzero(checked & (np.nan_to_num(z) >= z_threshold))
+        for row, col in zip(rows, cols):
+            anomalies.append({
+                "orgId": int(series.branch_ids[row]),
+                "period": data["labels"][col],
+                "kind": kind,
+                "value": round(float(value[row, col]), 3),
+                "baseline": round(float(baseline[row, col]), 3),
+                "z": round(float(z[row, col]), 2),
+                "reviews": int(count[row, col]),
+            })
+    # сначала последние периоды, внутри периода — наиболее значимые
+    anomalies.sort(key=lambda a: (a["period"], a["z"]), reverse=True)
+    return {
+        "labels": data["labels"],
+        "branch_ids": series.branch_ids,
+        "count": count,
+        "mean_rate": mean_rate,
+        "negative_share": share,
+        "rolling_rate": rolling_rate,
+        "rolling_negative": rolling_negative,
+        "anomalies": anomalies,
+    }
+
+
+_SERIES_CACHE: Dict[str, tuple] = {}
+
+
+def get_review_series(file_path: str = REVIEWS_PATH) -> ReviewSeries:
+    mtime = os.path.getmtime(file_path)
+    cached = _SERIES_CACHE.get(file_path)
+    if cached is None or cached[0] != mtime:
+        _SERIES_CACHE[file_path] = (mtime, ReviewSeries(load_reviews(file_path)))
+    return _SERIES_CACHE[file_path][1]
+
+
+def _value(x) -> Optional[float]:
+    return None if np.isnan(x) else round(float(x), 3)
+
+
+def branch_trends(branch_ids: Optional[List[int]] = None, period: str = "month",
+                  window: int = TREND_WINDOW, last: int = 12) -> Dict:
+    """Ряды по отделениям (последние last периодов с отзывами) и найденные аномалии"""
+    trends = compute_trends(get_review_series(), period, window)
+    companies = load_companies()
+    scope = set(branch_ids) if branch_ids is not None else None
+    branches = []
+    for row, org_id in enumerate(trends["branch_ids"].tolist()):
+        if scope is not None and org_id not in scope:
+            continue
+        cols = np.nonzero(trends["count"][row])[0][-last:]
+        branches.append({
+            "orgId": org_id,
+            "branch": branch_title(org_id, companies),
+            "series": [
+                {
+                    "period": trends["labels"][col],
+                    "reviews": int(trends["count"][row, col]),
+                    "mean_rate": _value(trends["mean_rate"][row, col]),
+                    "negative_share": _value(trends["negative_share"][row, col]),
+                    "rolling_rate": _value(trends["rolling_rate"][row, col]),
+                    "rolling_negative_share": _value(trends["rolling_negative"][row, col]),
+                }
+                for col in cols
+            ],
+        })
+    anomalies = [a for a in trends["anomalies"] if scope is None or a["orgId"] in scope]
+    return {"period": period, "window": window, "branches": branches, "anomalies": anomalies}
+
+
+def recent_anomalies(period: str = "week", periods: int = 1) -> List[Dict]:
+    """Аномалии последних periods периодов данных — для оповещений"""
+    trends = compute_trends(get_review_series(), period)
+    recent = set(trends["labels"][-periods:])
+    return [a for a in trends["anomalies"] if a["period"] in recent]
+
+
+def describe_anomaly(anomaly: Dict, companies: Optional[Dict[int, Dict]] = None) -> str:
+    title = branch_title(anomaly["orgId"], companies)
+    if anomaly["kind"] == "negative_spike":
+        what = f"доля негативных отзывов {anomaly['value']:.0%} при обычной {anomaly['baseline']:.0%}"
+    else:
+        what = f"средняя оценка {anomaly['value']:.2f} при обычной {anomaly['baseline']:.2f}"
+    return f"{title}, период с {anomaly['period']}: {what} ({anomaly['reviews']} отзывов, z={anomaly['z']})"
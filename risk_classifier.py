@@ -0,0 +1,399 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data_store import REVIEWS_PATH, load_reviews, review_index
+from complaint_themes import STEM_LENGTH, complaint
+from event_log import get_logger
+
+# ----------------------------
+# Классификация отзывов по категориям риска поведения: правила + наивный Байес + LLM
+# ----------------------------
+logger = get_logger("risk_classifier")
+# Категории из data/wrongPractices.txt
+RISK_CATEGORIES = [
+    "Недобросовестное информирование",
+    "Подмена продукта",
+    "Продажа неподходящих продуктов",
+    "Навязывание и связанная продажа",
+    "Подключение продукта без ведома клиента",
+]
+NO_RISK = "Нет нарушения"
+LABELS = RISK_CATEGORIES + [NO_RISK]
+
+LABELS_PATH = os.path.join("state", "risk_labels.jsonl")
+# Отзывы с уверенностью локального классификатора ниже порога передаются LLM
+RISK_CONFIDENCE = float(os.getenv("RISK_CONFIDENCE", "0.9"))
+# Пока разметки меньше, модель не используется — решают только правила и LLM
+RISK_MIN_LABELS = int(os.getenv("RISK_MIN_LABELS", "50"))
+RISK_LLM_BATCH = int(os.getenv("RISK_LLM_BATCH", "20"))
+# Не больше стольких отзывов за вызов уходит на разметку LLM; остальные неуверенные остаются с лучшей догадкой
+RISK_LLM_LIMIT = int(os.getenv("RISK_LLM_LIMIT", "100"))
+# Уверенность правила без подтверждения моделью — ниже порога, такие случаи проверяет LLM
+RULE_CONFIDENCE = 0.85
+
+# Формулировки, однозначно указывающие на категорию (текст в нижнем регистре, ё -> е)
+RULES: Dict[str, List[str]] = {
+    RISK_CATEGORIES[0]: [
+        r"не (рассказал|предупредил|сообщил|объяснил)", r"неверн\w* информац", r"скрыт\w* (комисс|плат)",
+        r"ввел\w* в заблуждение", r"в договоре оказал", r"уверял\w*, что",
+    ],
+    RISK_CATEGORIES[1]: [
+        r"под видом", r"вместо (вклада|карты|счета|кредита|\w+ карт)", r"сказав,? что это то же самое",
+        r"оформил\w* (совсем )?друг\w* продукт",
+    ],
+    RISK_CATEGORIES[2]: [
+        r"(совершенно |мне )?не подходит", r"не нужен и невыгод", r"не работает в моем городе",
+        r"пенсионер\w* .{0,40}(риск|инвест)",
+    ],
+    RISK_CATEGORIES[3]: [
+        r"(?<!ничего )(?<!не )навязал", r"только при (подключении|оформлении)", r"отказаться не дали",
+        r"без (оформления )?страховки .{0,30}не одобр",
+    ],
+    RISK_CATEGORIES[4]: [
+        r"без (моего )?ведома", r"(которую|который|которое) я не подключал", r"я не просил",
+        r"ничего не подписывал", r"не знал\w* о подписк",
+    ],
+}
+_RULES = {category: [re.compile(p) for p in patterns] for category, patterns in RULES.items()}
+
+
+def _normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def rule_match(text: str) -> Optional[str]:
+    """Категория, если правила указывают ровно на одну; иначе None"""
+    text = _normalize(text)
+    matched = [category for category, patterns in _RULES.items() if any(p.search(text) for p in patterns)]
+    return matched[0] if len(matched) == 1 else None
+
+
+def features(text: str) -> List[str]:
+    """Основы слов с отрицанием ("не_подкл") и пары соседних основ"""
+    stems, negate = [], False
+    for word in re.findall(r"[а-яa-z]+", _normalize(text)):
+        if word in ("не", "без", "ни"):
+            negate = True
+            continue
+        if len(word) > 2:
+            stems.append(("не_" if negate else "") + word[:STEM_LENGTH])
+        negate = False
+    return stems + [f"{a}+{b}" for a, b in zip(stems, stems[1:])]
+
+
+class NaiveBayes:
+    """Мультиномиальный наивный Байес со сглаживанием Лапласа"""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.doc_counts: Counter = Counter()
+        self.term_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.totals: Counter = Counter()
+        self.vocabulary = set()
+
+    def fit(self, texts: Iterable[str], labels: Iterable[str]) -> "NaiveBayes":
+        for text, label in zip(texts, labels):
+            terms = features(text)
+            self.doc_counts[label] += 1
+            self.term_counts[label].update(terms)
+            self.totals[label] += len(terms)
+            self.vocabulary.update(terms)
+        return self
+
+    @property
+    def size(self) -> int:
+        return sum(self.doc_counts.values())
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        terms = [term for term in features(text) if term in self.vocabulary]
+        n_docs, vocabulary = self.size, len(self.vocabulary)
+        scores = {}
+        for label, docs in self.doc_counts.items():
+            denominator = self.totals[label] + self.alpha * vocabulary
+            counts = self.term_counts[label]
+            scores[label] = math.log(docs / n_docs) + sum(
+                math.log((counts[term] + self.alpha) / denominator) for term in terms
+            )
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+
+class RiskClassifier:
+    """Гибридный классификатор: правила + модель, обученная на разметке LLM.
+
+    Жалобы с уверенностью ниже RISK_CONFIDENCE размечает LLM; эта разметка
+    сохраняется в state/risk_labels.jsonl и при следующем обучении расширяет
+    выборку, поэтому доля отзывов, требующих LLM, со временем снижается
+    """
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None, threshold: float = RISK_CONFIDENCE,
+                 min_labels: int = RISK_MIN_LABELS):
+        self.threshold = threshold
+        self.min_labels = min_labels
+        self.model: Optional[NaiveBayes] = None
+        self.trained_on = 0
+        if labels is not None:
+            self.train(labels)
+
+    def train(self, labels: Dict[str, str], texts: Optional[Dict[str, str]] = None):
+        """labels: id отзыва -> категория; texts: id -> текст (по умолчанию из отзывов)"""
+        if texts is None:
+            texts = {review_id: review.get("comment", "") for review_id, review in review_index().items()}
+        pairs = [(texts[review_id], label) for review_id, label in labels.items() if review_id in texts]
+        self.trained_on = len(pairs)
+        self.model = NaiveBayes().fit(*zip(*pairs)) if len(pairs) >= self.min_labels else None
+
+    def predict(self, review: Dict) -> Tuple[str, float, str]:
+        """(категория, уверенность, источник: rules | model | hybrid)"""
+        if not complaint(review):
+            return NO_RISK, 1.0, "rules"
+        text = review.get("comment", "")
+        rule = rule_match(text)
+        if self.model is None:
+            return (rule, RULE_CONFIDENCE, "rules") if rule else (NO_RISK, 0.0, "rules")
+        proba = self.model.predict_proba(text)
+        label = max(proba, key=proba.get)
+        if rule is None:
+            return label, proba[label], "model"
+        if rule == label:
+            return label, max(proba[label], RULE_CONFIDENCE), "hybrid"
+        # правило и модель расходятся — решает LLM
+        return rule, min(proba.get(rule, 0.0), RULE_CONFIDENCE) / 2, "hybrid"
+
+    def split(self, reviews: List[Dict]) -> Tuple[Dict[str, Dict], List[Dict]]:
+        """Уверенные предсказания и отзывы, которые нужно передать LLM"""
+        confident, uncertain = {}, []
+        for review in reviews:
+            label, confidence, source = self.predict(review)
+            if confidence >= self.threshold:
+                confident[review["id"]] = {"category": label, "confidence": round(confidence, 3), "source": source}
+            else:
+                uncertain.append(review)
+        return confident, uncertain
+
+
+# ----------------------------
+# Разметка LLM
+# ----------------------------
+_LABELS_LOCK = threading.Lock()
+
+
+def load_labels(path: str = LABELS_PATH) -> Dict[str, str]:
+    """Сохраненная разметка LLM: id отзыва -> категория (последняя запись побеждает)"""
+    labels = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    labels[row["id"]] = row["category"]
+    return labels
+
+
+def labels_version(labels: Dict[str, str]) -> str:
+    """Отпечаток содержимого разметки: меняется и при переразметке отзыва, а не только при новых метках"""
+    payload = json.dumps(sorted(labels.items()), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def save_labels(labels: Dict[str, str], path: str = LABELS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    now = datetime.now().isoformat(timespec="seconds")
+    with _LABELS_LOCK, open(path, 'a', encoding='utf-8') as f:
+        for review_id, category in labels.items():
+            f.write(json.dumps({"id": review_id, "category": category, "source": "llm", "ts": now}, ensure_ascii=False) + "\n")
+
+
+def build_label_prompt(reviews: List[Dict], practices: str) -> list:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    items = [{"id": review["id"], "text": review.get("comment", "")} for review in reviews]
+    return [
+        SystemMessage(content=(
+            "Вы классифицируете отзывы клиентов банка по категориям риска поведения.\n"
+            f"Описание категорий:\n{practices}\n\n"
+            f"Допустимые категории: {json.dumps(LABELS, ensure_ascii=False)}. "
+            f"Очереди, грубость, график работы и неисправные банкоматы — «{NO_RISK}».\n"
+            'Ответ строго в JSON: {"labels": {"<id>": "<категория>", ...}}'
+        )),
+        HumanMessage(content=json.dumps(items, ensure_ascii=False)),
+    ]
+
+
+def parse_labels(response, expected: Iterable[str]) -> Dict[str, str]:
+    content = response.content.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    labels = json.loads(content)["labels"]
+    missing = set(expected) - set(labels)
+    if missing or any(label not in LABELS for label in labels.values()):
+        raise ValueError(f"неполная или некорректная разметка: нет {len(missing)} отзывов")
+    return {review_id: labels[review_id] for review_id in expected}
+
+
+def label_with_llm(reviews: List[Dict], batch_size: int = RISK_LLM_BATCH) -> Dict[str, str]:
+    """Разметка отзывов LLM пачками; результат сохраняется для обучения"""
+    from model_router import invoke_with_escalation   # клиенты LLM нужны только при разметке
+
+    with open("data/wrongPractices.txt", 'r', encoding='utf-8') as f:
+        practices = f.read()
+    labels = {}
+    for start in range(0, len(reviews), batch_size):
+        batch = reviews[start:start + batch_size]
+        ids = [review["id"] for review in batch]
+        try:
+            batch_labels = invoke_with_escalation(
+                "risk_analysis", build_label_prompt(batch, practices), lambda response: parse_labels(response, ids)
+            )
+        except Exception:
+            logger.exception("llm labelling failed", extra={"batch": len(batch)})
+            continue
+        save_labels(batch_labels)
+        labels.update(batch_labels)
+    return labels
+
+
+_CLASSIFIER: Dict[str, tuple] = {}
+
+
+def get_classifier(labels: Optional[Dict[str, str]] = None) -> RiskClassifier:
+    """Классификатор, обученный на текущей разметке; переобучается при любом ее изменении.
+
+    labels — уже прочитанная разметка (load_labels), чтобы не читать файл повторно
+    """
+    labels = load_labels() if labels is None else labels
+    version = labels_version(labels)
+    cached = _CLASSIFIER.get("default")
+    if cached is None or cached[0] != version:
+        _CLASSIFIER["default"] = (version, RiskClassifier(labels))
+    return _CLASSIFIER["default"][1]
+
+
+def classify_reviews(reviews: List[Dict], use_llm: bool = False, llm_limit: int = RISK_LLM_LIMIT) -> Dict:
+    """Категории риска для отзывов: уверенные — локально, неуверенные — LLM (не больше llm_limit).
+
+    Разметка LLM (use_llm=True) — отдельный офлайн-шаг (python risk_classifier.py --label):
+    в инструментах агентов она задержала бы crew на пакетные запросы к LLM
+
+    Returns:
+        {"labels": id -> {"category", "confidence", "source"}, "stats": счетчики и время}
+    """
+    started = time.perf_counter()
+    stored = load_labels()
+    classifier = get_classifier(stored)
+    labels = {review["id"]: {"category": stored[review["id"]], "confidence": 1.0, "source": "llm"}
+              for review in reviews if review["id"] in stored}
+    pending = [review for review in reviews if review["id"] not in labels]
+    confident, uncertain = classifier.split(pending)
+    labels.update(confident)
+    local_seconds = time.perf_counter() - started
+
+    to_llm = uncertain[:llm_limit] if use_llm else []
+    llm_labels = label_with_llm(to_llm) if to_llm else {}
+    for review in uncertain:
+        if review["id"] in llm_labels:
+            labels[review["id"]] = {"category": llm_labels[review["id"]], "confidence": 1.0, "source": "llm"}
+        else:
+            label, confidence, source = classifier.predict(review)
+            labels[review["id"]] = {"category": label, "confidence": round(confidence, 3), "source": "uncertain"}
+    stats = {
+        "reviews": len(reviews),
+        "stored": len(reviews) - len(pending),
+        "local": len(confident),
+        "llm": len(llm_labels),
+        "uncertain": len(uncertain) - len(llm_labels),
+        "trained_on": classifier.trained_on,
+        "local_reviews_per_second": round(len(pending) / local_seconds) if local_seconds else None,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info("reviews classified", extra={"risk_stats": stats})
+    return {"labels": labels, "stats": stats}
+
+
+def risk_summary(reviews: List[Dict], use_llm: bool = False) -> Dict:
+    """Число отзывов по категориям и отделениям с примерами id — для агентов"""
+    result = classify_reviews(reviews, use_llm)
+    categories: Dict[str, Dict] = {}
+    for review in reviews:
+        label = result["labels"][review["id"]]
+        if label["category"] == NO_RISK:
+            continue
+        entry = categories.setdefault(label["category"], {"count": 0, "branches": Counter(), "examples": []})
+        entry["count"] += 1
+        entry["branches"][review.get("orgId")] += 1
+        if len(entry["examples"]) < 10:
+            entry["examples"].append({"id": review["id"], "orgId": review.get("orgId"), "source": label["source"]})
+    for entry in categories.values():
+        entry["branches"] = dict(entry["branches"].most_common())
+    return {"categories": categories, "stats": result["stats"]}
+
+
+# ----------------------------
+# Метрики
+# ----------------------------
+def evaluate(texts: Dict[str, Dict], labels: Dict[str, str], folds: int = 5,
+             threshold: float = RISK_CONFIDENCE, seed: int = 42) -> Dict:
+    """Кросс-валидация на разметке LLM: какую долю отзывов классификатор берет на себя
+    (покрытие), насколько эти решения совпадают с LLM (согласие) и скорость локальной классификации"""
+    ids = [review_id for review_id in labels if review_id in texts]
+    random.Random(seed).shuffle(ids)
+    handled = agreed = 0
+    seconds = 0.0
+    confusion: Dict[str, Counter] = defaultdict(Counter)
+    for fold in range(folds):
+        test = ids[fold::folds]
+        test_set = set(test)
+        classifier = RiskClassifier(threshold=threshold)
+        classifier.train({i: labels[i] for i in ids if i not in test_set},
+                         {i: texts[i].get("comment", "") for i in ids})
+        started = time.perf_counter()
+        confident, _ = classifier.split([texts[i] for i in test])
+        seconds += time.perf_counter() - started
+        for review_id, prediction in confident.items():
+            handled += 1
+            agreed += prediction["category"] == labels[review_id]
+            confusion[labels[review_id]][prediction["category"]] += 1
+    return {
+        "labels": len(ids),
+        "threshold": threshold,
+        "coverage": round(handled / len(ids), 3) if ids else 0.0,
+        "agreement": round(agreed / handled, 3) if handled else None,
+        "reviews_per_second": round(len(ids) / seconds) if seconds else None,
+        "confusion": {label: dict(row) for label, row in confusion.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Метрики классификатора рисков на сохраненной разметке LLM")
+    parser.add_argument("--reviews", default=REVIEWS_PATH, help="Файл отзывов")
+    parser.add_argument("--label", type=int, nargs="?", const=RISK_LLM_LIMIT, default=None, metavar="N",
+                        help="Вместо метрик: разметить LLM не больше N неуверенных отзывов и сохранить разметку")
+    parser.add_argument("--labels", default=None,
+                        help="Разметка: по умолчанию state/risk_labels.jsonl; "
+                             "для синтетических данных — labels.json из benchmarks/data/...")
+    parser.add_argument("--threshold", type=float, default=RISK_CONFIDENCE)
+    args = parser.parse_args()
+
+    reviews = load_reviews(args.reviews)
+    if args.label is not None:
+        print(json.dumps(classify_reviews(reviews, use_llm=True, llm_limit=args.label)["stats"], ensure_ascii=False, indent=2))
+        sys.exit(0)
+    if args.labels and args.labels.endswith(".json"):
+        # labels.json генератора — категории в порядке отзывов
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            labels = {review["id"]: label for review, label in zip(reviews, json.load(f))}
+    else:
+        labels = load_labels(args.labels or LABELS_PATH)
+    print(json.dumps(evaluate({review["id"]: review for review in reviews}, labels, threshold=args.threshold),
+                     ensure_ascii=False, indent=2))
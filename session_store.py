@@ -0,0 +1,230 @@
+import abc
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# ----------------------------
+# Хранилище пользовательских сессий бота
+# ----------------------------
+STATE_DIR = "state"
+SESSIONS_DB_PATH = os.path.join(STATE_DIR, "sessions.db")
+BLOBS_DIR = os.path.join(STATE_DIR, "blobs")
+# Сессии без активности (чтения или записи) дольше этого срока удаляются
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(30 * 24 * 3600)))
+# Сколько сессий держать в памяти одновременно
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+EVICTION_INTERVAL = 3600
+
+
+class BlobStore:
+    """Крупные тексты (отчеты, контекст) хранятся на диске, в сессии — только ссылка"""
+
+    def __init__(self, path: str = BLOBS_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def put(self, text: str) -> str:
+        # адресация по содержимому: одинаковые отчеты разных пользователей хранятся один раз
+        ref = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        path = os.path.join(self.path, ref)
+        if not os.path.exists(path):
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+        return ref
+
+    def get(self, ref: str) -> Optional[str]:
+        path = os.path.join(self.path, ref)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def remove_unreferenced(self, refs: set):
+        for name in os.listdir(self.path):
+            if name not in refs and not name.endswith(".tmp"):
+                os.remove(os.path.join(self.path, name))
+
+
+class UserSession:
+    """Сессия пользователя; last_results и context читаются с диска только при обращении"""
+
+    def __init__(self, user_id, blobs: Optional[BlobStore] = None):
+        self.user_id = user_id
+        self.current_query = None
+        self.analysis_in_progress = False
+        self.full_report = None
+        self.pending_question = None  # вопрос, на который выдан ответ из кеша
+        self._blobs = blobs
+        self._refs: Dict[str, Optional[str]] = {"last_results": None, "context": None}
+        self._values: Dict[str, Optional[str]] = {}
+
+    def _get_text(self, name: str, default):
+        if name not in self._values:
+            ref = self._refs[name]
+            self._values[name] = self._blobs.get(ref) if ref and self._blobs else None
+        value = self._values[name]
+        return default if value is None else value
+
+    def _set_text(self, name: str, value: Optional[str]):
+        self._values[name] = value
+        self._refs[name] = self._blobs.put(value) if value and self._blobs else None
+
+    @property
+    def last_results(self) -> Optional[str]:
+        return self._get_text("last_results", None)
+
+    @last_results.setter
+    def last_results(self, value: Optional[str]):
+        self._set_text("last_results", value)
+
+    @property
+    def context(self) -> str:
+        return self._get_text("context", "")
+
+    @context.setter
+    def context(self, value: str):
+        self._set_text("context", value)
+
+
+class SessionStore(abc.ABC):
+    """Интерфейс хранилища сессий"""
+
+    def create(self, user_id) -> UserSession:
+        session = UserSession(user_id)
+        self.save(session)
+        return session
+
+    @abc.abstractmethod
+    def get(self, user_id) -> Optional[UserSession]:
+        ...
+
+    @abc.abstractmethod
+    def save(self, session: UserSession):
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Сессии в памяти процесса (теряются при перезапуске)"""
+
+    def __init__(self):
+        self.sessions: Dict[int, UserSession] = {}
+
+    def get(self, user_id) -> Optional[UserSession]:
+        return self.sessions.get(user_id)
+
+    def save(self, session: UserSession):
+        self.sessions[session.user_id] = session
+
+
+class SQLiteSessionStore(SessionStore):
+    """Сессии в SQLite с ограниченным LRU-кешем в памяти и удалением по TTL.
+
+    Чтение из кеша не обращается к базе: время последнего обращения копится в памяти
+    и записывается вместе с ближайшим save или перед удалением просроченных сессий
+    """
+
+    def __init__(self, path: str = SESSIONS_DB_PATH, ttl: int = SESSION_TTL, cache_size: int = SESSION_CACHE_SIZE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.blobs = BlobStore()
+        self._cache: "OrderedDict[int, UserSession]" = OrderedDict()
+        self._touched: Dict[int, float] = {}   # user_id -> время чтения, еще не записанное в базу
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id INTEGER PRIMARY KEY,
+                current_query TEXT,
+                analysis_in_progress INTEGER NOT NULL DEFAULT 0,
+                pending_question TEXT,
+                last_results_ref TEXT,
+                context_ref TEXT,
+                updated_at REAL NOT NULL
+            )""")
+        self._db.commit()
+
+    def create(self, user_id) -> UserSession:
+        session = UserSession(user_id, self.blobs)
+        self.save(session)
+        return session
+
+    def _remember(self, session: UserSession):
+        self._cache[session.user_id] = session
+        self._cache.move_to_end(session.user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _flush_touched(self):
+        # вызывается под self._lock; commit выполняет вызывающий
+        if self._touched:
+            self._db.executemany(
+                "UPDATE sessions SET updated_at = MAX(updated_at, ?) WHERE user_id = ?",
+                [(seen, user_id) for user_id, seen in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get(self, user_id) -> Optional[UserSession]:
+        self.evict_expired()
+        with self._lock:
+            if user_id in self._cache:
+                # TTL отсчитывается от последнего обращения: сессию, которую только читают, не удаляем
+                self._touched[user_id] = time.time()
+                self._cache.move_to_end(user_id)
+                return self._cache[user_id]
+            row = self._db.execute(
+                "SELECT current_query, analysis_in_progress, pending_question, last_results_ref, context_ref "
+                "FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touched[user_id] = time.time()
+            session = UserSession(user_id, self.blobs)
+            session.current_query, in_progress, session.pending_question = row[0], row[1], row[2]
+            session.analysis_in_progress = bool(in_progress)
+            session._refs = {"last_results": row[3], "context": row[4]}
+            self._remember(session)
+            return session
+
+    def save(self, session: UserSession):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session.user_id, session.current_query, int(session.analysis_in_progress),
+                 session.pending_question, session._refs["last_results"], session._refs["context"], time.time())
+            )
+            self._touched.pop(session.user_id, None)
+            self._flush_touched()
+            self._db.commit()
+            self._remember(session)
+
+    def evict_expired(self, force: bool = False):
+        """Удаляет просроченные сессии и файлы отчетов, на которые больше никто не ссылается"""
+        if not force and time.time() - self._last_eviction < EVICTION_INTERVAL:
+            return
+        with self._lock:
+            self._last_eviction = time.time()
+            self._flush_touched()
+            expired = [row[0] for row in self._db.execute(
+                "SELECT user_id FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+            )]
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            for user_id in expired:
+                self._cache.pop(user_id, None)
+            refs = {ref for row in self._db.execute("SELECT last_results_ref, context_ref FROM sessions")
+                    for ref in row if ref}
+            self.blobs.remove_unreferenced(refs)
+
+
+def create_session_store() -> SessionStore:
+    """Хранилище по переменной SESSION_STORE: sqlite (по умолчанию) или memory"""
+    if os.getenv("SESSION_STORE", "sqlite") == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore()
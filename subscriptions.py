@@ -0,0 +1,39 @@
+import json
+import os
+import threading
+from typing import List
+
+# ----------------------------
+# Подписчики на автоматические отчеты
+# ----------------------------
+STATE_DIR = "state"
+SUBSCRIBERS_PATH = os.path.join(STATE_DIR, "subscribers.json")
+# подписка и отписка из разных обработчиков бота не должны терять изменения друг друга
+_SUBSCRIBERS_LOCK = threading.Lock()
+
+
+def load_subscribers() -> List[int]:
+    """Возвращает chat_id пользователей, подписанных на обновления отчета"""
+    if not os.path.exists(SUBSCRIBERS_PATH):
+        return []
+    with open(SUBSCRIBERS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_subscribers(chat_ids: List[int]):
+    # запись через временный файл: планировщик не прочитает наполовину записанный список
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp_path = SUBSCRIBERS_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(set(chat_ids)), f)
+    os.replace(tmp_path, SUBSCRIBERS_PATH)
+
+
+def subscribe(chat_id: int):
+    with _SUBSCRIBERS_LOCK:
+        _save_subscribers(load_subscribers() + [chat_id])
+
+
+def unsubscribe(chat_id: int):
+    with _SUBSCRIBERS_LOCK:
+        _save_subscribers([c for c in load_subscribers() if c != chat_id])
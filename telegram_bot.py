@@ -2,71 +2,40 @@ import os
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler
-import json
-import logging
-#from bank_analyzer import analyze_bank_reviews  # Теперь функция возвращает строку
-from telegram.constants import ParseMode
 
 import asyncio
-from typing import Optional
 
 # Загрузка вашего существующего кода
-from main import analyze_bank_reviews, shared_memory  # Импортируем основные функции и память
+from main import analyze_bank_reviews_async, shared_memory  # Импортируем основные функции и память
+from subscriptions import subscribe, unsubscribe
+from answer_cache import answer_cache
+from message_delivery import split_message, send_queue, deliver_report
+from session_store import UserSession, create_session_store
+from event_log import setup_logging, get_logger
+from job_queue import JobQueue, QUEUED, RUNNING, DONE, FAILED
+from analysis_worker import JOB_POLL_INTERVAL
+from checkpoint import RUNS_DIR
+from profiling import PROFILE_RUNS, summarize_profiles, format_profile_summary
 
 # Загрузка переменных окружения
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
-# --- Новая функция для разбивки сообщений ---
-def split_message(text: str, max_length: int = 4000) -> list:
-    """Умная разбивка текста с сохранением структуры"""
-    if not text:
-        return []
-    
-    if len(text) <= max_length:
-        return [text]
-    
-    # Приоритеты разбивки: абзацы → предложения → слова → принудительно
-    split_chars = ['\n\n', '\n', '. ', '! ', '? ', ' ', '']
-    
-    parts = []
-    remaining = text
-    
-    while remaining:
-        for delimiter in split_chars:
-            pos = remaining.rfind(delimiter, 0, max_length) if delimiter else max_length
-            if pos > 0:
-                part = remaining[:pos + (len(delimiter) if delimiter else pos)]
-                parts.append(part.strip())
-                remaining = remaining[pos + len(delimiter):].strip()
-                break
-        else:
-            parts.append(remaining[:max_length])
-            remaining = remaining[max_length:]
-    
-    return parts
-# -------------------------------------------
-
-# Глобальное хранилище сессий
-user_sessions = {}
-
-logging.basicConfig(
-    filename='bot.log',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-class UserSession:
-    def __init__(self, user_id):
-        self.user_id = user_id
-        self.current_query = None
-        self.analysis_in_progress = False
-        self.last_results = None
-        self.full_report = None  
-        self.context = ""
+
+# Хранилище сессий (SQLite по умолчанию, см. SESSION_STORE)
+session_store = create_session_store()
+
+# Где выполняется анализ: queue — в процессах analysis_worker.py, inline — в процессе бота
+ANALYSIS_BACKEND = os.getenv("ANALYSIS_BACKEND", "queue")
+job_queue = JobQueue()
+
+# Журнал событий: log/events-telegram_bot.jsonl (см. event_log.py)
+setup_logging()
+logger = get_logger("telegram_bot")
 
 async def start(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    user_sessions[user_id] = UserSession(user_id)
+    session_store.create(user_id)
     
     keyboard = [
         [InlineKeyboardButton("🔍 Анализ рисков", callback_data='start_analysis')],
@@ -87,94 +56,203 @@ async def handle_callback(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    session = user_sessions.get(user_id, UserSession(user_id))
+    session = session_store.get(user_id) or session_store.create(user_id)
 
     if query.data == 'start_analysis':
         session.analysis_in_progress = True
+        session_store.save(session)
         await query.edit_message_text("📝 Введите ваш запрос для анализа (например: 'Найти инциденты с навязыванием услуг за последний месяц')")
     
     elif query.data == 'last_results' and session.last_results:
         await query.edit_message_text(f"📋 Последние результаты:\n\n{session.last_results[:4000]}...")
     
     elif query.data == 'show_memory':
-        memory_context = shared_memory.get_context()
-        await query.edit_message_text(f"🧠 Текущий контекст памяти:\n\n{memory_context[:4000]}...")
+        # контекст последнего анализа пользователя: при ANALYSIS_BACKEND=queue анализ идет
+        # в процессе воркера, и память этого процесса (shared_memory) остается пустой
+        if session.context:
+            await query.edit_message_text(f"🧠 Текущий контекст памяти:\n\n{session.context[:4000]}...")
+        else:
+            await query.edit_message_text("⚠️ Контекст пуст.")
     
     elif query.data == 'full_report':
         if session.last_results:
-            chunks = split_message(session.last_results)
-            for chunk in chunks:
-                await query.message.reply_text(chunk)
+            await deliver_report(context.bot, query.message.chat_id, session.last_results)
+        else:
+            await query.edit_message_text("⚠️ Нет доступных результатов для отображения.")
+    elif query.data == 'report_file':
+        if session.last_results:
+            await deliver_report(context.bot, query.message.chat_id, session.last_results, as_document=True)
         else:
             await query.edit_message_text("⚠️ Нет доступных результатов для отображения.")
     elif query.data == 'show_context':
-        # Получаем актуальный контекст из общей памяти
-        current_context = shared_memory.get_context()
-        if current_context:
-            chunks = split_message(current_context)
-            for chunk in chunks:
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=chunk
-                )
+        # контекст, сохраненный с результатом последнего анализа (см. finish_analysis)
+        if session.context:
+            for chunk in split_message(session.context):
+                await send_queue.send_text(context.bot, query.message.chat_id, chunk)
         else:
             await query.edit_message_text("⚠️ Контекст пуст.")
 
+    elif query.data == 'force_fresh':
+        if session.pending_question:
+            question, session.pending_question = session.pending_question, None
+            session_store.save(session)
+            await run_analysis(query.message, session, question)
+        else:
+            await query.edit_message_text("⚠️ Нет вопроса для повторного анализа.")
+
     elif query.data == 'clear_context':
         session.context = ""  # Или session.context = ""
+        session_store.save(session)
         await query.edit_message_text("✅ Контекст очищен.")
 
 async def handle_message(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    session = user_sessions.get(user_id)
+    session = session_store.get(user_id)
     
     if not session or not session.analysis_in_progress:
         await update.message.reply_text("Пожалуйста, выберите действие через меню /start")
         return
+
+    question = update.message.text
+    cached = answer_cache.lookup(question)
+    if cached:
+        # похожий вопрос уже анализировался на тех же данных — отдаем готовый отчет
+        session.pending_question = question
+        session.last_results = cached["report"]
+        session.analysis_in_progress = False
+        session_store.save(session)
+        await update.message.reply_text(
+            f"⚡ Найден готовый отчет на похожий вопрос (совпадение {cached['similarity']:.0%}):\n"
+            f"«{cached['question']}» от {cached['created']}"
+        )
+        await deliver_report(context.bot, update.effective_chat.id, cached["report"])
+        keyboard = [
+            [InlineKeyboardButton("🔄 Запустить свежий анализ", callback_data='force_fresh')],
+            [InlineKeyboardButton("🔍 Новый вопрос", callback_data='start_analysis')]
+        ]
+        await update.message.reply_text("Выберите действие:", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+
+    await run_analysis(update.message, session, question)
+
+async def run_analysis(message, session: UserSession, question: str):
+    if ANALYSIS_BACKEND == "queue":
+        # анализ выполняют процессы analysis_worker.py; результат отправит deliver_finished_jobs
+        job_id = await asyncio.to_thread(job_queue.submit, question, message.chat_id, session.user_id)
+        session.analysis_in_progress = False
+        session_store.save(session)
+        position = await asyncio.to_thread(job_queue.position, job_id)
+        await message.reply_text(
+            f"📥 Запрос поставлен в очередь (задание {job_id}, перед ним: {position}).\n"
+            "Отчет придет автоматически, статус — /status"
+        )
+        return
     try:
-        await update.message.reply_text("🔄 Агенты анализируют данные...")
+        await message.reply_text("🔄 Агенты анализируют данные...")
         
         # Получаем ОТЧЕТ (не вывод критика)
-        report = analyze_bank_reviews(update.message.text)
-        
-        # Сохраняем и отправляем
-        session.last_results = report
-        session.analysis_in_progress = False
+        report = await analyze_bank_reviews_async(question)
+        await finish_analysis(message.get_bot(), message.chat_id, session, question, report, shared_memory.get_context())
+    except Exception as e:
+        logger.exception("analysis request failed", extra={"user_id": session.user_id})
+        await message.reply_text(f"❌ Ошибка при анализе: {str(e)[:300]}")
+
+async def finish_analysis(bot, chat_id: int, session: UserSession, question: str, report: str, memory_context: str):
+    # Сохраняем и отправляем
+    session.last_results = report
+    session.analysis_in_progress = False
+    session_store.save(session)
+    # в кеш попадают только одобренные отчеты
+    if "⚠️ Достигнут лимит доработок" not in report:
+        answer_cache.store(question, report)
+    
+    # Разбиваем отчет на части (длинный отчет уходит файлом)
+    await deliver_report(bot, chat_id, report)
+    session.context = memory_context
+    session_store.save(session)
         
-        # Разбиваем отчет на части
-        chunks = split_message(report)
-        for chunk in chunks:
-            await update.message.reply_text(chunk)
-        session.context = shared_memory.get_context()
-            
-        # Отдельно показываем кнопки
-        keyboard = [
-            [InlineKeyboardButton("🔄 Новый анализ", callback_data='start_analysis')],
-            [InlineKeyboardButton("📋 Полный отчет", callback_data='full_report')],
-            [InlineKeyboardButton("🧠 Показать контекст", callback_data='show_context')],
-            [InlineKeyboardButton("❌ Очистить контекст", callback_data='clear_context')]
-            
+    # Отдельно показываем кнопки
+    keyboard = [
+        [InlineKeyboardButton("🔄 Новый анализ", callback_data='start_analysis')],
+        [InlineKeyboardButton("📋 Полный отчет", callback_data='full_report')],
+        [InlineKeyboardButton("📎 Отчет файлом", callback_data='report_file')],
+        [InlineKeyboardButton("🧠 Показать контекст", callback_data='show_context')],
+        [InlineKeyboardButton("❌ Очистить контекст", callback_data='clear_context')]
+    ]
+    await send_queue.send_text(bot, chat_id, "Выберите действие:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-        ]
-        await update.message.reply_text("Выберите действие:",  reply_markup=InlineKeyboardMarkup(keyboard))        
-    except Exception as e:
-        logging.error(f"Ошибка: {str(e)}")
-        await update.message.reply_text(f"❌ Ошибка при анализе: {str(e)[:300]}")
+async def deliver_finished_jobs(application: Application):
+    """Фоновая задача: отправляет пользователям результаты завершенных заданий"""
+    while True:
+        try:
+            for job in await asyncio.to_thread(job_queue.undelivered):
+                if job["status"] == DONE:
+                    session = session_store.get(job["user_id"]) or session_store.create(job["user_id"])
+                    await finish_analysis(application.bot, job["chat_id"], session, job["question"],
+                                          job["result"], job["context"] or "")
+                else:
+                    await send_queue.send_text(
+                        application.bot, job["chat_id"], f"❌ Ошибка при анализе: {(job['error'] or '')[:300]}"
+                    )
+                await asyncio.to_thread(job_queue.mark_delivered, job["id"])
+        except Exception:
+            logger.exception("job delivery failed")
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def start_job_delivery(application: Application):
+    if ANALYSIS_BACKEND == "queue":
+        asyncio.create_task(deliver_finished_jobs(application))
+
+async def status_command(update: Update, context: CallbackContext):
+    jobs = await asyncio.to_thread(job_queue.user_jobs, update.effective_user.id)
+    if not jobs:
+        await update.message.reply_text("Заданий нет")
+        return
+    labels = {QUEUED: "⏳ в очереди", RUNNING: "🔄 выполняется", DONE: "✅ готово", FAILED: "❌ ошибка"}
+    lines = []
+    for job in jobs:
+        state = labels.get(job["status"], job["status"])
+        if job["status"] == QUEUED:
+            state += f" (перед ним: {await asyncio.to_thread(job_queue.position, job['id'])})"
+        lines.append(f"{job['id']}: {state}\n   «{job['question'][:80]}»")
+    await update.message.reply_text("\n".join(lines))
+
+async def profile_command(update: Update, context: CallbackContext):
+    summary = await asyncio.to_thread(summarize_profiles, RUNS_DIR)
+    if summary is None:
+        hint = "" if PROFILE_RUNS else " Включите профилирование: PROFILE_RUNS=true"
+        await update.message.reply_text("Нет запусков с профилем." + hint)
+        return
+    await update.message.reply_text(format_profile_summary(summary))
+
+async def subscribe_command(update: Update, context: CallbackContext):
+    subscribe(update.effective_chat.id)
+    await update.message.reply_text("🔔 Вы подписаны на автоматическое обновление отчета при поступлении новых отзывов")
+
+async def unsubscribe_command(update: Update, context: CallbackContext):
+    unsubscribe(update.effective_chat.id)
+    await update.message.reply_text("🔕 Подписка на обновления отчета отменена")
 
 async def error_handler(update: Update, context: CallbackContext):
     await update.message.reply_text(f"⚠️ Произошла ошибка: {context.error}")
 
 def main():
     # Создаем приложение бота
-    application = Application.builder().token(TOKEN).build()
+    # обработчики выполняются параллельно: анализы разных пользователей перекрываются в одном цикле
+    application = Application.builder().token(TOKEN).concurrent_updates(True).post_init(start_job_delivery).build()
     
     # Регистрируем обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(CallbackQueryHandler(handle_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_error_handler(error_handler)
     
     # Запускаем бота
+    logger.info("bot started")
     print("🤖 Бот запущен...")
     application.run_polling()
 
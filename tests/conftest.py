@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# модули проекта лежат в корне репозитория и открывают data/, config/ относительно него
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    monkeypatch.chdir(ROOT)
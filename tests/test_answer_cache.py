@@ -0,0 +1,87 @@
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache, SIMILARITY_THRESHOLD
+
+DEFAULT_QUESTION = ("Проанализируйте данные из клиентских комментариев и найдите инциденты "
+                    "операционного риска в отделениях")
+
+# (сохраненный вопрос, новый вопрос) — ответ из кеша подходит
+PARAPHRASES = [
+    (DEFAULT_QUESTION, "найдите инциденты операционного риска в отделениях"),
+    (DEFAULT_QUESTION, "найти инциденты операционных рисков по отделениям"),
+    ("найдите инциденты операционного риска в отделениях", "найти инциденты операционных рисков по отделениям"),
+    ("Какие отделения получают больше всего жалоб на скрытые комиссии",
+     "в каких отделениях больше всего жалоб на скрытые комиссии"),
+    ("Найдите случаи навязывания услуг и подключения подписок без ведома клиента",
+     "найти случаи навязывания услуг и подключения подписок без ведома клиентов"),
+    ("Сравните отделения по качеству обслуживания и рискам поведения",
+     "сравнить отделения по качеству обслуживания и риску поведения"),
+]
+
+# (сохраненный вопрос, новый вопрос) — нужен новый анализ
+DIFFERENT = [
+    ("найдите инциденты операционного риска в отделениях",
+     "какие отделения получают больше всего жалоб на скрытые комиссии"),
+    ("найдите инциденты операционного риска в отделениях", "найдите случаи навязывания страховки в отделениях"),
+    ("сравните отделения по качеству обслуживания", "сравните отделения по числу жалоб на комиссии"),
+    ("какие жалобы на очереди в отделениях", "какие жалобы на скрытые комиссии в отделениях"),
+    ("навязывание страховки при выдаче кредита", "отказ в выдаче кредита"),
+    (DEFAULT_QUESTION, "Найдите случаи навязывания услуг и подключения подписок без ведома клиента"),
+]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "data_version", lambda: "v1")
+    return AnswerCache(str(tmp_path / "answer_cache.json"))
+
+
+@pytest.mark.parametrize("stored, asked", PARAPHRASES)
+def test_paraphrase_is_served_from_cache(cache, stored, asked):
+    cache.store(stored, "отчет")
+    hit = cache.lookup(asked)
+    assert hit is not None and hit["report"] == "отчет"
+    assert hit["similarity"] >= SIMILARITY_THRESHOLD
+
+
+@pytest.mark.parametrize("stored, asked", DIFFERENT)
+def test_different_question_misses(cache, stored, asked):
+    cache.store(stored, "отчет")
+    assert cache.lookup(asked) is None
+
+
+def test_negation_changes_scope(cache):
+    cache.store("найдите отделения с жалобами на навязывание страховки", "отчет")
+    assert cache.lookup("найдите отделения без жалоб на навязывание страховки") is None
+
+
+def test_data_change_invalidates_entries(cache, monkeypatch):
+    cache.store(DEFAULT_QUESTION, "отчет")
+    monkeypatch.setattr(answer_cache, "data_version", lambda: "v2")
+    assert cache.lookup(DEFAULT_QUESTION) is None
+    assert cache.entries == []
+
+
+def test_entries_survive_reload(cache):
+    cache.store(DEFAULT_QUESTION, "отчет")
+    reloaded = AnswerCache(cache.path)
+    assert reloaded.lookup(DEFAULT_QUESTION)["report"] == "отчет"
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "data_version", lambda: "v1")
+    cache = AnswerCache(str(tmp_path / "answer_cache.json"), size=2)
+    cache.store("инциденты операционного риска", "риски")
+    cache.store("жалобы на скрытые комиссии", "комиссии")
+    assert cache.lookup("инциденты операционного риска") is not None   # теперь используется последним
+    cache.store("навязывание страховки при выдаче кредита", "страховка")
+    assert [entry["report"] for entry in cache.entries] == ["риски", "страховка"]
+
+
+def test_expired_entries_are_not_served(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "data_version", lambda: "v1")
+    cache = AnswerCache(str(tmp_path / "answer_cache.json"), ttl=3600)
+    cache.store(DEFAULT_QUESTION, "отчет")
+    cache.entries[0]["created"] = "2000-01-01T00:00:00"
+    assert cache.lookup(DEFAULT_QUESTION) is None
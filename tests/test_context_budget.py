@@ -0,0 +1,42 @@
+from context_budget import ContextBudget, count_tokens, fit_items, truncate_to_tokens
+
+
+def test_fit_items_keeps_everything_within_limit():
+    items = [{"id": i, "comment": "короткий отзыв"} for i in range(5)]
+    assert fit_items(items, limit=10_000) == items
+
+
+def test_fit_items_truncates_with_note():
+    items = [{"id": i, "comment": "длинный отзыв " * 20} for i in range(50)]
+    result = fit_items(items, limit=500, hint="Уточните запрос.")
+    shown, note = result[:-1], result[-1]
+    assert shown == items[:len(shown)]
+    assert 0 < len(shown) < len(items)
+    assert note["note"] == f"Показано {len(shown)} из {len(items)} записей (лимит контекста). Уточните запрос."
+
+
+def test_fit_items_custom_render():
+    items = ["а" * 40] * 10
+    result = fit_items(items, limit=25, render=lambda item: item)
+    assert len(result) == 3 and "note" in result[-1]
+
+
+def test_truncate_keeps_head_and_tail():
+    text = "начало " + "середина " * 500 + "конец"
+    result = truncate_to_tokens(text, 100)
+    assert count_tokens(result) <= 100
+    assert result.startswith("начало") and result.endswith("конец")
+    assert truncate_to_tokens("короткий текст", 100) == "короткий текст"
+
+
+def test_budget_trims_low_priority_first():
+    budget = ContextBudget("test", limit=300)
+    budget.add("instructions", "Инструкция задачи.", required=True)
+    budget.add("feedback", "замечание " * 200, priority=2)
+    budget.add("results", "результат " * 200, priority=1)
+    prompt = budget.assemble()
+    parts = {c.name: c.tokens for c in budget.components}
+    assert count_tokens(prompt) <= 300
+    assert prompt.startswith("Инструкция задачи.")
+    # результаты (приоритет 1) сокращаются раньше замечаний (приоритет 2)
+    assert parts["results"] < parts["feedback"]
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from geo_index import REGION_EXAMPLES, GeoIndex, detect_region, haversine_km
+
+CENTER = (55.7539, 37.6208)
+
+
+@pytest.fixture(scope="module")
+def companies():
+    rng = random.Random(7)
+    companies = {
+        org_id: {
+            "name": f"Отделение {org_id}",
+            "address": f"ул. Тестовая, {org_id}",
+            "geo_position": {"latitude": CENTER[0] + rng.uniform(-0.3, 0.3),
+                             "longitude": CENTER[1] + rng.uniform(-0.5, 0.5)},
+        }
+        for org_id in range(1, 301)
+    }
+    companies[999] = {"name": "Без координат", "address": "-"}
+    return companies
+
+
+def brute_force(companies, lat, lon):
+    return sorted(
+        (haversine_km(lat, lon, c["geo_position"]["latitude"], c["geo_position"]["longitude"]), org_id)
+        for org_id, c in companies.items() if c.get("geo_position")
+    )
+
+
+@pytest.mark.parametrize("radius_km", [0.5, 2.0, 5.0, 25.0])
+def test_within_radius_matches_brute_force(companies, radius_km):
+    found = GeoIndex(companies).within_radius(*CENTER, radius_km)
+    expected = [org_id for distance, org_id in brute_force(companies, *CENTER) if distance <= radius_km]
+    assert [branch["id"] for branch in found] == expected
+    assert all(branch["distance_km"] <= radius_km for branch in found)
+
+
+@pytest.mark.parametrize("k", [1, 5, 50, 1000])
+def test_nearest_matches_brute_force(companies, k):
+    point = (55.9, 37.3)
+    found = GeoIndex(companies).nearest(*point, k=k)
+    assert [branch["id"] for branch in found] == [org_id for _, org_id in brute_force(companies, *point)[:k]]
+
+
+def test_in_bbox(companies):
+    box = (55.70, 37.55, 55.80, 37.70)
+    found = [branch["id"] for branch in GeoIndex(companies).in_bbox(*box)]
+    expected = sorted(
+        org_id for org_id, c in companies.items() if c.get("geo_position")
+        and box[0] <= c["geo_position"]["latitude"] <= box[2] and box[1] <= c["geo_position"]["longitude"] <= box[3]
+    )
+    assert found == expected
+
+
+def test_haversine_known_distance():
+    # один градус широты ~ 111.2 км
+    assert haversine_km(55.0, 37.0, 56.0, 37.0) == pytest.approx(111.2, abs=0.1)
+
+
+@pytest.mark.parametrize("question, expected", REGION_EXAMPLES)
+def test_detect_region(question, expected):
+    assert (detect_region(question) or (None,))[0] == expected
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(os.path.join(tmp_path, "jobs.db"))
+
+
+def _age_heartbeat(queue: JobQueue, job_id: str, seconds: float):
+    queue._connect().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - seconds, job_id))
+
+
+def test_claim_takes_oldest_job(queue):
+    first = queue.submit("первый", chat_id=1, user_id=10)
+    second = queue.submit("второй", chat_id=1, user_id=10, per_branch=True)
+    assert queue.position(second) == 1
+
+    job = queue.claim("w1")
+    assert job["id"] == first
+    assert (job["status"], job["worker"], job["attempts"]) == (RUNNING, "w1", 1)
+    assert job["question"] == "первый" and job["per_branch"] is False
+    assert queue.claim("w2")["id"] == second
+    assert queue.claim("w3") is None
+
+
+def test_concurrent_claims_do_not_share_jobs(queue):
+    job_ids = {queue.submit(f"вопрос {i}") for i in range(20)}
+    claimed, lock = [], threading.Lock()
+
+    def worker(name):
+        while (job := queue.claim(name)) is not None:
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_complete_only_by_owner(queue):
+    job_id = queue.submit("вопрос")
+    queue.claim("w1")
+    assert not queue.complete(job_id, "w2", "чужой результат")
+    assert queue.complete(job_id, "w1", "отчет")
+    job = queue.get(job_id)
+    assert (job["status"], job["result"]) == (DONE, "отчет")
+    assert [j["id"] for j in queue.undelivered()] == [job_id]
+    queue.mark_delivered(job_id)
+    assert queue.undelivered() == []
+
+
+def test_requeue_stale_returns_job_to_queue(queue):
+    job_id = queue.submit("вопрос")
+    queue.claim("w1")
+    assert queue.requeue_stale(stale_seconds=60) == 0
+
+    _age_heartbeat(queue, job_id, 120)
+    assert queue.requeue_stale(stale_seconds=60) == 1
+    assert queue.get(job_id)["status"] == QUEUED
+
+    # прежний воркер не может записать результат задания, которое забрал другой
+    assert queue.claim("w2")["attempts"] == 2
+    assert not queue.complete(job_id, "w1", "устаревший результат")
+    assert queue.complete(job_id, "w2", "отчет")
+
+
+def test_requeue_stale_fails_after_max_attempts(queue):
+    job_id = queue.submit("вопрос")
+    for attempt in range(2):
+        queue.claim(f"w{attempt}")
+        _age_heartbeat(queue, job_id, 120)
+        queue.requeue_stale(stale_seconds=60, max_attempts=2)
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"]
+
+
+def test_heartbeat_keeps_job_running(queue):
+    job_id = queue.submit("вопрос")
+    queue.claim("w1")
+    _age_heartbeat(queue, job_id, 120)
+    queue.heartbeat(job_id, "w1")
+    assert queue.requeue_stale(stale_seconds=60) == 0
+    assert queue.get(job_id)["status"] == RUNNING
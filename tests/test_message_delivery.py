@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("telegram")
+
+from message_delivery import FENCE, _blocks, split_message
+
+
+def _balanced(chunk: str) -> bool:
+    """Ограничители блоков кода (на отдельных строках) в сообщении парные"""
+    return sum(1 for line in chunk.split("\n") if line.strip().startswith(FENCE)) % 2 == 0
+
+
+def test_short_text_is_single_message():
+    assert split_message("короткий отчет", max_length=100) == ["короткий отчет"]
+    assert split_message("", max_length=100) == []
+
+
+def test_chunks_respect_max_length():
+    text = "\n\n".join(f"Абзац {i}. " + "слово " * 30 for i in range(20))
+    chunks = split_message(text, max_length=300)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+
+
+def test_long_line_is_split_by_words():
+    text = "слово " * 200
+    chunks = split_message(text, max_length=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_code_block_stays_closed():
+    code = "```python\n" + "\n".join(f"x{i} = {i}" for i in range(100)) + "\n```"
+    chunks = split_message("Код:\n\n" + code, max_length=200)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert all(_balanced(chunk) for chunk in chunks)
+    code_chunks = [chunk for chunk in chunks if FENCE in chunk]
+    assert all(chunk.startswith("```python\n") and chunk.endswith("\n```") for chunk in code_chunks)
+
+
+def test_unclosed_code_block_is_closed():
+    blocks = _blocks("```\nx = 1")
+    assert blocks == [("code", ["```", "x = 1", "```"])]
+
+
+def test_inline_fence_does_not_open_code_block():
+    text = "Команда ```make test``` запускает тесты.\nДальше обычный текст."
+    assert _blocks(text) == [("text", text.split("\n"))]
+    chunks = split_message((text + "\n\n") * 30, max_length=200)
+    assert all("```\n" not in chunk for chunk in chunks)
+
+
+def test_table_header_repeated_in_each_part():
+    header = "| Отделение | Жалобы |\n|---|---|"
+    rows = "\n".join(f"| Отделение {i} | {i} |" for i in range(60))
+    chunks = split_message(f"{header}\n{rows}", max_length=300)
+    assert len(chunks) > 1
+    assert all(chunk.startswith(header) for chunk in chunks)
+    assert all(len(chunk) <= 300 for chunk in chunks)
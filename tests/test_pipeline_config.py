@@ -0,0 +1,89 @@
+import copy
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from evidence import CITATION_FORMAT
+from pipeline_config import PipelineConfig, PipelineConfigError, TextTemplate, load_pipeline_config
+
+AGENT = {"role": "Аналитик", "goal": "Анализ отзывов", "backstory": "Опыт в банке", "tools": ["search_reviews"]}
+RAW = {
+    "agents": {"analyst": AGENT, "writer": {**AGENT, "role": "Автор отчетов", "tools": []}},
+    "tasks": {
+        "analysis": {"agent": "analyst", "description": "Вопрос: {question}", "expected_output": "Выводы"},
+        "report": {"agent": "writer", "description": ["Отчет по вопросу {question}", "Ссылки: {citation_format}"],
+                   "expected_output": "Отчет", "context": ["analysis"]},
+    },
+    "pipelines": {"analysis": ["analysis", "report"]},
+    "default_plan": ["analysis", "report"],
+}
+
+
+def config(**changes) -> PipelineConfig:
+    raw = copy.deepcopy(RAW)
+    # agents__analyst__goal -> raw["agents"]["analyst"]["goal"]
+    for path, value in changes.items():
+        *keys, last = path.split("__")
+        target = raw
+        for key in keys:
+            target = target[key]
+        target[last] = value
+    return PipelineConfig(raw, source="test")
+
+
+def test_repo_config_is_valid():
+    pipeline = load_pipeline_config()
+    assert pipeline.pipelines["analysis"][-1] == "report"
+    assert set(pipeline.default_plan) <= set(pipeline.tasks)
+
+
+def test_template_renders_inputs_and_constants():
+    template = TextTemplate("Вопрос: {question}. Формат: {citation_format}. {\"tasks\": []}", ("question",), "test")
+    assert template.render({"question": "риски"}) == f"Вопрос: риски. Формат: {CITATION_FORMAT}. {{\"tasks\": []}}"
+
+
+def test_template_rejects_unknown_field():
+    with pytest.raises(PipelineConfigError, match="org_id"):
+        TextTemplate("Отделение {org_id}", ("question",), "test")
+
+
+def test_task_render_requires_inputs():
+    pipeline = config()
+    assert pipeline.tasks["report"].render(question="риски")["description"].startswith("Отчет по вопросу риски\n")
+    with pytest.raises(PipelineConfigError, match="question"):
+        pipeline.tasks["analysis"].render()
+
+
+@pytest.mark.parametrize("changes, message", [
+    ({"tasks__analysis__agent": "nobody"}, "неизвестный агент"),
+    ({"tasks__report__context": ["missing"]}, "в context неизвестные задачи"),
+    ({"pipelines__analysis": ["report", "analysis"]}, "зависит от"),
+    ({"pipelines__analysis": ["analysis", "missing"]}, "неизвестная задача"),
+    ({"default_plan": ["analysis", "missing"]}, "default_plan"),
+    ({"agents__analyst__goal": ""}, "не заданы"),
+    ({"tasks__analysis__description": 42}, "ожидается строка"),
+])
+def test_invalid_config_is_rejected(changes, message):
+    with pytest.raises(PipelineConfigError, match=message):
+        config(**changes)
+
+
+def test_missing_section_is_rejected():
+    raw = copy.deepcopy(RAW)
+    del raw["pipelines"]
+    with pytest.raises(PipelineConfigError, match="pipelines"):
+        PipelineConfig(raw)
+
+
+def test_agent_extends_base():
+    pipeline = config(agents__branch_analyst={"extends": "analyst", "tools": []})
+    assert pipeline.agents["branch_analyst"].role == AGENT["role"]
+    assert pipeline.agents["branch_analyst"].tools == ()
+
+
+def test_check_tools_reports_missing():
+    pipeline = config()
+    pipeline.check_tools({"search_reviews": object()})
+    with pytest.raises(PipelineConfigError, match="search_reviews"):
+        pipeline.check_tools({})
@@ -0,0 +1,53 @@
+import threading
+from contextvars import copy_context
+
+from profiling import finish_profile, stage, start_profile
+
+MB = 2 ** 20
+
+
+def test_stages_are_recorded_with_nesting():
+    token = start_profile(enabled=True)
+    with stage("outer"):
+        with stage("inner"):
+            data = bytearray(4 * MB)
+        del data
+    summary = finish_profile(token)
+    assert summary["outer"]["calls"] == summary["inner"]["calls"] == 1
+    assert summary["inner"]["peak_mb"] >= 4
+    # пик вложенного этапа входит в пик внешнего
+    assert summary["outer"]["peak_mb"] >= summary["inner"]["peak_mb"]
+
+
+def test_peak_survives_stage_started_in_another_thread():
+    # этап в другом потоке сбрасывает пик tracemalloc, но пик уже открытого этапа не теряется
+    token = start_profile(enabled=True)
+    allocated, other_started = threading.Event(), threading.Event()
+
+    def big_stage():
+        with stage("big"):
+            data = bytearray(8 * MB)
+            del data
+            allocated.set()
+            other_started.wait()
+
+    def other_stage():
+        allocated.wait()
+        with stage("small"):
+            other_started.set()
+
+    threads = [threading.Thread(target=copy_context().run, args=(fn,)) for fn in (big_stage, other_stage)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = finish_profile(token)
+    assert summary["big"]["peak_mb"] >= 8
+    assert summary["small"]["peak_mb"] < 8
+
+
+def test_disabled_profile_is_noop():
+    token = start_profile(enabled=False)
+    with stage("anything"):
+        pass
+    assert finish_profile(token) is None
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from review_trends import NEGATIVE_TONE, ReviewSeries, compute_trends, to_days
+
+START = date(2024, 1, 1)   # понедельник
+
+
+def reviews_for_week(org_id: int, week: int, rates, tones):
+    day = START + timedelta(weeks=week)
+    return [
+        {"orgId": org_id, "date": f"{day.month}/{day.day}/{day.year}", "rate": rate, "tone": tone}
+        for rate, tone in zip(rates, tones)
+    ]
+
+
+def steady_weeks(org_id: int, weeks: int):
+    # 10 отзывов в неделю: оценки 4–5, один негативный
+    reviews = []
+    for week in range(weeks):
+        reviews += reviews_for_week(org_id, week, [5, 4] * 5, [NEGATIVE_TONE] + ["Позитивный"] * 9)
+    return reviews
+
+
+def test_to_days_parses_data_and_iso_formats():
+    days = to_days(["1/9/2025", "12/31/2023", "2024-03-05T10:00:00", "", None, "завтра", "2/30/2024"])
+    assert days[:3].tolist() == [date(2025, 1, 9), date(2023, 12, 31), date(2024, 3, 5)]
+    assert np.isnat(days[3:]).all()
+    assert to_days([]).shape == (0,)
+
+
+def test_series_skips_reviews_without_branch_date_or_rate():
+    series = ReviewSeries([
+        {"orgId": 1, "date": "1/9/2025", "rate": 5},
+        {"orgId": None, "date": "1/9/2025", "rate": 5},
+        {"orgId": 2, "date": None, "rate": 5},
+        {"orgId": 3, "date": "1/9/2025", "rate": None},
+    ])
+    assert series.branch_ids.tolist() == [1]
+    assert series.rates.tolist() == [5.0]
+
+
+def test_weekly_buckets_start_on_monday():
+    series = ReviewSeries(reviews_for_week(1, 0, [5], ["Позитивный"]) + [
+        {"orgId": 1, "date": "1/14/2024", "rate": 4},   # воскресенье первой недели
+        {"orgId": 1, "date": "1/15/2024", "rate": 4},   # понедельник следующей
+    ])
+    index, labels = series.buckets("week")
+    assert labels == ["2024-01-01", "2024-01-08", "2024-01-15"]
+    assert index.tolist() == [0, 1, 2]
+
+
+def test_negative_spike_and_rating_drop_are_detected():
+    reviews = steady_weeks(1, 6) + steady_weeks(2, 7)
+    # на 7-й неделе в отделении 1 почти все отзывы негативные с низкой оценкой
+    reviews += reviews_for_week(1, 6, [1] * 9 + [5], [NEGATIVE_TONE] * 9 + ["Позитивный"])
+    trends = compute_trends(ReviewSeries(reviews), "week", window=3, z_threshold=3.0, min_reviews=3)
+
+    found = {(a["orgId"], a["period"], a["kind"]) for a in trends["anomalies"]}
+    assert found == {(1, "2024-02-12", "negative_spike"), (1, "2024-02-12", "rating_drop")}
+    spike = next(a for a in trends["anomalies"] if a["kind"] == "negative_spike")
+    assert spike["value"] == 0.9 and spike["baseline"] == 0.1 and spike["reviews"] == 10
+
+
+def test_small_periods_are_not_checked():
+    reviews = steady_weeks(1, 6) + reviews_for_week(1, 6, [1, 1], [NEGATIVE_TONE] * 2)
+    trends = compute_trends(ReviewSeries(reviews), "week", window=3, z_threshold=3.0, min_reviews=3)
+    assert trends["anomalies"] == []
+
+
+def test_rolling_average_over_window():
+    reviews = []
+    for week, rate in enumerate([5, 3, 1]):
+        reviews += reviews_for_week(1, week, [rate] * 4, ["Позитивный"] * 4)
+    trends = compute_trends(ReviewSeries(reviews), "week", window=2)
+    assert trends["mean_rate"][0].tolist() == [5.0, 3.0, 1.0]
+    assert trends["rolling_rate"][0].tolist() == [5.0, 4.0, 2.0]
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from session_store import SQLiteSessionStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # отчеты сессий пишутся в state/blobs относительно текущего каталога
+    monkeypatch.chdir(tmp_path)
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=3600, cache_size=2)
+    # плановое удаление просроченных сессий тесты вызывают сами (evict_expired(force=True))
+    store._last_eviction = time.time()
+    return store
+
+
+def updated_at(store, user_id):
+    row = store._db.execute("SELECT updated_at FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+    return row and row[0]
+
+
+def count_writes(store):
+    writes = []
+    store._db.set_trace_callback(lambda sql: writes.append(sql) if sql.startswith(("UPDATE", "INSERT", "DELETE")) else None)
+    return writes
+
+
+def test_session_roundtrip_through_database(store):
+    session = store.create(1)
+    session.current_query = "риски"
+    session.last_results = "отчет"
+    store.save(session)
+    store._cache.clear()
+
+    loaded = store.get(1)
+    assert loaded is not session
+    assert (loaded.current_query, loaded.last_results, loaded.context) == ("риски", "отчет", "")
+    assert store.get(2) is None
+
+
+def test_cached_reads_do_not_write(store):
+    store.create(1)
+    writes = count_writes(store)
+    for _ in range(10):
+        assert store.get(1) is not None
+    assert writes == []
+
+
+def test_read_time_is_saved_before_eviction(store):
+    store.create(1)
+    store.create(2)
+    old = time.time() - 7200
+    store._db.execute("UPDATE sessions SET updated_at = ?", (old,))
+    store._db.commit()
+
+    store.get(1)   # только чтение — сессия активна
+    store.evict_expired(force=True)
+    assert updated_at(store, 1) > old
+    assert store.get(1) is not None
+    assert updated_at(store, 2) is None and store.get(2) is None
+
+
+def test_read_time_is_flushed_with_next_save(store):
+    store.create(1)
+    store._db.execute("UPDATE sessions SET updated_at = 0")
+    store._db.commit()
+    store.get(1)
+    store.save(store.create(2))
+    assert updated_at(store, 1) > 0
+
+
+def test_lru_cache_is_bounded(store):
+    for user_id in range(5):
+        store.create(user_id)
+    assert list(store._cache) == [3, 4]
+    assert store.get(0).user_id == 0
+    assert list(store._cache) == [4, 0]
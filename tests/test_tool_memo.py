@@ -0,0 +1,84 @@
+import threading
+from contextvars import copy_context
+
+import pytest
+
+from tool_memo import current_tool_log, memoize_tools, reset_tool_log, start_tool_log, tool_round
+
+
+class FakeTool:
+    def __init__(self, name="access_comments", func=None):
+        self.name = name
+        self.func = func or (lambda **kwargs: f"DATA {kwargs}")
+
+    def run(self, **kwargs):
+        return self.func(**kwargs)
+
+    def model_copy(self, update):
+        return FakeTool(self.name, update["func"])
+
+
+@pytest.fixture
+def run_log():
+    token = start_tool_log()
+    yield current_tool_log()
+    reset_tool_log(token)
+
+
+def test_repeat_in_same_round_returns_reference(run_log):
+    tool = memoize_tools([FakeTool()], "analyst")[0]
+    with tool_round():
+        assert tool.run(org_id=1) == "DATA {'org_id': 1}"
+        assert "уже получен ранее (вызов T1)" in tool.run(org_id=1)
+        assert tool.run(org_id=2) == "DATA {'org_id': 2}"
+    report = run_log.report()
+    assert (report["calls"], report["repeats"]) == (3, 1)
+    assert report["saved_bytes"] == len("DATA {'org_id': 1}".encode("utf-8"))
+
+
+def test_new_round_resends_result(run_log):
+    tool = memoize_tools([FakeTool()], "analyst")[0]
+    with tool_round():
+        tool.run(org_id=1)
+    with tool_round():
+        assert tool.run(org_id=1) == "DATA {'org_id': 1}"
+
+
+def test_side_effect_tools_are_not_memoized(run_log):
+    tool = memoize_tools([FakeTool("save_insight")], "insights")[0]
+    with tool_round():
+        assert tool.run(insight="x") == tool.run(insight="x") == "DATA {'insight': 'x'}"
+
+
+def test_concurrent_crews_keep_their_own_rounds(run_log):
+    # crew B начинает работу между двумя одинаковыми вызовами crew A
+    tool_a = memoize_tools([FakeTool()], "analyst")[0]
+    tool_b = memoize_tools([FakeTool()], "analyst")[0]
+    a_called, b_started = threading.Event(), threading.Event()
+    results = {}
+
+    def crew_a():
+        with tool_round():
+            tool_a.run(org_id=1)
+            a_called.set()
+            b_started.wait()
+            results["a"] = tool_a.run(org_id=1)
+
+    def crew_b():
+        a_called.wait()
+        with tool_round():
+            b_started.set()
+            results["b"] = tool_b.run(org_id=1)
+
+    threads = [threading.Thread(target=copy_context().run, args=(fn,)) for fn in (crew_a, crew_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "уже получен ранее" in results["a"]
+    assert results["b"] == "DATA {'org_id': 1}"
+
+
+def test_without_run_log_tools_run_directly():
+    tool = memoize_tools([FakeTool()], "analyst")[0]
+    assert tool.run(org_id=1) == tool.run(org_id=1) == "DATA {'org_id': 1}"
@@ -0,0 +1,131 @@
+import itertools
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from profiling import stage
+
+# ----------------------------
+# Повторные вызовы инструментов в рамках одного запуска
+# ----------------------------
+# Инструменты с побочными эффектами всегда выполняются заново
+NOT_MEMOIZED = {"save_insight"}
+_RUN_LOG: ContextVar[Optional["ToolCallLog"]] = ContextVar("tool_call_log", default=None)
+# Раунд — один запуск crew. Хранится в контексте запуска, а не в журнале: crew одного
+# анализа могут работать одновременно (пофилиальный анализ, спекулятивная доработка)
+_ROUND: ContextVar[Optional[int]] = ContextVar("tool_call_round", default=None)
+_OWNER_IDS = itertools.count(1)
+
+
+def _payload_size(result: Any) -> int:
+    # агенту результат передается строкой — ее размер и попадает в контекст
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    return len(text.encode('utf-8'))
+
+
+class ToolCallLog:
+    """Вызовы инструментов одного запуска анализа.
+
+    Повторный вызов с теми же аргументами тем же агентом в том же запуске crew
+    возвращает короткую ссылку на уже полученный результат: агент видел его
+    в своем контексте, и повторная передача только расходует токены
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.calls: List[Dict] = []
+        self._seen: Dict[tuple, tuple] = {}   # ключ вызова -> (id, размер результата)
+        self._lock = threading.Lock()
+
+    def new_round(self) -> int:
+        """Номер для нового запуска crew в этом анализе"""
+        with self._lock:
+            self.rounds += 1
+            return self.rounds
+
+    def call(self, owner: str, tool: str, kwargs: Dict, run: Callable[[], Any]) -> Any:
+        args = json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str)
+        key = (_ROUND.get(), owner, tool, args)
+        with self._lock:
+            previous = self._seen.get(key)
+            if previous is not None:
+                previous_id, previous_bytes = previous
+                self.calls.append({"id": f"T{len(self.calls) + 1}", "tool": tool, "owner": owner, "bytes": 0,
+                                   "repeat_of": previous_id, "saved_bytes": previous_bytes})
+        if previous is not None:
+            shown_args = ", ".join(f"{k}={v!r}" for k, v in kwargs.items())
+            return (f"Результат {tool}({shown_args}) уже получен ранее (вызов {previous_id}) "
+                    f"и есть в вашем контексте; повторно не передается.")
+        result = run()
+        size = _payload_size(result)
+        with self._lock:
+            call_id = f"T{len(self.calls) + 1}"
+            self.calls.append({"id": call_id, "tool": tool, "owner": owner, "bytes": size})
+            self._seen[key] = (call_id, size)
+        return result
+
+    def report(self) -> Dict:
+        """Число вызовов, повторов и объем переданных/сэкономленных данных по инструментам"""
+        by_tool: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "repeats": 0, "bytes": 0, "saved_bytes": 0})
+        for call in self.calls:
+            stats = by_tool[call["tool"]]
+            stats["calls"] += 1
+            stats["bytes"] += call["bytes"]
+            if "repeat_of" in call:
+                stats["repeats"] += 1
+                stats["saved_bytes"] += call["saved_bytes"]
+        totals = {name: sum(stats[name] for stats in by_tool.values()) for name in ("calls", "repeats", "bytes", "saved_bytes")}
+        return {**totals, "by_tool": dict(by_tool)}
+
+
+def start_tool_log():
+    """Включает учет вызовов для текущего запуска; возвращает токен для сброса"""
+    return _RUN_LOG.set(ToolCallLog())
+
+
+def reset_tool_log(token):
+    _RUN_LOG.reset(token)
+
+
+def current_tool_log() -> Optional[ToolCallLog]:
+    return _RUN_LOG.get()
+
+
+@contextmanager
+def tool_round():
+    """Запуск crew (ревизия или продолжение после ошибки): агенты начинают задачи заново и
+    результатов прежних запусков не видят, поэтому ссылки на них недействительны.
+
+    Раунд действует в текущем контексте и в потоках, получивших его копию (kickoff_async)
+    """
+    log = _RUN_LOG.get()
+    token = _ROUND.set(log.new_round() if log is not None else None)
+    try:
+        yield
+    finally:
+        _ROUND.reset(token)
+
+
+def memoize_tools(tools: list, owner: str) -> list:
+    """Копии инструментов агента, которые учитывают вызовы и не повторяют одинаковые (кроме NOT_MEMOIZED).
+
+    owner — уникальный для экземпляра агента ключ: одинаковые роли в параллельных
+    crew (пофилиальный анализ) не делят между собой результаты
+    """
+    owner = f"{owner}#{next(_OWNER_IDS)}"
+    return [_memoized(tool, owner, memoize=tool.name not in NOT_MEMOIZED) for tool in tools]
+
+
+def _memoized(tool, owner: str, memoize: bool = True):
+    def run(**kwargs):
+        # каждый вызов инструмента — отдельный этап профиля запуска (profiling)
+        with stage(f"tool:{tool.name}"):
+            log = _RUN_LOG.get()
+            if log is None or not memoize:
+                return tool.run(**kwargs)
+            return log.call(owner, tool.name, kwargs, lambda: tool.run(**kwargs))
+    # копия без повторной инициализации: имя, описание и схема аргументов остаются прежними
+    return tool.model_copy(update={"func": run})